@@ -255,6 +255,12 @@ const App: React.FC = () => {
     setResultText(null);
     setExtraImages([]);
 
+    // 流式分析收到第一段文字后关闭加载遮罩，边生成边展示
+    const showStreamingText = (text: string) => {
+      setLoading(false);
+      setResultText(text);
+    };
+
     try {
       setLoading(true);
 
@@ -276,7 +282,7 @@ const App: React.FC = () => {
         }
       } else if (activeTab === 'tongue') {
         if (!tImage) throw new Error("舌头照片在哪里呀？");
-        const result = await api.analyze(tImage, 'tongue');
+        const result = await api.analyze(tImage, 'tongue', showStreamingText);
         if (result.success && result.text) {
           setResultText(result.text);
         } else {
@@ -284,7 +290,7 @@ const App: React.FC = () => {
         }
       } else if (activeTab === 'face-analysis') {
         if (!fImage) throw new Error("先拍个美美的正脸吧！");
-        const result = await api.analyze(fImage, 'face-analysis');
+        const result = await api.analyze(fImage, 'face-analysis', showStreamingText);
         if (result.success && result.text) {
           setResultText(result.text);
         } else {
@@ -292,7 +298,7 @@ const App: React.FC = () => {
         }
       } else if (activeTab === 'face-reading') {
         if (!frImage) throw new Error("想看运势得先传照片哦！");
-        const result = await api.analyze(frImage, 'face-reading');
+        const result = await api.analyze(frImage, 'face-reading', showStreamingText);
         if (result.success && result.text) {
           setResultText(result.text);
         } else {
@@ -300,7 +306,14 @@ const App: React.FC = () => {
         }
       } else if (activeTab === 'hairstyle') {
         if (!hFace) throw new Error("传张正脸，我帮你选发型！");
-        const result = await api.generateHairstyleRecommendation(hFace, hGender, parseInt(hAge));
+        // 渐进展示：分析文本和每张图片完成后立即显示
+        const showHairstylePart = (partial: api.HairstyleResult) => {
+          setLoading(false);
+          setResultText(partial.analysis || null);
+          setResultImage(partial.recommended_image || null);
+          setExtraImages(partial.catalog_image ? [partial.catalog_image] : []);
+        };
+        const result = await api.generateHairstyleRecommendation(hFace, hGender, parseInt(hAge), showHairstylePart);
         if (result.success) {
           setResultText(result.analysis || null);
           setResultImage(result.recommended_image || null);
@@ -0,0 +1,283 @@
+"""
+图片载荷编解码模块
+
+后端（backend/services/codec.py 加载本文件）与 Vercel Serverless 函数共用，仅依赖标准库：
+- 单次扫描解析 data URL，不复制整段 base64 字符串
+- 按文件头识别图片的真实格式并读取尺寸，不依赖 Pillow
+- 每张图片只 base64 解码一次，得到携带字节、MIME 类型、尺寸和哈希的 ImagePayload
+- 解码前按 base64 长度估算、解码后按文件头尺寸检查大小上限，超限图片不会进入 Pillow
+- 按 Accept 头判断客户端是否要二进制图片响应，并编码 multipart/mixed 响应体
+"""
+import binascii
+import hashlib
+import secrets
+import struct
+from dataclasses import dataclass
+
+# data URL 头部（"data:image/png;base64,"）只在前 256 个字符内查找
+MAX_HEADER_LENGTH = 256
+# 分块解码字符串时每块的字符数（4 的倍数），峰值内存只多出一块
+DECODE_CHUNK_CHARS = 256 * 1024
+
+# 按文件头识别 base64 编码图片的 MIME 类型（用于 Gemini 返回的图片）
+_BASE64_SIGNATURES = (
+    ("iVBORw0KGgo", "image/png"),
+    ("/9j/", "image/jpeg"),
+    ("UklGR", "image/webp"),
+    ("R0lGOD", "image/gif"),
+)
+
+# HEIF 容器中 ftyp 的品牌 -> MIME 类型
+_HEIF_BRANDS = {
+    b"heic": "image/heic", b"heix": "image/heic", b"heim": "image/heic", b"heis": "image/heic",
+    b"hevc": "image/heic", b"mif1": "image/heif", b"msf1": "image/heif",
+    b"avif": "image/avif", b"avis": "image/avif",
+}
+
+# JPEG 中携带图像尺寸的 SOF 标记
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class ImageCodecError(ValueError):
+    """图片载荷无法解析"""
+
+
+class ImageTooLargeError(ImageCodecError):
+    """图片解码后的字节数或像素数超过上限"""
+
+
+@dataclass(frozen=True)
+class ImagePayload:
+    """
+    解码后的上传图片
+
+    data 为原始图片字节（字符串载荷分块解码时为 bytearray，避免再复制一次）；
+    width / height 取自文件头，无法读取时为 0
+    """
+    data: bytes | bytearray
+    mime_type: str
+    width: int
+    height: int
+    sha256: str
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+
+def parse_data_url(payload: str | bytes | memoryview) -> tuple[str | None, int]:
+    """
+    解析 data URL 头部，只读取前 MAX_HEADER_LENGTH 个字符
+
+    base64 字母表中没有逗号，头部内出现的第一个逗号即为前缀结束位置
+
+    Returns:
+        (声明的 MIME 类型, base64 数据起始下标)；没有前缀时为 (None, 0)
+    """
+    head = payload[:MAX_HEADER_LENGTH]
+    if isinstance(head, memoryview):
+        head = head.tobytes()
+    if isinstance(head, bytes):
+        head = head.decode("latin-1")
+    comma = head.find(",")
+    if comma < 0:
+        return None, 0
+    declared = head[5:comma].split(";", 1)[0] or None if head.startswith("data:") else None
+    return declared, comma + 1
+
+
+def _b64decode_str(payload: str, start: int) -> bytearray:
+    """
+    分块解码字符串中 start 之后的 base64 数据
+
+    每次只切出一块（而不是整段切片后再 encode 成 bytes），输出直接追加到同一个 bytearray 中。
+    含换行等空白的 base64 可能无法按 4 字符对齐分块，此时退回整段解码
+    """
+    out = bytearray()
+    try:
+        for pos in range(start, len(payload), DECODE_CHUNK_CHARS):
+            out += binascii.a2b_base64(payload[pos:pos + DECODE_CHUNK_CHARS])
+    except binascii.Error:
+        return bytearray(binascii.a2b_base64(payload[start:]))
+    return out
+
+
+def _jpeg_size(data) -> tuple[int, int]:
+    pos = 2
+    length = len(data)
+    while pos + 9 < length:
+        if data[pos] != 0xFF:
+            pos += 1
+            continue
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+            return width, height
+        segment_length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        pos += 2 + segment_length
+    return 0, 0
+
+
+def _webp_size(data) -> tuple[int, int]:
+    chunk = bytes(data[12:16])
+    if chunk == b"VP8 " and len(data) >= 30:
+        width, height = struct.unpack("<HH", data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(data) >= 25:
+        b0, b1, b2, b3 = data[21], data[22], data[23], data[24]
+        return 1 + (((b1 & 0x3F) << 8) | b0), 1 + (((b3 & 0x0F) << 10) | (b2 << 2) | ((b1 & 0xC0) >> 6))
+    if chunk == b"VP8X" and len(data) >= 30:
+        return 1 + int.from_bytes(data[24:27], "little"), 1 + int.from_bytes(data[27:30], "little")
+    return 0, 0
+
+
+def sniff_image(data: bytes | bytearray | memoryview) -> tuple[str, int, int]:
+    """
+    按文件头识别图片格式并读取尺寸
+
+    Returns:
+        (MIME 类型, 宽, 高)；HEIC / AVIF 等格式不解析尺寸，宽高为 0
+
+    Raises:
+        ImageCodecError: 不是可识别的图片格式
+    """
+    head = bytes(data[:32])
+    if head.startswith(b"\xff\xd8\xff"):
+        return ("image/jpeg", *_jpeg_size(data))
+    if head.startswith(b"\x89PNG\r\n\x1a\n") and len(head) >= 24:
+        return ("image/png", *struct.unpack(">II", head[16:24]))
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ("image/webp", *_webp_size(data))
+    if head[:6] in (b"GIF87a", b"GIF89a") and len(head) >= 10:
+        return ("image/gif", *struct.unpack("<HH", head[6:10]))
+    if head[:2] == b"BM" and len(head) >= 26:
+        width, height = struct.unpack("<ii", head[18:26])
+        return "image/bmp", width, abs(height)
+    if head[4:8] == b"ftyp" and head[8:12] in _HEIF_BRANDS:
+        return _HEIF_BRANDS[head[8:12]], 0, 0
+    raise ImageCodecError("无法识别的图片格式")
+
+
+def _check_size(decoded_bytes: int, max_bytes: int | None):
+    if max_bytes and decoded_bytes > max_bytes:
+        raise ImageTooLargeError(f"图片过大，解码后不能超过 {max_bytes // (1024 * 1024) or 1}MB")
+
+
+def decode_image(
+    payload: str | bytes | bytearray | memoryview,
+    max_bytes: int | None = None,
+    max_pixels: int | None = None
+) -> ImagePayload:
+    """
+    解码上传的图片载荷（每张图片调用一次）
+
+    Args:
+        payload: base64 字符串或 data URL（JSON 请求），或原始图片字节（multipart 请求）；
+            字节形式的 base64 文本同样支持，按 memoryview 切片，不产生副本
+        max_bytes: 解码后字节数上限，base64 载荷在解码前按长度估算
+        max_pixels: 像素数上限，按文件头中的尺寸检查
+
+    Raises:
+        ImageTooLargeError: 超过大小或像素上限
+        ImageCodecError: 数据不是有效的 base64，或解码后不是可识别的图片
+    """
+    if isinstance(payload, str):
+        _, start = parse_data_url(payload)
+        _check_size((len(payload) - start) * 3 // 4, max_bytes)
+        try:
+            data = _b64decode_str(payload, start)
+        except (binascii.Error, ValueError) as e:
+            raise ImageCodecError("图片数据不是有效的 base64 编码") from e
+    else:
+        view = memoryview(payload)
+        try:
+            sniff_image(view)
+            data = payload
+        except ImageCodecError:
+            # 不是原始图片字节时按 base64 文本处理
+            _, start = parse_data_url(view)
+            _check_size((len(view) - start) * 3 // 4, max_bytes)
+            try:
+                data = binascii.a2b_base64(view[start:])
+            except (binascii.Error, ValueError) as e:
+                raise ImageCodecError("图片数据不是有效的 base64 编码") from e
+    _check_size(len(data), max_bytes)
+    mime_type, width, height = sniff_image(data)
+    if max_pixels and width * height > max_pixels:
+        raise ImageTooLargeError(f"图片分辨率过高，像素数不能超过 {max_pixels // 1_000_000} 百万")
+    return ImagePayload(
+        data=data,
+        mime_type=mime_type,
+        width=width,
+        height=height,
+        sha256=hashlib.sha256(data).hexdigest(),
+    )
+
+
+def sniff_base64_mime(image_b64: str, default: str = "image/png") -> str:
+    """按文件头识别 base64 编码图片的 MIME 类型（不解码），无法识别时返回 default"""
+    for prefix, mime_type in _BASE64_SIGNATURES:
+        if image_b64.startswith(prefix):
+            return mime_type
+    return default
+
+
+def _media_ranges(accept: str):
+    """逐项解析 Accept 头，产出 (小写的媒体类型, q 值)"""
+    for item in accept.split(","):
+        media_type, *params = [p.strip() for p in item.split(";")]
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        yield media_type.lower(), q
+
+
+def prefers_binary(accept: str) -> bool:
+    """
+    客户端是否要求以二进制返回生成图片
+
+    Accept 中 image/*（或具体图片类型）、multipart/mixed 的最高 q 值高于 JSON 时为真；
+    */* 不偏向任何一方，未声明时保持默认的 JSON 响应
+    """
+    binary_q = json_q = 0.0
+    for media_type, q in _media_ranges(accept):
+        if media_type.startswith("image/") or media_type == "multipart/mixed":
+            binary_q = max(binary_q, q)
+        elif media_type in ("application/json", "application/*"):
+            json_q = max(json_q, q)
+    return binary_q > json_q
+
+
+def encode_multipart_mixed(parts: list[tuple[dict[str, str], bytes]]) -> tuple[str, bytes]:
+    """
+    编码 multipart/mixed 响应体
+
+    Args:
+        parts: (部分头, 部分内容) 列表，头部值须为 ASCII
+
+    Returns:
+        (Content-Type 头, 响应体)
+    """
+    boundary = secrets.token_hex(16)
+    delimiter = f"--{boundary}\r\n".encode("ascii")
+    chunks = []
+    for headers, body in parts:
+        chunks.append(delimiter)
+        chunks.append("".join(f"{name}: {value}\r\n" for name, value in headers.items()).encode("ascii"))
+        chunks.append(b"\r\n")
+        chunks.append(body)
+        chunks.append(b"\r\n")
+    chunks.append(f"--{boundary}--\r\n".encode("ascii"))
+    return f"multipart/mixed; boundary={boundary}", b"".join(chunks)
@@ -0,0 +1,182 @@
+"""
+图片处理流水线模块
+
+后端（backend/services/image_pipeline.py 加载本文件）与 Vercel Serverless 函数共用，
+保证两端的预处理和输出转码结果一致。只包含默认值和纯函数，配置读取由各端自行完成：
+- 上传图片：按 EXIF 方向摆正、限制最长边、去除元数据并重新编码为 JPEG
+- 生成图片：按请求参数或 Accept 头协商输出格式，按尺寸档位缩放并转码
+- 二进制图片响应的元数据头
+"""
+import hashlib
+import io
+from PIL import Image, ImageOps
+from _codec import ImageCodecError, sniff_image
+
+# HEIC/HEIF（iPhone 默认拍照格式）由 pillow-heif 解码，已列入两端的 requirements.txt；
+# 未安装时 _codec 仍能识别文件头，但这类图片会在规范化时被判定为无法识别
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+
+# 各功能默认的最长边（像素）
+DEFAULT_MAX_EDGE = {
+    "try_on": 1536,
+    "analyze": 1024,
+    "hairstyle": 1024,
+}
+DEFAULT_JPEG_QUALITY = 85
+
+# 单张上传图片解码后的字节数和像素数上限
+DEFAULT_MAX_DECODED_BYTES = 20 * 1024 * 1024
+DEFAULT_MAX_PIXELS = 40_000_000
+
+# 生成图片输出格式 -> (Pillow 格式名, MIME 类型)
+OUTPUT_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+FORMAT_ALIASES = {"jpg": "jpeg"}
+
+# 尺寸档位默认的最长边（像素，0 表示保持原尺寸）
+SIZE_PRESETS = {
+    "preview": 512,
+    "standard": 1080,
+    "full": 0,
+}
+DEFAULT_OUTPUT_QUALITY = 80
+
+# MIME 类型 -> 文件扩展名
+EXTENSIONS = {"image/jpeg": "jpg", "image/webp": "webp", "image/png": "png", "image/gif": "gif"}
+
+# 防止解压炸弹：超过该像素数的图片直接拒绝
+Image.MAX_IMAGE_PIXELS = 64_000_000
+
+
+def _flatten(img: Image.Image) -> Image.Image:
+    """转为 RGB，透明背景合成到白底，避免转 JPEG 后变黑"""
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    return img
+
+
+def normalize_image(raw: bytes | bytearray, max_edge: int, quality: int = DEFAULT_JPEG_QUALITY) -> tuple[bytes, int, int]:
+    """
+    规范化上传图片（CPU 密集，后端需在线程中执行）
+
+    Args:
+        raw: 原始图片字节（JPEG / PNG / WebP / HEIC 等）
+        max_edge: 输出图片最长边
+        quality: JPEG 质量
+
+    Returns:
+        (不含元数据的 JPEG 字节, 宽, 高)
+
+    Raises:
+        ImageCodecError: 图片无法解码
+    """
+    try:
+        img = Image.open(io.BytesIO(raw))
+        # 大 JPEG 在解码阶段直接降采样，减少内存和解码时间
+        img.draft("RGB", (max_edge, max_edge))
+        img = ImageOps.exif_transpose(img)
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ImageCodecError("无法识别的图片格式") from e
+
+    img = _flatten(img)
+    if max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    out = io.BytesIO()
+    # 不传 exif/icc_profile，输出中不包含任何元数据
+    img.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue(), img.width, img.height
+
+
+def normalize_format(value: str | None) -> str | None:
+    """将格式名（webp / jpeg / jpg / png，大小写不限）规范化，无法输出的格式返回 None"""
+    if not value:
+        return None
+    value = value.strip().lower()
+    value = FORMAT_ALIASES.get(value, value)
+    return value if value in OUTPUT_FORMATS else None
+
+
+def accepted_format(accept: str) -> str | None:
+    """
+    从 Accept 头中选出 q 值最高的可输出图片格式
+
+    只认明确列出的 image/webp、image/jpeg、image/png，*/* 与 image/* 不触发转码
+    """
+    best, best_q = None, 0.0
+    for item in accept.split(","):
+        media_type, *params = [p.strip() for p in item.split(";")]
+        if not media_type.lower().startswith("image/"):
+            continue
+        fmt = normalize_format(media_type[6:])
+        if fmt is None:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = fmt, q
+    return best
+
+
+def source_format(mime_type: str) -> str:
+    """未指定输出格式时沿用原图格式，原图不是可输出格式时使用 PNG"""
+    return next((name for name, (_, mime) in OUTPUT_FORMATS.items() if mime == mime_type), "png")
+
+
+def transcode_image(data: bytes, fmt: str, max_edge: int, quality: int) -> bytes:
+    """
+    转码生成图片（CPU 密集，后端在进程池中执行）
+
+    Args:
+        data: 原始图片字节
+        fmt: 输出格式 - "webp", "jpeg", "png"
+        max_edge: 输出最长边，0 表示保持原尺寸
+        quality: WebP / JPEG 质量
+    """
+    img = Image.open(io.BytesIO(data))
+    if max_edge and max(img.size) > max_edge:
+        img.draft("RGB", (max_edge, max_edge))
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    out = io.BytesIO()
+    if fmt == "jpeg":
+        # 渐进式 JPEG：弱网下先显示模糊全图再逐步清晰
+        _flatten(img).save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+    elif fmt == "webp":
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() or img.mode == "P" else "RGB")
+        img.save(out, format="WEBP", quality=quality, method=4)
+    else:
+        img.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def image_headers(mime_type: str, data: bytes, name: str) -> dict[str, str]:
+    """二进制图片的元数据头：尺寸、内容哈希和文件名"""
+    try:
+        _, width, height = sniff_image(data)
+    except ImageCodecError:
+        width = height = 0
+    return {
+        "Content-Disposition": f'inline; name="{name}"; filename="{name}.{EXTENSIONS.get(mime_type, "bin")}"',
+        "X-Image-Width": str(width),
+        "X-Image-Height": str(height),
+        "ETag": f'"{hashlib.sha256(data).hexdigest()}"',
+    }
@@ -0,0 +1,91 @@
+"""
+Vercel Serverless 图片预处理模块
+
+上传给 Gemini 前解码一次、按 EXIF 方向摆正、限制最长边、去除元数据并重新编码为 JPEG；
+生成图片按协商的格式和尺寸档位转码后返回（data URL，或 Accept: image/* 时的二进制）。
+默认值与处理实现见共享的 _image_pipeline，这里只负责从环境变量读取配置
+"""
+import os
+import base64
+from _codec import decode_image, sniff_base64_mime
+from _image_pipeline import (
+    DEFAULT_MAX_EDGE, DEFAULT_JPEG_QUALITY, DEFAULT_MAX_DECODED_BYTES, DEFAULT_MAX_PIXELS,
+    SIZE_PRESETS, DEFAULT_OUTPUT_QUALITY, OUTPUT_FORMATS,
+    normalize_format, accepted_format, source_format, transcode_image
+)
+from _image_pipeline import normalize_image as _normalize_image
+# 二进制图片响应头由 try-on / hairstyle 从本模块导入
+from _image_pipeline import image_headers  # noqa: F401
+
+
+def _env_int(key: str, default: int) -> int:
+    try:
+        return int(os.environ.get(key, default))
+    except ValueError:
+        return default
+
+
+def normalize_image(image: str | bytes, feature: str) -> tuple[bytes, str]:
+    """
+    解码并规范化 base64 / data URL 格式或原始字节的图片
+
+    最长边、JPEG 质量和单张图片上限可通过环境变量 IMAGE_MAX_EDGE_<功能>、IMAGE_JPEG_QUALITY、
+    IMAGE_MAX_DECODED_BYTES、IMAGE_MAX_PIXELS 覆盖
+
+    Args:
+        image: base64 或 data URL 格式的图片，或 multipart 上传的原始图片字节
+        feature: 功能名称 - "try_on", "analyze", "hairstyle"
+
+    Returns:
+        (JPEG 字节, MIME 类型)
+
+    Raises:
+        ImageTooLargeError: 图片超过大小或像素上限
+        ValueError: 图片无法解码
+    """
+    # 共享 codec 解码一次并按文件头校验格式（ImageCodecError 为 ValueError 子类）
+    raw = decode_image(
+        image,
+        max_bytes=_env_int("IMAGE_MAX_DECODED_BYTES", DEFAULT_MAX_DECODED_BYTES),
+        max_pixels=_env_int("IMAGE_MAX_PIXELS", DEFAULT_MAX_PIXELS)
+    ).data
+    max_edge = _env_int(f"IMAGE_MAX_EDGE_{feature.upper()}", DEFAULT_MAX_EDGE.get(feature, 1024))
+    quality = _env_int("IMAGE_JPEG_QUALITY", DEFAULT_JPEG_QUALITY)
+    data, _, _ = _normalize_image(raw, max_edge, quality)
+    return data, "image/jpeg"
+
+
+def render_output(image_b64: str, accept: str = "", format: str | None = None, size: str | None = None) -> str:
+    """
+    按请求参数、Accept 头或环境变量 IMAGE_OUTPUT_FORMAT / IMAGE_OUTPUT_SIZE 转码生成图片
+
+    Returns:
+        data:<mime>;base64,... 格式的图片；未指定格式和尺寸时原样返回
+    """
+    mime_type, data = _transcode(image_b64, accept, format, size)
+    if data is None:
+        return f"data:{mime_type};base64,{image_b64}"
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def render_binary(image_b64: str, accept: str = "", format: str | None = None, size: str | None = None) -> tuple[str, bytes]:
+    """与 render_output 相同的转码规则，返回 (MIME 类型, 图片字节)，用于二进制响应"""
+    mime_type, data = _transcode(image_b64, accept, format, size)
+    return mime_type, base64.b64decode(image_b64) if data is None else data
+
+
+def _transcode(image_b64: str, accept: str, format: str | None, size: str | None) -> tuple[str, bytes | None]:
+    """转码生成图片，返回 (MIME 类型, 图片字节)；无需转码时字节为 None"""
+    source_mime = sniff_base64_mime(image_b64)
+    fmt = normalize_format(format) or accepted_format(accept) or normalize_format(os.environ.get("IMAGE_OUTPUT_FORMAT"))
+    if size not in SIZE_PRESETS:
+        size = os.environ.get("IMAGE_OUTPUT_SIZE", "full")
+        if size not in SIZE_PRESETS:
+            size = "full"
+    if fmt is None and size == "full":
+        return source_mime, None
+
+    fmt = fmt or source_format(source_mime)
+    max_edge = _env_int(f"IMAGE_OUTPUT_MAX_EDGE_{size.upper()}", SIZE_PRESETS[size])
+    quality = _env_int("IMAGE_OUTPUT_QUALITY", DEFAULT_OUTPUT_QUALITY)
+    return OUTPUT_FORMATS[fmt][1], transcode_image(base64.b64decode(image_b64), fmt, max_edge, quality)
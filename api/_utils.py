@@ -3,6 +3,7 @@ Vercel Serverless 共享工具模块
 """
 import os
 import json
+import time
 from supabase import create_client
 
 
@@ -91,6 +92,109 @@ def parse_body(handler) -> dict:
         return {}
 
 
+# 各路由前缀默认的请求体上限（字节，按最长前缀匹配），可在 system_config 中通过 request_body_limits 覆盖
+DEFAULT_BODY_LIMITS = {
+    "/api/ai/try-on": 32 * 1024 * 1024,
+    "/api/ai/": 16 * 1024 * 1024,
+}
+DEFAULT_MAX_BODY_BYTES = 1024 * 1024
+# 请求体上限在实例内缓存的时长（秒）：检查在认证之前对每个请求执行，不能每次都查询数据库
+BODY_LIMITS_TTL_SECONDS = 300
+
+# (过期时间, 各路由前缀上限, 默认上限)
+_body_limits: tuple[float, dict, int] | None = None
+
+
+def _body_limit_config(key: str) -> str:
+    """环境变量优先，未设置时才查询 system_config"""
+    return os.environ.get(key.upper(), "") or get_config(key, "")
+
+
+def _load_body_limits() -> tuple[dict, int]:
+    global _body_limits
+    now = time.monotonic()
+    if _body_limits is not None and _body_limits[0] > now:
+        return _body_limits[1], _body_limits[2]
+    limits = dict(DEFAULT_BODY_LIMITS)
+    try:
+        limits.update({p: int(v) for p, v in json.loads(_body_limit_config("request_body_limits") or "{}").items()})
+    except (TypeError, ValueError, AttributeError):
+        pass
+    try:
+        max_bytes = int(_body_limit_config("request_body_max_bytes") or DEFAULT_MAX_BODY_BYTES)
+    except ValueError:
+        max_bytes = DEFAULT_MAX_BODY_BYTES
+    _body_limits = (now + BODY_LIMITS_TTL_SECONDS, limits, max_bytes)
+    return limits, max_bytes
+
+
+def get_body_limit(path: str) -> int:
+    """按最长前缀匹配确定路由的请求体上限"""
+    limits, max_bytes = _load_body_limits()
+    prefix = max((p for p in limits if path.startswith(p)), key=len, default=None)
+    return limits[prefix] if prefix is not None else max_bytes
+
+
+def reject_oversized_body(handler) -> bool:
+    """
+    Content-Length 超过路由上限时直接返回 413，不读取请求体（在认证和解析之前调用）
+
+    Returns:
+        是否已拒绝
+    """
+    from urllib.parse import urlparse
+    limit = get_body_limit(urlparse(handler.path).path)
+    try:
+        content_length = int(handler.headers.get("Content-Length", 0))
+    except ValueError:
+        content_length = 0
+    if content_length <= limit:
+        handler.body_limit = limit
+        return False
+    body = json.dumps(
+        {"success": False, "message": f"请求体过大，不能超过 {limit // (1024 * 1024) or 1}MB"},
+        ensure_ascii=False
+    ).encode("utf-8")
+    handler.close_connection = True
+    handler.send_response(413)
+    handler.send_header("Content-Type", "application/json")
+    handler.send_header("Content-Length", str(len(body)))
+    handler.send_header("Access-Control-Allow-Origin", "*")
+    handler.send_header("Connection", "close")
+    handler.end_headers()
+    handler.wfile.write(body)
+    return True
+
+
+def parse_request_data(handler) -> dict:
+    """
+    解析 AI 接口请求体：支持 JSON（图片为 base64 字符串）和 multipart/form-data（图片为文件）
+
+    multipart 中的文件部分返回原始字节，其余字段返回字符串；同名字段只取第一个。
+    最多读取 reject_oversized_body 确定的上限字节数
+    """
+    content_length = int(handler.headers.get("Content-Length", 0))
+    content_length = min(content_length, getattr(handler, "body_limit", content_length))
+    body = handler.rfile.read(content_length) if content_length else b""
+    content_type = handler.headers.get("Content-Type", "")
+    if not content_type.startswith("multipart/form-data"):
+        return json.loads(body) if body else {}
+
+    from email import policy
+    from email.parser import BytesParser
+    message = BytesParser(policy=policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+    )
+    data = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if not name or name in data:
+            continue
+        payload = part.get_payload(decode=True) or b""
+        data[name] = payload if part.get_filename() is not None else payload.decode("utf-8")
+    return data
+
+
 def get_auth_token(handler) -> str | None:
     """从处理类中获取认证令牌"""
     auth = handler.headers.get("Authorization", "")
@@ -109,6 +213,22 @@ def send_json(handler, data: dict, status: int = 200):
     handler.wfile.write(json.dumps(data, ensure_ascii=False).encode("utf-8"))
 
 
+def send_binary(handler, content: bytes, content_type: str, headers: dict | None = None):
+    """发送二进制响应（Accept: image/* 时的生成图片或 multipart/mixed），不允许缓存"""
+    handler.send_response(200)
+    for key, value in cors_headers().items():
+        handler.send_header(key, value)
+    handler.send_header("Access-Control-Expose-Headers", "X-Image-Width, X-Image-Height, X-Failed-Parts, ETag")
+    handler.send_header("Content-Type", content_type)
+    handler.send_header("Content-Length", str(len(content)))
+    handler.send_header("Cache-Control", "no-store")
+    handler.send_header("Vary", "Accept")
+    for key, value in (headers or {}).items():
+        handler.send_header(key, value)
+    handler.end_headers()
+    handler.wfile.write(content)
+
+
 def get_config(key: str, default: str = "") -> str:
     """
     获取动态配置项
@@ -138,3 +258,136 @@ def get_config(key: str, default: str = "") -> str:
         return env_value
     
     return default
+
+
+# Gemini 客户端缓存（按 API Key），同一实例的后续调用复用，避免每次请求重建
+_gemini_clients: dict = {}
+
+
+def get_gemini_client(api_key: str):
+    """
+    获取指定 API Key 对应的 Gemini 客户端
+    
+    Serverless 实例热启动时复用已创建的客户端；API Key 变更后自动创建新客户端
+    """
+    client = _gemini_clients.get(api_key)
+    if client is None:
+        from google import genai
+        # 只保留当前 Key 的客户端，旧 Key 的客户端随之释放
+        _gemini_clients.clear()
+        client = genai.Client(api_key=api_key)
+        _gemini_clients[api_key] = client
+    return client
+
+
+# 各功能默认的候选模型链（与后端 services/model_router.py 保持一致），
+# 可在 system_config 的 gemini_model_routes 中按功能覆盖
+DEFAULT_MODEL_ROUTES = {
+    "try-on": ["gemini-2.5-flash-image"],
+    "accessory": ["gemini-2.5-flash-image"],
+    "tongue": ["gemini-2.0-flash"],
+    "face-analysis": ["gemini-2.0-flash"],
+    "face-reading": ["gemini-2.0-flash"],
+    "hairstyle-analysis": ["gemini-2.0-flash"],
+    "hairstyle-image": ["gemini-2.5-flash-image"],
+}
+
+
+def get_model_chain(feature: str) -> list:
+    """获取功能的候选模型链（gemini_model_routes 为 JSON 对象，未配置的功能使用默认值）"""
+    raw = get_config("gemini_model_routes")
+    if raw:
+        try:
+            chain = json.loads(raw).get(feature)
+            if isinstance(chain, str):
+                chain = [chain]
+            models = [str(name) for name in chain or [] if name]
+            if models:
+                return models
+        except (AttributeError, TypeError, ValueError):
+            pass
+    return list(DEFAULT_MODEL_ROUTES.get(feature, ["gemini-2.0-flash"]))
+
+
+def generate_with_fallback(client, feature: str, contents, config=None, models: list | None = None):
+    """
+    按功能的候选模型链调用 Gemini
+    
+    当前模型出现服务端错误、限流、超时或不存在时依次切换到下一个候选；
+    请求本身有误（400）或鉴权失败时直接抛出
+    """
+    chain = models or get_model_chain(feature)
+    last_error = None
+    for model in chain:
+        try:
+            return client.models.generate_content(model=model, contents=contents, config=config)
+        except Exception as e:
+            if getattr(e, "code", None) in (400, 401, 403):
+                raise
+            last_error = e
+            print(f"[Route] {feature}: {model} failed ({e}), trying next candidate")
+    raise last_error
+
+
+def stream_with_fallback(client, feature: str, contents, config=None, models: list | None = None):
+    """
+    按功能的候选模型链流式调用 Gemini，逐段产出文本
+    
+    第一段文本产出之前失败时切换到下一个候选模型，之后的错误直接抛出
+    """
+    chain = models or get_model_chain(feature)
+    last_error = None
+    for model in chain:
+        try:
+            stream = iter(client.models.generate_content_stream(model=model, contents=contents, config=config))
+            # 预读到第一段文本，确认该模型可用
+            first = ""
+            for chunk in stream:
+                if chunk.text:
+                    first = chunk.text
+                    break
+        except Exception as e:
+            if getattr(e, "code", None) in (400, 401, 403):
+                raise
+            last_error = e
+            print(f"[Route] {feature}: {model} stream failed ({e}), trying next candidate")
+            continue
+        if first:
+            yield first
+        for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+        return
+    raise last_error
+
+
+def sse_event(event: str, data: dict) -> bytes:
+    """格式化一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def start_event_stream(handler):
+    """
+    发送 SSE 响应头，之后用 write_chunk 逐块发送事件、end_chunks 结束
+    
+    使用 HTTP/1.1 分块传输编码，handler 的 protocol_version 需为 HTTP/1.1
+    """
+    handler.send_response(200)
+    handler.send_header("Content-Type", "text/event-stream")
+    handler.send_header("Cache-Control", "no-cache")
+    handler.send_header("Transfer-Encoding", "chunked")
+    for key, value in cors_headers().items():
+        handler.send_header(key, value)
+    handler.end_headers()
+
+
+def write_chunk(handler, data: bytes):
+    """发送一个分块并立即刷新"""
+    handler.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+    handler.wfile.flush()
+
+
+def end_chunks(handler):
+    """发送结束分块"""
+    handler.wfile.write(b"0\r\n\r\n")
+    handler.wfile.flush()
@@ -5,13 +5,17 @@ POST /api/ai/analyze
 import os
 import json
 import sys
-import base64
 from http.server import BaseHTTPRequestHandler
 from supabase import create_client
 
 # 导入共享工具模块
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from _utils import get_config
+from _utils import (
+    get_config, get_gemini_client, generate_with_fallback, stream_with_fallback, parse_request_data,
+    reject_oversized_body, sse_event, start_event_stream, write_chunk, end_chunks
+)
+from _codec import ImageTooLargeError
+from _imaging import normalize_image
 
 
 def get_supabase():
@@ -45,15 +49,23 @@ def consume_credit(user_id: str, current_credits: int) -> bool:
 
 
 class handler(BaseHTTPRequestHandler):
+    # 流式响应使用 HTTP/1.1 分块传输编码
+    protocol_version = "HTTP/1.1"
+
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header("Access-Control-Allow-Origin", "*")
         self.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization, Accept")
+        self.send_header("Content-Length", "0")
         self.end_headers()
 
     def do_POST(self):
         try:
+            # 请求体大小检查先于认证和解析，超限时不读取请求体
+            if reject_oversized_body(self):
+                return
+
             # 验证用户
             auth_header = self.headers.get("Authorization", "")
             token = auth_header[7:] if auth_header.startswith("Bearer ") else ""
@@ -63,19 +75,25 @@ class handler(BaseHTTPRequestHandler):
                 self._send_json({"success": False, "message": "未授权"}, 401)
                 return
 
-            if not consume_credit(user["id"], user["credits"]):
-                self._send_json({"success": False, "message": "魔法值不足"}, 402)
-                return
-
             # 解析请求
-            content_length = int(self.headers.get("Content-Length", 0))
-            body = self.rfile.read(content_length).decode("utf-8")
-            data = json.loads(body) if body else {}
+            data = parse_request_data(self)
 
             image = data.get("image", "")
             analysis_type = data.get("analysis_type", "tongue")
 
-            image_data = image.split(",")[1] if "," in image else image
+            # 预处理图片（先于扣费，无法识别的图片不扣魔法值）
+            try:
+                image_bytes, image_mime = normalize_image(image, "analyze")
+            except ImageTooLargeError as e:
+                self._send_json({"success": False, "message": str(e)}, 413)
+                return
+            except ValueError as e:
+                self._send_json({"success": False, "message": f"图片无法识别: {str(e)}"}, 400)
+                return
+
+            if not consume_credit(user["id"], user["credits"]):
+                self._send_json({"success": False, "message": "魔法值不足"}, 402)
+                return
 
             # 配置 Gemini (优先从数据库读取 API 密钥) - 使用新版 google-genai SDK
             api_key = get_config("gemini_api_key")
@@ -86,7 +104,7 @@ class handler(BaseHTTPRequestHandler):
             from google import genai
             from google.genai import types
             
-            client = genai.Client(api_key=api_key)
+            client = get_gemini_client(api_key)
             
             # 构建提示词
             system_instruction = "你是一位拥有深厚底蕴的中医及传统文化学者。"
@@ -116,18 +134,24 @@ class handler(BaseHTTPRequestHandler):
                 4. 命运总括：给出富有智慧的总结和建议。
                 请用中文分段回复，需说明仅供参考。"""
 
-            image_bytes = base64.b64decode(image_data)
-            image_part = types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg")
+            image_part = types.Part.from_bytes(data=image_bytes, mime_type=image_mime)
             
             # 构建完整提示词
             full_prompt = f"{system_instruction}\n\n{prompt}"
             
-            response = client.models.generate_content(
-                model="gemini-2.0-flash",
+            config = types.GenerateContentConfig(temperature=0.7)
+            
+            # Accept: text/event-stream 时以 SSE 分块返回；第一段文本之前的错误仍返回普通 JSON 错误
+            if "text/event-stream" in self.headers.get("Accept", ""):
+                chunks = stream_with_fallback(client, analysis_type, contents=[image_part, full_prompt], config=config)
+                first = next(chunks, "")
+                self._stream_events(first or "AI 暂时无法给出分析结果", chunks)
+                return
+            
+            response = generate_with_fallback(
+                client, analysis_type,
                 contents=[image_part, full_prompt],
-                config=types.GenerateContentConfig(
-                    temperature=0.7
-                )
+                config=config
             )
 
             result_text = ""
@@ -153,9 +177,25 @@ class handler(BaseHTTPRequestHandler):
                 except: pass
             self._send_json({"success": False, "message": f"分析失败: {msg}"}, 500)
 
+    def _stream_events(self, first: str, chunks):
+        """以分块传输编码发送 chunk / done / error 事件"""
+        start_event_stream(self)
+        try:
+            write_chunk(self, sse_event("chunk", {"text": first}))
+            for text in chunks:
+                write_chunk(self, sse_event("chunk", {"text": text}))
+            write_chunk(self, sse_event("done", {"success": True, "message": "分析完成"}))
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        except Exception as e:
+            write_chunk(self, sse_event("error", {"success": False, "message": f"分析失败: {str(e)}"}))
+        end_chunks(self)
+
     def _send_json(self, data: dict, status: int = 200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
         self.send_response(status)
         self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
         self.send_header("Access-Control-Allow-Origin", "*")
         self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+        self.wfile.write(body)
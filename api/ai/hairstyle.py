@@ -6,12 +6,19 @@ import os
 import json
 import sys
 import base64
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from http.server import BaseHTTPRequestHandler
 from supabase import create_client
 
 # 导入共享工具模块
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from _utils import get_config
+from _utils import (
+    get_config, get_gemini_client, get_model_chain, generate_with_fallback, parse_request_data,
+    reject_oversized_body, send_binary, sse_event, start_event_stream, write_chunk, end_chunks
+)
+from _codec import ImageTooLargeError, prefers_binary, encode_multipart_mixed
+from _imaging import normalize_image, render_output, render_binary, image_headers
 
 
 def get_supabase():
@@ -60,16 +67,33 @@ def extract_image(response) -> str:
     return ""
 
 
+def extract_text(response) -> str:
+    """从 Gemini 新版 SDK 响应中提取文本"""
+    if response.candidates and response.candidates[0].content:
+        for part in response.candidates[0].content.parts or []:
+            if hasattr(part, "text") and part.text:
+                return part.text
+    return ""
+
+
 class handler(BaseHTTPRequestHandler):
+    # 渐进式响应使用 HTTP/1.1 分块传输编码
+    protocol_version = "HTTP/1.1"
+
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header("Access-Control-Allow-Origin", "*")
         self.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization, Accept")
+        self.send_header("Content-Length", "0")
         self.end_headers()
 
     def do_POST(self):
         try:
+            # 请求体大小检查先于认证和解析，超限时不读取请求体
+            if reject_oversized_body(self):
+                return
+
             # 验证用户
             auth_header = self.headers.get("Authorization", "")
             token = auth_header[7:] if auth_header.startswith("Bearer ") else ""
@@ -79,20 +103,26 @@ class handler(BaseHTTPRequestHandler):
                 self._send_json({"success": False, "message": "未授权"}, 401)
                 return
 
-            if not consume_credit(user["id"], user["credits"]):
-                self._send_json({"success": False, "message": "魔法值不足"}, 402)
-                return
-
             # 解析请求
-            content_length = int(self.headers.get("Content-Length", 0))
-            body = self.rfile.read(content_length).decode("utf-8")
-            data = json.loads(body) if body else {}
+            data = parse_request_data(self)
 
             image = data.get("image", "")
             gender = data.get("gender", "女")
             age = data.get("age", 25)
 
-            image_data = image.split(",")[1] if "," in image else image
+            # 预处理图片（先于扣费，无法识别的图片不扣魔法值）
+            try:
+                image_bytes, image_mime = normalize_image(image, "hairstyle")
+            except ImageTooLargeError as e:
+                self._send_json({"success": False, "message": str(e)}, 413)
+                return
+            except ValueError as e:
+                self._send_json({"success": False, "message": f"图片无法识别: {str(e)}"}, 400)
+                return
+
+            if not consume_credit(user["id"], user["credits"]):
+                self._send_json({"success": False, "message": "魔法值不足"}, 402)
+                return
 
             # 配置 Gemini (优先从数据库读取 API 密钥) - 使用新版 google-genai SDK
             api_key = get_config("gemini_api_key")
@@ -103,7 +133,7 @@ class handler(BaseHTTPRequestHandler):
             from google import genai
             from google.genai import types
             
-            client = genai.Client(api_key=api_key)
+            client = get_gemini_client(api_key)
             print("[Hairstyle] Model Init")
             
             is_male = gender == "男"
@@ -120,53 +150,82 @@ class handler(BaseHTTPRequestHandler):
             2. 10种推荐发型列表
             3. 最优发型推荐及理由"""
 
-            image_bytes = base64.b64decode(image_data)
-            image_part = types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg")
+            image_part = types.Part.from_bytes(data=image_bytes, mime_type=image_mime)
             
-            analysis_response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=[image_part, analysis_prompt]
-            )
-            analysis_text = ""
-            if analysis_response.candidates and analysis_response.candidates[0].content:
-                for part in analysis_response.candidates[0].content.parts:
-                    if hasattr(part, "text") and part.text:
-                        analysis_text = part.text
-                        break
-            analysis_text = analysis_text or "未能生成分析"
-
             # 生成推荐发型图片 (使用官方推荐的图像生成模型)
             rec_prompt = f"""生成一张高度写实的正面照片。
             必须使用原图中的人物面部，为这位{age}岁的人物换上一款完美的{gender_term}发型。
             背景简洁专业。"""
             
-            # 关键配置：使用字典形式传递配置以提高兼容性
-            rec_response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=[image_part, rec_prompt],
-                config={
-                    "response_modalities": ["IMAGE"]
-                }
-            )
-            
-            rec_image = extract_image(rec_response)
-            
             # 生成发型目录
             cat_prompt = f"""生成一张{age}岁{gender_term}的发型参考画报。
             展示10种风格迥异的发型，整齐网格排版。"""
             
-            cat_response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=[image_part, cat_prompt],
-                config={
-                    "response_modalities": ["IMAGE"]
-                }
-            )
+            # 候选模型链在并发前读取一次，避免每个线程重复查询配置
+            analysis_models = get_model_chain("hairstyle-analysis")
+            image_models = get_model_chain("hairstyle-image")
+            
+            def run_analysis():
+                return generate_with_fallback(
+                    client, "hairstyle-analysis",
+                    contents=[image_part, analysis_prompt],
+                    models=analysis_models
+                )
+            
+            # 关键配置：使用字典形式传递配置以提高兼容性
+            def run_image(prompt):
+                return generate_with_fallback(
+                    client, "hairstyle-image",
+                    contents=[image_part, prompt],
+                    config={
+                        "response_modalities": ["IMAGE"]
+                    },
+                    models=image_models
+                )
+            
+            # Accept: text/event-stream 时按完成顺序渐进返回各部分
+            if "text/event-stream" in self.headers.get("Accept", ""):
+                self._stream_parts({
+                    "analysis": run_analysis,
+                    "recommended_image": lambda: run_image(rec_prompt),
+                    "catalog_image": lambda: run_image(cat_prompt),
+                })
+                return
+            
+            # 三个调用互不依赖，并发执行
+            with ThreadPoolExecutor(max_workers=3) as pool:
+                analysis_future = pool.submit(run_analysis)
+                rec_future = pool.submit(run_image, rec_prompt)
+                cat_future = pool.submit(run_image, cat_prompt)
+            
+            failed_parts = []
+            errors = []
+            
+            analysis_text = ""
+            try:
+                analysis_text = extract_text(analysis_future.result())
+            except Exception as e:
+                errors.append(f"analysis: {str(e)}")
+            if not analysis_text:
+                failed_parts.append("analysis")
             
-            cat_image = extract_image(cat_response)
+            images = {}
+            rec_response = None
+            for name, future in (("recommended_image", rec_future), ("catalog_image", cat_future)):
+                img = ""
+                try:
+                    response = future.result()
+                    if name == "recommended_image":
+                        rec_response = response
+                    img = extract_image(response)
+                except Exception as e:
+                    errors.append(f"{name}: {str(e)}")
+                if not img:
+                    failed_parts.append(name)
+                images[name] = img
 
-            v_tag = "[20260130-V3]" # 2.0-flash 稳定版
-            if not rec_image or not cat_image:
+            v_tag = "[20260130-V3]"
+            if len(failed_parts) == 3:
                 f_reason = "Unknown"
                 try: f_reason = str(rec_response.candidates[0].finish_reason)
                 except: pass
@@ -180,16 +239,39 @@ class handler(BaseHTTPRequestHandler):
                 self._send_json({
                     "success": False, 
                     "message": f"{v_tag} AI 未能生成发型图像 | 原因: {f_reason} | 风险: {safety_msg}",
-                    "debug": "Extraction Failed"
+                    "debug": " / ".join(errors) or "Extraction Failed"
                 }, 500)
                 return
 
+            rec_image = images["recommended_image"]
+            cat_image = images["catalog_image"]
+            # Accept 优先 image/* 或 multipart/mixed 时以 multipart/mixed 返回：metadata（JSON）+ 各张图片字节
+            if prefers_binary(self.headers.get("Accept", "")):
+                parts = [(
+                    {"Content-Type": "application/json; charset=utf-8", "Content-Disposition": 'inline; name="metadata"'},
+                    json.dumps({
+                        "success": True,
+                        "message": "部分内容生成失败，请稍后重试" if failed_parts else "推荐完成",
+                        "analysis": analysis_text or "未能生成分析",
+                        "failed_parts": failed_parts
+                    }, ensure_ascii=False).encode("utf-8")
+                )]
+                for name, img in (("recommended_image", rec_image), ("catalog_image", cat_image)):
+                    if img:
+                        mime_type, data = self._render_binary(img)
+                        parts.append(({"Content-Type": mime_type, **image_headers(mime_type, data, name)}, data))
+                content_type, body = encode_multipart_mixed(parts)
+                send_binary(self, body, content_type, {"X-Failed-Parts": ",".join(failed_parts)})
+                print("[Hairstyle] Success")
+                return
+
             self._send_json({
                 "success": True,
-                "message": "推荐完成",
-                "analysis": analysis_text,
-                "recommended_image": f"data:image/jpeg;base64,{rec_image}",
-                "catalog_image": f"data:image/jpeg;base64,{cat_image}"
+                "message": "部分内容生成失败，请稍后重试" if failed_parts else "推荐完成",
+                "analysis": analysis_text or "未能生成分析",
+                "recommended_image": self._render(rec_image) if rec_image else None,
+                "catalog_image": self._render(cat_image) if cat_image else None,
+                "failed_parts": failed_parts
             })
             print("[Hairstyle] Success")
 
@@ -202,9 +284,66 @@ class handler(BaseHTTPRequestHandler):
                 except: pass
             self._send_json({"success": False, "message": f"推荐失败: {msg}"}, 500)
 
+    def _output_args(self) -> tuple:
+        """转码参数：Accept 头与 format / size 查询参数"""
+        query = parse_qs(urlparse(self.path).query)
+        return self.headers.get("Accept", ""), query.get("format", [None])[0], query.get("size", [None])[0]
+
+    def _render(self, image_b64: str) -> str:
+        """按 format / size 查询参数或 Accept 头转码生成图片"""
+        return render_output(image_b64, *self._output_args())
+
+    def _render_binary(self, image_b64: str) -> tuple:
+        """同 _render，返回 (MIME 类型, 图片字节)"""
+        return render_binary(image_b64, *self._output_args())
+
+    def _stream_parts(self, calls: dict):
+        """
+        并发执行各部分并以 SSE 按完成顺序发送
+        
+        事件：analysis / recommended_image / catalog_image，失败的部分发送 part_failed，
+        最后发送 done（全部失败时为 error）
+        """
+        pool = ThreadPoolExecutor(max_workers=len(calls))
+        futures = {pool.submit(call): name for name, call in calls.items()}
+        start_event_stream(self)
+        failed_parts = []
+        try:
+            for future in as_completed(futures):
+                name = futures[future]
+                value = ""
+                try:
+                    response = future.result()
+                    value = extract_text(response) if name == "analysis" else extract_image(response)
+                except Exception as e:
+                    print(f"[Hairstyle] {name} failed: {str(e)}")
+                if not value:
+                    failed_parts.append(name)
+                    write_chunk(self, sse_event("part_failed", {"part": name}))
+                elif name == "analysis":
+                    write_chunk(self, sse_event(name, {"text": value}))
+                else:
+                    write_chunk(self, sse_event(name, {"image": self._render(value)}))
+            
+            if len(failed_parts) == len(calls):
+                write_chunk(self, sse_event("error", {"success": False, "message": "推荐失败: AI 未能生成发型分析和图像"}))
+            else:
+                write_chunk(self, sse_event("done", {
+                    "success": True,
+                    "message": "部分内容生成失败，请稍后重试" if failed_parts else "推荐完成",
+                    "failed_parts": failed_parts
+                }))
+            end_chunks(self)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
     def _send_json(self, data: dict, status: int = 200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
         self.send_response(status)
         self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
         self.send_header("Access-Control-Allow-Origin", "*")
         self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+        self.wfile.write(body)
@@ -5,7 +5,7 @@ from http.server import BaseHTTPRequestHandler
 
 # 导入共享工具模块
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from _utils import get_config
+from _utils import get_config, get_gemini_client
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
@@ -16,9 +16,7 @@ class handler(BaseHTTPRequestHandler):
                 self._send_json({"success": False, "message": "未配置 Gemini API 密钥，请在管理后台设置"}, 500)
                 return
 
-            from google import genai
-            
-            client = genai.Client(api_key=api_key)
+            client = get_gemini_client(api_key)
             
             models = []
             for m in client.models.list():
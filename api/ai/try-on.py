@@ -6,12 +6,18 @@ import os
 import json
 import sys
 import base64
+from urllib.parse import urlparse, parse_qs
 from http.server import BaseHTTPRequestHandler
 from supabase import create_client
 
 # 导入共享工具模块
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from _utils import get_config
+from _utils import (
+    get_config, get_gemini_client, get_model_chain, generate_with_fallback,
+    parse_request_data, reject_oversized_body, send_binary
+)
+from _codec import ImageTooLargeError, prefers_binary
+from _imaging import normalize_image, render_output, render_binary, image_headers
 
 
 def get_supabase():
@@ -51,11 +57,15 @@ class handler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.send_header("Access-Control-Allow-Origin", "*")
         self.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization, Accept")
         self.end_headers()
 
     def do_POST(self):
         try:
+            # 请求体大小检查先于认证和解析，超限时不读取请求体
+            if reject_oversized_body(self):
+                return
+
             # 验证用户
             auth_header = self.headers.get("Authorization", "")
             token = auth_header[7:] if auth_header.startswith("Bearer ") else ""
@@ -65,15 +75,8 @@ class handler(BaseHTTPRequestHandler):
                 self._send_json({"success": False, "message": "未授权"}, 401)
                 return
 
-            # 检查并扣减魔法值
-            if not consume_credit(user["id"], user["credits"]):
-                self._send_json({"success": False, "message": "魔法值不足"}, 402)
-                return
-
             # 解析请求
-            content_length = int(self.headers.get("Content-Length", 0))
-            body = self.rfile.read(content_length).decode("utf-8")
-            data = json.loads(body) if body else {}
+            data = parse_request_data(self)
 
             face_image = data.get("face_image", "")
             item_image = data.get("item_image", "")
@@ -81,9 +84,21 @@ class handler(BaseHTTPRequestHandler):
             height = data.get("height", 165)
             body_type = data.get("body_type", "标准")
 
-            # 提取 base64 数据
-            face_data = face_image.split(",")[1] if "," in face_image else face_image
-            item_data = item_image.split(",")[1] if "," in item_image else item_image
+            # 预处理图片（先于扣费，无法识别的图片不扣魔法值）
+            try:
+                face_bytes, face_mime = normalize_image(face_image, "try_on")
+                item_bytes, item_mime = normalize_image(item_image, "try_on")
+            except ImageTooLargeError as e:
+                self._send_json({"success": False, "message": str(e)}, 413)
+                return
+            except ValueError as e:
+                self._send_json({"success": False, "message": f"图片无法识别: {str(e)}"}, 400)
+                return
+
+            # 检查并扣减魔法值
+            if not consume_credit(user["id"], user["credits"]):
+                self._send_json({"success": False, "message": "魔法值不足"}, 402)
+                return
 
             # 配置 Gemini (优先从数据库读取 API 密钥) - 使用新版 google-genai SDK
             api_key = get_config("gemini_api_key")
@@ -94,7 +109,7 @@ class handler(BaseHTTPRequestHandler):
             from google import genai
             from google.genai import types
             
-            client = genai.Client(api_key=api_key)
+            client = get_gemini_client(api_key)
             
             # 构建提示词
             if try_on_type == "clothing":
@@ -110,26 +125,23 @@ class handler(BaseHTTPRequestHandler):
                 耳饰的细节（材质、反光、吊坠）应清晰可见。保持五官特征和肤色真实。
                 输出必须是戴上耳饰后的效果图。"""
 
-            # 调用 Gemini (使用官方推荐的图像生成模型)
-            print(f"[Try-On] Model: gemini-2.0-flash")
+            # 调用 Gemini（候选模型链可在管理后台配置）
+            feature = "try-on" if try_on_type == "clothing" else "accessory"
+            models = get_model_chain(feature)
+            print(f"[Try-On] Models: {', '.join(models)}")
             
             # 构建图片内容
-            face_part = types.Part.from_bytes(
-                data=base64.b64decode(face_data),
-                mime_type="image/jpeg"
-            )
-            item_part = types.Part.from_bytes(
-                data=base64.b64decode(item_data),
-                mime_type="image/jpeg"
-            )
+            face_part = types.Part.from_bytes(data=face_bytes, mime_type=face_mime)
+            item_part = types.Part.from_bytes(data=item_bytes, mime_type=item_mime)
             
             # 关键配置：使用字典形式传递配置以提高兼容性
-            response = client.models.generate_content(
-                model="gemini-2.0-flash",
+            response = generate_with_fallback(
+                client, feature,
                 contents=[face_part, item_part, prompt],
                 config={
                     "response_modalities": ["IMAGE"]
-                }
+                },
+                models=models
             )
 
             # 提取图片
@@ -150,7 +162,7 @@ class handler(BaseHTTPRequestHandler):
                             img_data = part.inline_data.data
                             if isinstance(img_data, bytes):
                                 img_data = base64.b64encode(img_data).decode('utf-8')
-                            result_image = f"data:image/jpeg;base64,{img_data}"
+                            result_image = img_data
                             debug_log.append(f"I{i}")
                             break
                 else:
@@ -188,10 +200,16 @@ class handler(BaseHTTPRequestHandler):
                 self._send_json({"success": False, "message": f"[{v_time}] 解析崩溃: {str(pe)}"}, 500)
                 return
 
+            # Accept 优先 image/* 时直接返回图片字节，元数据放在响应头中
+            if prefers_binary(self.headers.get("Accept", "")):
+                mime_type, data = self._render_binary(result_image)
+                send_binary(self, data, mime_type, image_headers(mime_type, data, "try-on"))
+                return
+
             self._send_json({
                 "success": True,
                 "message": "生成成功",
-                "image": result_image
+                "image": self._render(result_image)
             })
 
         except Exception as e:
@@ -203,6 +221,19 @@ class handler(BaseHTTPRequestHandler):
                 except: pass
             self._send_json({"success": False, "message": f"生成失败: {msg}"}, 500)
 
+    def _output_args(self) -> tuple:
+        """转码参数：Accept 头与 format / size 查询参数"""
+        query = parse_qs(urlparse(self.path).query)
+        return self.headers.get("Accept", ""), query.get("format", [None])[0], query.get("size", [None])[0]
+
+    def _render(self, image_b64: str) -> str:
+        """按 format / size 查询参数或 Accept 头转码生成图片"""
+        return render_output(image_b64, *self._output_args())
+
+    def _render_binary(self, image_b64: str) -> tuple:
+        """同 _render，返回 (MIME 类型, 图片字节)"""
+        return render_binary(image_b64, *self._output_args())
+
     def _send_json(self, data: dict, status: int = 200):
         self.send_response(status)
         self.send_header("Content-Type", "application/json")
@@ -3,6 +3,7 @@
 
 提供统计数据、用户管理和系统配置功能
 """
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException
 from typing import List
 from datetime import date, datetime, timedelta
@@ -125,6 +126,12 @@ async def get_system_config(_: dict = Depends(get_admin_user)) -> List[SystemCon
     # 定义所有需要在后台显示的关键配置项及其描述
     essential_keys = [
         ("gemini_api_key", "Google Gemini API 密钥 (AI 核心)", settings.gemini_api_key),
+        ("gemini_api_keys", "Gemini API 密钥池 (JSON 数组，如 [{\"key\": \"AIza...\", \"weight\": 2, \"name\": \"项目A\"}])", settings.gemini_api_keys),
+        ("gemini_model_routes", "各功能候选模型链 (JSON 对象，如 {\"try-on\": [\"gemini-2.5-flash-image\"], \"tongue\": [\"gemini-2.0-flash\"]})", settings.gemini_model_routes),
+        ("request_body_limits", "各路由请求体字节上限 (JSON 对象，按路径前缀匹配，如 {\"/api/ai/try-on\": 33554432})", settings.request_body_limits),
+        ("image_max_decoded_bytes", "单张上传图片解码后的字节上限", str(settings.image_max_decoded_bytes)),
+        ("image_max_pixels", "单张上传图片的像素数上限", str(settings.image_max_pixels)),
+        ("metrics_token", "/metrics 指标端点访问令牌 (为空时关闭该端点)", settings.metrics_token),
         ("alipay_app_id", "支付宝 AppID", settings.alipay_app_id),
         ("alipay_app_private_key", "支付宝应用私钥", settings.alipay_app_private_key),
         ("alipay_public_key", "支付宝公钥", settings.alipay_public_key),
@@ -160,6 +167,7 @@ async def update_system_config(
     更新系统配置
     """
     from services.config_service import clear_config_cache
+    from services.gemini_service import reset_gemini_clients
     
     supabase = get_supabase_client()
     for item in items:
@@ -173,9 +181,48 @@ async def update_system_config(
     
     # 清除配置缓存，确保下次读取时获取最新值
     clear_config_cache()
+    
+    # API Key 变更后重建 Gemini 客户端，旧 Key 的客户端不再保留
+    if any(item.key in ("gemini_api_key", "gemini_api_keys") for item in items):
+        reset_gemini_clients()
         
     return {"success": True, "message": "配置已更新"}
 
+@router.get("/cache/stats")
+async def get_cache_stats(_: dict = Depends(get_admin_user)):
+    """
+    获取 AI 结果缓存的命中、未命中和淘汰计数
+    """
+    from services.result_cache import get_cache_stats as collect_cache_stats
+    
+    return {"success": True, "caches": collect_cache_stats()}
+
+@router.get("/ai/stats")
+async def get_ai_stats(_: dict = Depends(get_admin_user)):
+    """
+    获取 AI 调用运行状态（请求合并、各模型并发与排队、熔断器、模型路由、配额节流、API Key 池、重试预算、异步任务队列）
+    """
+    from services.gemini_service import ai_single_flight
+    from services.admission import admission_controller
+    from services.rate_limiter import rate_limiter
+    from services.key_pool import key_pool
+    from services.retry_policy import retry_budget
+    from services.circuit_breaker import circuit_breakers
+    from services.model_router import model_router
+    from services.job_queue import get_job_queue
+    
+    return {
+        "success": True,
+        "single_flight": ai_single_flight.stats(),
+        "admission": admission_controller.stats(),
+        "circuit_breakers": circuit_breakers.stats(),
+        "model_routing": model_router.stats(),
+        "rate_limits": rate_limiter.stats(),
+        "api_keys": key_pool.stats(),
+        "retry_budget": retry_budget.stats(),
+        "jobs": await asyncio.to_thread(lambda: get_job_queue().stats())
+    }
+
 @router.post("/reset-password")
 async def reset_admin_password(
     request: dict, # {"new_password": "..."}
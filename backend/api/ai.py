@@ -3,101 +3,618 @@ AI 服务 API 端点
 
 代理所有 AI 调用，确保 API Key 不暴露在前端
 """
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, get_origin
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from starlette.datastructures import UploadFile
 from schemas.ai import (
-    TryOnRequest, AnalyzeRequest, HairstyleRequest,
-    ImageResponse, TextResponse, HairstyleResponse
+    TryOnRequest, BatchTryOnRequest, AnalyzeRequest, HairstyleRequest, ReportRequest, RequestMode, AnalysisType,
+    OutputFormat, OutputSize, OutputDelivery,
+    ImageResponse, BatchTryOnResponse, TextResponse, HairstyleResponse, ReportResponse,
+    JobResponse, JobStatusResponse
 )
 from middleware.auth import get_current_user
 from services.supabase_client import get_supabase_client
 from services import gemini_service
+from services.image_service import prepare_image, ImageDecodeError, ImageTooLarge
+from services.image_output import OutputSpec, negotiate_output, render_image, render_binary, sign_blob_refs
+from services.codec import prefers_binary, encode_multipart_mixed
+from services.image_pipeline import image_headers
+from services.admission import (
+    admission_controller, AdmissionRejected,
+    request_priority, request_deadline, PRIORITY_PAID, PRIORITY_NORMAL
+)
+from services.model_router import model_router
+from services.resilience_settings import get_resilience_settings
+from services.job_queue import get_job_queue, FINISHED_STATUSES, STATUS_SUCCEEDED
+from services.credit_service import refund_credits
+from services import ai_jobs
+from services.metrics import stage_duration_seconds
 
 router = APIRouter(prefix="/ai", tags=["AI 服务"])
 
+# 付费用户判定缓存：user_id -> (过期时间, 是否付费)
+_paid_user_cache: dict[str, tuple[float, bool]] = {}
+PAID_USER_CACHE_TTL = 300
+
+
+def _query_paid_user(user_id: str) -> bool:
+    """查询用户是否有已支付订单（同步阻塞调用）"""
+    try:
+        supabase = get_supabase_client()
+        res = supabase.table("orders")\
+            .select("id")\
+            .eq("user_id", user_id)\
+            .eq("status", "PAID")\
+            .limit(1)\
+            .execute()
+        return bool(res.data)
+    except Exception:
+        # 查询失败时按普通用户处理，不影响请求本身
+        return False
+
+
+async def is_paid_user(user_id: str) -> bool:
+    """用户是否有已支付订单（结果缓存 5 分钟，查询在线程中执行，不阻塞事件循环）"""
+    cached = _paid_user_cache.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    
+    paid = await asyncio.to_thread(_query_paid_user, user_id)
+    _paid_user_cache[user_id] = (time.monotonic() + PAID_USER_CACHE_TTL, paid)
+    return paid
+
+
+async def admit_request(current_user: dict, *features: str):
+    """
+    AI 请求准入
+    
+    设置本次请求的排队优先级（付费用户优先）和排队截止时间，
+    并在扣减魔法值之前检查各功能是否还有未熔断的候选模型、其队列是否已满
+    """
+    request_priority.set(PRIORITY_PAID if await is_paid_user(current_user["id"]) else PRIORITY_NORMAL)
+    request_deadline.set(time.monotonic() + get_resilience_settings().queue_timeout_seconds)
+    models = [model_router.ensure_available(feature) for feature in features]
+    admission_controller.ensure_capacity(*models)
+
+
+def service_busy(e: AdmissionRejected) -> HTTPException:
+    """将准入拒绝转换为 503 响应"""
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+async def read_form(http_request: Request) -> dict[str, list[Any]]:
+    """
+    读取 multipart/form-data 请求体
+    
+    文件部分由 python-multipart 流式写入临时文件（小文件留在内存），
+    这里按原始字节读出一次，不经过 base64
+    """
+    form = await http_request.form()
+    fields: dict[str, list[Any]] = {}
+    try:
+        for key, value in form.multi_items():
+            if isinstance(value, UploadFile):
+                value = await value.read()
+            fields.setdefault(key, []).append(value)
+    finally:
+        await form.close()
+    return fields
+
+
+def form_to_model_data(model: type[BaseModel], fields: dict[str, list[Any]]) -> dict[str, Any]:
+    """列表类型的字段取全部值，其余字段取第一个值"""
+    data = {}
+    for key, values in fields.items():
+        field = model.model_fields.get(key)
+        is_list = field is not None and get_origin(field.annotation) is list
+        data[key] = values if is_list else values[0]
+    return data
+
+
+def batch_try_on_form(fields: dict[str, list[Any]]) -> dict[str, Any]:
+    """批量试穿的表单：item_image 与 try_on_type 按出现顺序一一对应，数量不一致时返回 422"""
+    images, try_on_types = fields.get("item_image", []), fields.get("try_on_type", [])
+    if len(images) != len(try_on_types):
+        raise RequestValidationError([{
+            "type": "value_error",
+            "loc": ("body", "try_on_type"),
+            "msg": f"item_image 与 try_on_type 数量不一致（{len(images)} 与 {len(try_on_types)}）",
+            "input": None
+        }])
+    data = form_to_model_data(BatchTryOnRequest, fields)
+    data["items"] = [
+        {"item_image": image, "try_on_type": try_on_type}
+        for image, try_on_type in zip(images, try_on_types)
+    ]
+    return data
+
+
+def request_body(
+    model: type[BaseModel],
+    form_adapter: Callable[[dict[str, list[Any]]], dict[str, Any]] | None = None
+) -> Callable[[Request], Awaitable[BaseModel]]:
+    """
+    AI 请求体依赖：同时支持 JSON（图片为 base64 字符串）和 multipart/form-data（图片为文件）
+    
+    校验失败时与普通请求体一样返回 422
+    """
+    async def parse(http_request: Request) -> BaseModel:
+        content_type = http_request.headers.get("content-type", "")
+        if content_type.startswith("multipart/form-data"):
+            fields = await read_form(http_request)
+            data = form_adapter(fields) if form_adapter else form_to_model_data(model, fields)
+        else:
+            try:
+                data = await http_request.json()
+            except ValueError:
+                raise RequestValidationError([{
+                    "type": "json_invalid", "loc": ("body",), "msg": "JSON decode error", "input": {}
+                }])
+        try:
+            return model.model_validate(data)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors(include_url=False))
+    
+    return parse
+
+
+def _inline_refs(schema: Any, defs: dict[str, Any]) -> Any:
+    """展开 model_json_schema 中的 $defs 引用（OpenAPI 文档中无法解析 #/$defs/...）"""
+    if isinstance(schema, dict):
+        ref = schema.get("$ref", "")
+        if ref.startswith("#/$defs/"):
+            return _inline_refs(defs[ref[len("#/$defs/"):]], defs)
+        return {key: _inline_refs(value, defs) for key, value in schema.items() if key != "$defs"}
+    if isinstance(schema, list):
+        return [_inline_refs(item, defs) for item in schema]
+    return schema
+
+
+def _image_schema(description: str | None, binary: bool) -> dict[str, Any]:
+    schema = {"type": "string", "format": "binary"} if binary else {"type": "string", "contentEncoding": "base64"}
+    if description:
+        schema["description"] = description
+    return schema
+
+
+def _image_variant(schema: Any, binary: bool) -> Any:
+    """图片字段（str | bytes）在 JSON 中为 base64 字符串，在 multipart 中为文件"""
+    if isinstance(schema, dict):
+        if any(item.get("format") == "binary" for item in schema.get("anyOf", [])):
+            return _image_schema(schema.get("description"), binary)
+        return {key: _image_variant(value, binary) for key, value in schema.items()}
+    if isinstance(schema, list):
+        return [_image_variant(item, binary) for item in schema]
+    return schema
+
+
+def request_body_openapi(
+    model: type[BaseModel],
+    form_fields: Callable[[dict[str, Any]], None] | None = None
+) -> dict[str, Any]:
+    """
+    request_body 依赖对应的 OpenAPI 请求体声明（application/json 与 multipart/form-data 两种）
+
+    request_body 直接读取 Request，FastAPI 无法从中推断请求体模型，需通过路由的 openapi_extra 声明；
+    form_fields 用于调整 multipart 表单的字段（如批量试穿中展开为重复字段的 items）
+    """
+    raw = model.model_json_schema()
+    schema = _inline_refs(raw, raw.get("$defs", {}))
+    form_schema = _image_variant(schema, binary=True)
+    if form_fields:
+        form_fields(form_schema)
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": _image_variant(schema, binary=False)},
+                "multipart/form-data": {"schema": form_schema},
+            },
+        }
+    }
+
+
+def batch_try_on_form_fields(schema: dict[str, Any]):
+    """批量试穿表单：items 展开为按顺序一一对应的 item_image 与 try_on_type 重复字段"""
+    items = schema["properties"].pop("items")
+    item = items["items"]["properties"]
+    schema["properties"]["item_image"] = {
+        "type": "array", "items": _image_schema(None, binary=True), "description": item["item_image"]["description"]
+    }
+    schema["properties"]["try_on_type"] = {
+        "type": "array", "items": {k: v for k, v in item["try_on_type"].items() if k != "description"},
+        "description": "与 item_image 按出现顺序一一对应的试穿类型"
+    }
+    schema["required"] = [name for name in schema["required"] if name != "items"] + ["item_image", "try_on_type"]
+
+
+def output_spec(
+    http_request: Request,
+    format: OutputFormat | None = Query(None, description="生成图片的输出格式，未指定时按 Accept 头协商"),
+    size: OutputSize | None = Query(None, description="生成图片的尺寸档位"),
+    delivery: OutputDelivery | None = Query(None, description="inline（默认）内嵌为 data URL，url 返回短期有效的签名地址")
+) -> OutputSpec:
+    """生成图片的输出规格：请求参数优先，其次为 Accept 头中明确列出的图片格式"""
+    return negotiate_output(
+        http_request.headers.get("accept", ""),
+        format.value if format else None,
+        size.value if size else None,
+        delivery.value if delivery else None,
+        str(http_request.base_url)
+    )
+
+
+def wants_event_stream(http_request: Request) -> bool:
+    """客户端是否通过 Accept: text/event-stream 选择流式响应"""
+    return "text/event-stream" in http_request.headers.get("accept", "")
 
-async def consume_credit(user_id: str, current_credits: int) -> int:
+
+def sse_event(event: str, data: dict) -> str:
+    """格式化一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def event_stream(events: AsyncIterator[str]) -> StreamingResponse:
+    """构建 SSE 响应，禁用代理缓冲以便每个事件立即送达"""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def wants_binary(http_request: Request) -> bool:
+    """客户端是否通过 Accept: image/*（多图输出为 multipart/mixed）选择二进制响应"""
+    return prefers_binary(http_request.headers.get("accept", ""))
+
+
+def binary_response(content: bytes, media_type: str, headers: dict[str, str]) -> Response:
+    """构建二进制响应（响应随 Accept 变化，且每次生成结果不同，不允许缓存）"""
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={**headers, "Cache-Control": "no-store", "Vary": "Accept"}
+    )
+
+
+# OpenAPI 文档中声明的二进制响应类型
+IMAGE_RESPONSE_TYPES = {"image/webp": {}, "image/jpeg": {}, "image/png": {}}
+
+
+async def submit_job(kind: str, current_user: dict, payload: dict, credits: int = 1) -> JSONResponse:
+    """
+    将生成任务写入队列，立即返回 202 和任务 ID
+
+    credits 为提交前已扣减的魔法值，入队失败或任务最终失败（worker 中）时退还
+    """
+    try:
+        job_id = await asyncio.to_thread(
+            get_job_queue().enqueue, kind, current_user["id"], {**payload, "credits": credits}, request_priority.get()
+        )
+    except Exception:
+        await asyncio.to_thread(refund_credits, current_user["id"], credits)
+        raise
+    body = JobResponse(success=True, message="任务已提交", job_id=job_id, status="queued")
+    return JSONResponse(status_code=202, content=body.model_dump())
+
+
+async def consume_credit(user_id: str, current_credits: int, amount: int = 1) -> int:
     """
     扣减用户魔法值
     
+    Args:
+        amount: 本次扣减数量，多项分析合并请求时一次性扣减
+    
     Returns:
         扣减后的魔法值
     """
-    if current_credits <= 0:
+    if current_credits < amount or current_credits <= 0:
         raise HTTPException(
             status_code=402,
             detail="魔法值不足！快去个人中心分享给小伙伴获取次数吧~"
         )
     
-    supabase = get_supabase_client()
-    new_credits = current_credits - 1
-    
-    supabase.table("user_profiles")\
-        .update({"credits": new_credits})\
-        .eq("id", user_id)\
-        .execute()
+    with stage_duration_seconds.time("credit"):
+        supabase = get_supabase_client()
+        new_credits = current_credits - amount
+        
+        supabase.table("user_profiles")\
+            .update({"credits": new_credits})\
+            .eq("id", user_id)\
+            .execute()
     
     return new_credits
 
 
-@router.post("/try-on", response_model=ImageResponse)
+@router.post(
+    "/try-on",
+    response_model=ImageResponse,
+    responses={200: {"content": IMAGE_RESPONSE_TYPES}},
+    openapi_extra=request_body_openapi(TryOnRequest)
+)
 async def try_on(
-    request: TryOnRequest,
+    http_request: Request,
+    request: TryOnRequest = Depends(request_body(TryOnRequest)),
+    mode: RequestMode = Query(RequestMode.SYNC, description="async 时提交后台任务并立即返回任务 ID"),
+    output: OutputSpec = Depends(output_spec),
     current_user: dict = Depends(get_current_user)
 ) -> ImageResponse:
     """
     云试衣 / 耳饰试戴
     
-    根据上传的人物照片和服装/配饰照片生成效果图
+    根据上传的人物照片和服装/配饰照片生成效果图，效果图按 format / size 参数或 Accept 头转码。
+    Accept 优先 image/* 时直接返回图片字节，尺寸等元数据放在响应头中；否则返回 ImageResponse。
+    mode=async 时返回 202 和任务 ID，通过 /ai/jobs/{job_id} 查询结果
     """
     try:
+        # 预处理图片（先于扣费，无法识别的图片不扣魔法值）
+        face_image = await prepare_image(request.face_image, "try_on")
+        item_image = await prepare_image(request.item_image, "try_on")
+        
+        await admit_request(current_user, gemini_service.try_on_feature(request.try_on_type.value))
+        
         # 扣减魔法值
         await consume_credit(current_user["id"], current_user["credits"])
         
-        # 提取 base64 数据（移除 data:image/xxx;base64, 前缀）
-        face_data = request.face_image.split(",")[1] if "," in request.face_image else request.face_image
-        item_data = request.item_image.split(",")[1] if "," in request.item_image else request.item_image
+        if mode == RequestMode.ASYNC:
+            return await submit_job(ai_jobs.JOB_TRY_ON, current_user, {
+                "face_image": ai_jobs.encode_image(face_image),
+                "item_image": ai_jobs.encode_image(item_image),
+                "height": request.height,
+                "body_type": request.body_type.value if request.body_type else None,
+                "try_on_type": request.try_on_type.value,
+                "output": output.to_dict()
+            })
         
         # 调用 Gemini 服务
         result_image = await gemini_service.generate_try_on_image(
-            face_image_base64=face_data,
-            item_image_base64=item_data,
+            face_image=face_image,
+            item_image=item_image,
             height=request.height,
             body_type=request.body_type.value if request.body_type else None,
             try_on_type=request.try_on_type.value
         )
         
+        if wants_binary(http_request):
+            mime_type, data = await render_binary(result_image, output)
+            return binary_response(data, mime_type, image_headers(mime_type, data, "try-on"))
+        
         return ImageResponse(
             success=True,
             message="生成成功",
-            image=f"data:image/png;base64,{result_image}"
+            image=await render_image(result_image, output)
         )
         
     except HTTPException:
         raise
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except AdmissionRejected as e:
+        raise service_busy(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成失败: {str(e)}")
 
 
-@router.post("/analyze", response_model=TextResponse)
+async def as_completed_indexed(calls: list[Awaitable[str]]) -> AsyncIterator[tuple[int, str | BaseException]]:
+    """
+    并发执行一组调用，按完成顺序产出 (下标, 结果或异常)
+    
+    迭代提前结束（如客户端断开）时取消尚未完成的调用
+    """
+    async def indexed(index: int, call: Awaitable[str]) -> tuple[int, str | BaseException]:
+        try:
+            return index, await call
+        except Exception as e:
+            return index, e
+    
+    tasks = [asyncio.create_task(indexed(i, call)) for i, call in enumerate(calls)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def batch_try_on_message(failed_items: list[int]) -> str:
+    return "部分效果图生成失败，请稍后重试" if failed_items else "生成成功"
+
+
+async def refund_failed_items(user_id: str, count: int):
+    """批量试穿、综合报告按件数预先扣减魔法值，未生成的件数在结束时退还"""
+    if count > 0:
+        await asyncio.to_thread(refund_credits, user_id, count)
+
+
+async def batch_try_on_events(
+    user_id: str,
+    total: int,
+    output: OutputSpec,
+    first: tuple[int, str | BaseException],
+    results: AsyncIterator[tuple[int, str | BaseException]]
+) -> AsyncIterator[str]:
+    """
+    批量试穿的事件序列
+    
+    每件生成完成时发送 item（携带下标和效果图），失败时发送 item_failed，
+    最后以 done 汇总 failed_items（全部失败时为 error）；未送达的件数退还魔法值
+    """
+    failed_items = []
+    delivered = 0
+    try:
+        index, result = first
+        while True:
+            if isinstance(result, BaseException):
+                failed_items.append(index)
+                yield sse_event("item_failed", {"index": index, "message": f"生成失败: {str(result)}"})
+            else:
+                image = await render_image(result, output)
+                delivered += 1
+                yield sse_event("item", {"index": index, "image": image})
+            try:
+                index, result = await anext(results)
+            except StopAsyncIteration:
+                break
+        
+        if len(failed_items) == total:
+            yield sse_event("error", {"success": False, "message": "生成失败: AI 未能生成任何效果图"})
+        else:
+            yield sse_event("done", {
+                "success": True,
+                "message": batch_try_on_message(failed_items),
+                "failed_items": sorted(failed_items)
+            })
+    except Exception as e:
+        yield sse_event("error", {"success": False, "message": f"生成失败: {str(e)}"})
+    finally:
+        # 只在这里退还一次：生成失败、出错以及客户端中途断开（GeneratorExit / CancelledError）
+        # 时未送达的件数都会退还；shield 保证断开导致的取消不会中断退款
+        await asyncio.shield(refund_failed_items(user_id, total - delivered))
+
+
+@router.post(
+    "/try-on/batch",
+    response_model=BatchTryOnResponse,
+    openapi_extra=request_body_openapi(BatchTryOnRequest, batch_try_on_form_fields)
+)
+async def try_on_batch(
+    http_request: Request,
+    request: BatchTryOnRequest = Depends(request_body(BatchTryOnRequest, batch_try_on_form)),
+    output: OutputSpec = Depends(output_spec),
+    current_user: dict = Depends(get_current_user)
+) -> BatchTryOnResponse:
+    """
+    批量试穿 / 试戴
+    
+    同一张人物照片搭配多件服装/配饰：人物照片只上传和解码一次，各件并发生成
+    （仍受模型并发准入限制），按件数一次性扣减魔法值，未生成的件数在结束时退还。
+    请求头带 Accept: text/event-stream 时每件生成完成即以 SSE 返回
+    """
+    try:
+        # 预处理图片（先于扣费，无法识别的图片不扣魔法值）
+        face_image = await prepare_image(request.face_image, "try_on")
+        item_images = await asyncio.gather(*(prepare_image(item.item_image, "try_on") for item in request.items))
+        
+        features = dict.fromkeys(gemini_service.try_on_feature(item.try_on_type.value) for item in request.items)
+        await admit_request(current_user, *features)
+        
+        # 扣减魔法值（按件数一次写入）
+        await consume_credit(current_user["id"], current_user["credits"], len(request.items))
+        
+        body_type = request.body_type.value if request.body_type else None
+        results = as_completed_indexed([
+            gemini_service.generate_try_on_image(
+                face_image=face_image,
+                item_image=item_image,
+                height=request.height,
+                body_type=body_type,
+                try_on_type=item.try_on_type.value
+            )
+            for item, item_image in zip(request.items, item_images)
+        ])
+        
+        if wants_event_stream(http_request):
+            first = await anext(results)
+            return event_stream(batch_try_on_events(current_user["id"], len(request.items), output, first, results))
+        
+        images: list[str | None] = [None] * len(request.items)
+        errors = []
+        async for index, result in results:
+            if isinstance(result, BaseException):
+                errors.append(result)
+                continue
+            try:
+                images[index] = await render_image(result, output)
+            except Exception as e:
+                errors.append(e)
+        
+        failed_items = [i for i, image in enumerate(images) if image is None]
+        await refund_failed_items(current_user["id"], len(failed_items))
+        if len(failed_items) == len(images):
+            # 全部失败时按单件试穿的错误语义返回
+            if isinstance(errors[0], AdmissionRejected):
+                raise errors[0]
+            raise HTTPException(status_code=500, detail=f"生成失败: {str(errors[0])}")
+        
+        return BatchTryOnResponse(
+            success=True,
+            message=batch_try_on_message(failed_items),
+            images=images,
+            failed_items=failed_items
+        )
+        
+    except HTTPException:
+        raise
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except AdmissionRejected as e:
+        raise service_busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"生成失败: {str(e)}")
+
+
+async def analyze_events(first: str, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    流式分析的事件序列
+    
+    chunk 事件携带增量文本，done 表示完成；开始输出后发生的错误以 error 事件返回
+    """
+    try:
+        yield sse_event("chunk", {"text": first})
+        async for text in chunks:
+            yield sse_event("chunk", {"text": text})
+        yield sse_event("done", {"success": True, "message": "分析完成"})
+    except AdmissionRejected as e:
+        yield sse_event("error", {"success": False, "message": str(e), "retry_after": e.retry_after})
+    except Exception as e:
+        yield sse_event("error", {"success": False, "message": f"分析失败: {str(e)}"})
+
+
+@router.post("/analyze", response_model=TextResponse, openapi_extra=request_body_openapi(AnalyzeRequest))
 async def analyze(
-    request: AnalyzeRequest,
+    http_request: Request,
+    request: AnalyzeRequest = Depends(request_body(AnalyzeRequest)),
     current_user: dict = Depends(get_current_user)
 ) -> TextResponse:
     """
     中医分析 / 面相分析
     
-    支持舌象、面色、面相三种分析类型
+    支持舌象、面色、面相三种分析类型。
+    请求头带 Accept: text/event-stream 时以 SSE 流式返回分析文本，
+    扣费与开始输出前的错误处理与普通请求一致
     """
     try:
+        # 预处理图片
+        image = await prepare_image(request.image, "analyze")
+        
+        await admit_request(current_user, request.analysis_type.value)
+        
         # 扣减魔法值
         await consume_credit(current_user["id"], current_user["credits"])
         
-        # 提取 base64 数据
-        image_data = request.image.split(",")[1] if "," in request.image else request.image
+        if wants_event_stream(http_request):
+            chunks = gemini_service.stream_analyze_tcm(image, request.analysis_type.value)
+            # 先取得第一段文本，开始输出前的失败仍按普通请求返回 HTTP 错误码
+            first = await anext(chunks)
+            return event_stream(analyze_events(first, chunks))
         
         # 调用 Gemini 服务
         result_text = await gemini_service.analyze_tcm(
-            image_base64=image_data,
+            image=image,
             analysis_type=request.analysis_type.value
         )
         
@@ -109,43 +626,312 @@ async def analyze(
         
     except HTTPException:
         raise
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except AdmissionRejected as e:
+        raise service_busy(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"分析失败: {str(e)}")
 
 
-@router.post("/hairstyle", response_model=HairstyleResponse)
+@router.post("/report", response_model=ReportResponse, openapi_extra=request_body_openapi(ReportRequest))
+async def report(
+    request: ReportRequest = Depends(request_body(ReportRequest)),
+    current_user: dict = Depends(get_current_user)
+) -> ReportResponse:
+    """
+    综合健康报告
+    
+    一次上传舌象照和/或正脸照，并发执行所选的多项分析（舌诊、面诊、面相），
+    合并为一份报告；按分析项数一次性扣减魔法值
+    """
+    try:
+        analysis_types = list(dict.fromkeys(t.value for t in request.analysis_types))
+        needs_tongue = AnalysisType.TONGUE.value in analysis_types
+        needs_face = any(t != AnalysisType.TONGUE.value for t in analysis_types)
+        if needs_tongue and not request.tongue_image:
+            raise HTTPException(status_code=400, detail="舌诊需要上传舌头照片")
+        if needs_face and not request.face_image:
+            raise HTTPException(status_code=400, detail="面诊/面相分析需要上传正脸照片")
+        
+        # 每张图片只解码一次，面诊与面相共用正脸照
+        images = {}
+        if needs_tongue:
+            images["tongue"] = await prepare_image(request.tongue_image, "analyze")
+        if needs_face:
+            images["face"] = await prepare_image(request.face_image, "analyze")
+        
+        await admit_request(current_user, *analysis_types)
+        
+        # 扣减魔法值（一次写入）
+        await consume_credit(current_user["id"], current_user["credits"], len(analysis_types))
+        
+        results = await asyncio.gather(
+            *(
+                gemini_service.analyze_tcm(
+                    image=images["tongue" if t == AnalysisType.TONGUE.value else "face"],
+                    analysis_type=t
+                )
+                for t in analysis_types
+            ),
+            return_exceptions=True
+        )
+        
+        sections = {}
+        failed_types = []
+        for analysis_type, result in zip(analysis_types, results):
+            if isinstance(result, BaseException):
+                failed_types.append(analysis_type)
+            else:
+                sections[analysis_type] = result
+        
+        # 失败的分析项退还魔法值（全部失败时全额退还）
+        await refund_failed_items(current_user["id"], len(failed_types))
+        
+        if not sections:
+            # 全部失败时按单项分析的错误语义返回
+            first_error = results[0]
+            if isinstance(first_error, AdmissionRejected):
+                raise first_error
+            raise HTTPException(status_code=500, detail=f"分析失败: {str(first_error)}")
+        
+        return ReportResponse(
+            success=True,
+            message="部分分析失败，请稍后重试" if failed_types else "报告生成完成",
+            sections=sections,
+            failed_types=failed_types
+        )
+        
+    except HTTPException:
+        raise
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except AdmissionRejected as e:
+        raise service_busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"分析失败: {str(e)}")
+
+
+async def hairstyle_events(
+    output: OutputSpec,
+    first: tuple[str, str],
+    parts: AsyncIterator[tuple[str, str]]
+) -> AsyncIterator[str]:
+    """
+    渐进式发型推荐的事件序列
+    
+    analysis / recommended_image / catalog_image 事件按完成顺序发送，
+    某部分失败时发送 part_failed，最后以 done 汇总 failed_parts（全部失败时为 error）
+    """
+    failed_parts = []
+    try:
+        name, value = first
+        while True:
+            if not value:
+                failed_parts.append(name)
+                yield sse_event("part_failed", {"part": name})
+            elif name == "analysis":
+                yield sse_event(name, {"text": value})
+            else:
+                yield sse_event(name, {"image": await render_image(value, output)})
+            try:
+                name, value = await anext(parts)
+            except StopAsyncIteration:
+                break
+        
+        if len(failed_parts) == len(gemini_service.HAIRSTYLE_PARTS):
+            yield sse_event("error", {"success": False, "message": "推荐失败: AI 未能生成发型分析和图像"})
+        else:
+            yield sse_event("done", {
+                "success": True,
+                "message": "部分内容生成失败，请稍后重试" if failed_parts else "推荐完成",
+                "failed_parts": failed_parts
+            })
+    except Exception as e:
+        yield sse_event("error", {"success": False, "message": f"推荐失败: {str(e)}"})
+
+
+async def hairstyle_multipart(result: dict, output: OutputSpec) -> Response:
+    """
+    以 multipart/mixed 返回发型推荐结果
+    
+    第一部分为 metadata（JSON：success / message / analysis / failed_parts），
+    之后依次为 recommended_image、catalog_image 的图片字节，生成失败的部分不出现
+    """
+    failed_parts = result.get("failed", [])
+    metadata = {
+        "success": True,
+        "message": "部分内容生成失败，请稍后重试" if failed_parts else "推荐完成",
+        "analysis": result["analysis"],
+        "failed_parts": failed_parts,
+    }
+    parts = [(
+        {"Content-Type": "application/json; charset=utf-8", "Content-Disposition": 'inline; name="metadata"'},
+        json.dumps(metadata, ensure_ascii=False).encode("utf-8")
+    )]
+    for name, key in (("recommended_image", "recommendedImage"), ("catalog_image", "catalogImage")):
+        if result[key]:
+            mime_type, data = await render_binary(result[key], output)
+            parts.append(({"Content-Type": mime_type, **image_headers(mime_type, data, name)}, data))
+    
+    media_type, body = encode_multipart_mixed(parts)
+    return binary_response(body, media_type, {"X-Failed-Parts": ",".join(failed_parts)})
+
+
+@router.post(
+    "/hairstyle",
+    response_model=HairstyleResponse,
+    responses={200: {"content": {"multipart/mixed": {}}}},
+    openapi_extra=request_body_openapi(HairstyleRequest)
+)
 async def hairstyle(
-    request: HairstyleRequest,
+    http_request: Request,
+    request: HairstyleRequest = Depends(request_body(HairstyleRequest)),
+    mode: RequestMode = Query(RequestMode.SYNC, description="async 时提交后台任务并立即返回任务 ID"),
+    output: OutputSpec = Depends(output_spec),
     current_user: dict = Depends(get_current_user)
 ) -> HairstyleResponse:
     """
     发型推荐
     
-    分析用户脸型并推荐合适的发型，同时生成效果图
+    分析用户脸型并推荐合适的发型，同时生成效果图。
+    请求头带 Accept: text/event-stream 时以 SSE 渐进返回：哪一部分先完成就先发送哪一部分；
+    Accept 优先 image/* 或 multipart/mixed 时以 multipart/mixed 返回分析文本和图片字节；
+    其余客户端仍得到原有的完整 JSON 响应。
+    mode=async 时返回 202 和任务 ID，通过 /ai/jobs/{job_id} 查询结果
     """
     try:
+        # 预处理图片
+        image = await prepare_image(request.image, "hairstyle")
+        
+        await admit_request(current_user, "hairstyle-analysis", "hairstyle-image")
+        
         # 扣减魔法值
         await consume_credit(current_user["id"], current_user["credits"])
         
-        # 提取 base64 数据
-        image_data = request.image.split(",")[1] if "," in request.image else request.image
+        if mode == RequestMode.ASYNC:
+            return await submit_job(ai_jobs.JOB_HAIRSTYLE, current_user, {
+                "image": ai_jobs.encode_image(image),
+                "gender": request.gender.value,
+                "age": request.age,
+                "output": output.to_dict()
+            })
+        
+        if wants_event_stream(http_request):
+            parts = gemini_service.stream_hairstyle(image, request.gender.value, request.age)
+            first = await anext(parts)
+            return event_stream(hairstyle_events(output, first, parts))
         
         # 调用 Gemini 服务
         result = await gemini_service.generate_hairstyle(
-            image_base64=image_data,
+            image=image,
             gender=request.gender.value,
             age=request.age
         )
         
-        return HairstyleResponse(
-            success=True,
-            message="推荐完成",
-            analysis=result["analysis"],
-            recommended_image=f"data:image/png;base64,{result['recommendedImage']}" if result["recommendedImage"] else None,
-            catalog_image=f"data:image/png;base64,{result['catalogImage']}" if result["catalogImage"] else None
-        )
+        if wants_binary(http_request):
+            return await hairstyle_multipart(result, output)
+        
+        return HairstyleResponse(**await ai_jobs.hairstyle_response(result, output))
         
     except HTTPException:
         raise
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except AdmissionRejected as e:
+        raise service_busy(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"推荐失败: {str(e)}")
+
+
+# 任务完成事件流的轮询间隔、心跳间隔与最长等待时间（秒）
+JOB_EVENTS_POLL_INTERVAL = 1.0
+JOB_EVENTS_KEEPALIVE = 15
+JOB_EVENTS_TIMEOUT = 600
+
+
+async def get_user_job(job_id: str, current_user: dict) -> dict:
+    """读取任务，不存在或不属于当前用户时返回 404"""
+    job = await asyncio.to_thread(get_job_queue().get, job_id)
+    if job is None or job["user_id"] != current_user["id"]:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+
+def job_status_response(job: dict, base_url: str = "") -> JobStatusResponse:
+    """任务状态响应；结果中的 Blob 引用在此时签名，URL 有效期从查询时开始计算"""
+    return JobStatusResponse(
+        success=job["status"] != "failed",
+        message={
+            "queued": "排队中",
+            "running": "生成中",
+            "succeeded": "生成完成",
+            "failed": "生成失败",
+        }.get(job["status"], job["status"]),
+        job_id=job["id"],
+        kind=job["kind"],
+        status=job["status"],
+        result=sign_blob_refs(job["result"], base_url),
+        error=job["error"]
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(
+    job_id: str,
+    http_request: Request,
+    current_user: dict = Depends(get_current_user)
+) -> JobStatusResponse:
+    """
+    查询异步任务状态
+    
+    任务成功时 result 与对应同步接口的响应内容相同
+    """
+    return job_status_response(await get_user_job(job_id, current_user), str(http_request.base_url))
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(
+    job_id: str,
+    http_request: Request,
+    current_user: dict = Depends(get_current_user)
+) -> StreamingResponse:
+    """
+    异步任务完成事件流（SSE）
+    
+    状态变化时发送 status 事件，任务成功时发送 done（携带结果），失败时发送 error
+    """
+    job = await get_user_job(job_id, current_user)
+    queue = get_job_queue()
+    
+    async def events() -> AsyncIterator[str]:
+        current = job
+        last_status = None
+        last_sent = time.monotonic()
+        deadline = time.monotonic() + JOB_EVENTS_TIMEOUT
+        while True:
+            if current["status"] != last_status:
+                last_status = current["status"]
+                last_sent = time.monotonic()
+                if current["status"] in FINISHED_STATUSES:
+                    response = job_status_response(current, str(http_request.base_url)).model_dump()
+                    yield sse_event("done" if current["status"] == STATUS_SUCCEEDED else "error", response)
+                    return
+                yield sse_event("status", {"job_id": job_id, "status": current["status"]})
+            elif time.monotonic() - last_sent >= JOB_EVENTS_KEEPALIVE:
+                # 心跳注释，防止代理因连接空闲而断开
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            if time.monotonic() >= deadline:
+                yield sse_event("timeout", {"job_id": job_id, "status": current["status"]})
+                return
+            await asyncio.sleep(JOB_EVENTS_POLL_INTERVAL)
+            current = await asyncio.to_thread(queue.get, job_id) or current
+    
+    return event_stream(events())
@@ -0,0 +1,104 @@
+"""
+生成图片下载 API 端点
+
+按签名 URL 提供 Blob 存储中的生成图片，不需要登录；
+键名即内容哈希，响应带强 ETag，并支持 Range 断点续传
+"""
+import time
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response
+from services.blob_store import is_valid_key, verify_blob_signature, load_blob
+
+router = APIRouter(prefix="/blobs", tags=["生成图片"])
+
+# 浏览器缓存时长上限（秒），不超过签名剩余有效期
+MAX_CACHE_SECONDS = 3600
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    解析单段 Range 请求头
+
+    Returns:
+        (起始字节, 结束字节)，闭区间；无法满足时返回 None
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # 后缀形式：bytes=-N 表示最后 N 个字节
+            suffix = int(end_text)
+            if suffix <= 0:
+                return None
+            start, end = max(0, size - suffix), size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+@router.get("/{key}")
+async def get_blob(
+    key: str,
+    request: Request,
+    expires: int = Query(..., description="签名过期时间（Unix 时间戳）"),
+    sig: str = Query(..., description="签名")
+) -> Response:
+    """
+    下载生成图片
+
+    签名无效返回 403，过期返回 410；If-None-Match 命中时返回 304，
+    带 Range 时返回 206（无法满足时 416）
+    """
+    if not is_valid_key(key):
+        raise HTTPException(status_code=404, detail="图片不存在")
+    if not verify_blob_signature(key, expires, sig):
+        if expires < time.time():
+            raise HTTPException(status_code=410, detail="图片链接已过期")
+        raise HTTPException(status_code=403, detail="图片链接无效")
+
+    blob = await load_blob(key)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="图片不存在")
+
+    # 内容不可变，但缓存时间不超过签名剩余有效期
+    max_age = max(0, min(MAX_CACHE_SECONDS, expires - int(time.time())))
+    headers = {
+        "ETag": blob.etag,
+        "Cache-Control": f"private, max-age={max_age}, immutable",
+        "Accept-Ranges": "bytes",
+    }
+
+    if blob.etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    data = blob.data
+    status_code = 200
+    range_header = request.headers.get("range")
+    # If-Range 与 ETag 不一致时忽略 Range，返回完整内容
+    if range_header and request.headers.get("if-range", blob.etag) == blob.etag:
+        byte_range = parse_range(range_header, len(blob.data))
+        if byte_range is None:
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{len(blob.data)}"}
+            )
+        start, end = byte_range
+        data = blob.data[start:end + 1]
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(blob.data)}"
+
+    if request.method == "HEAD":
+        headers["Content-Length"] = str(len(data))
+        return Response(status_code=status_code, headers=headers, media_type=blob.content_type)
+    return Response(content=data, status_code=status_code, headers=headers, media_type=blob.content_type)
+
+
+# HEAD 与 GET 共用处理函数，单独注册且不写入 OpenAPI 文档，避免重复的 operationId
+router.add_api_route("/{key}", get_blob, methods=["HEAD"], include_in_schema=False)
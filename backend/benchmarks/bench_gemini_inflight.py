@@ -0,0 +1,119 @@
+"""
+Gemini 调用并发容量基准测试
+
+对比两种传输方式在大量并发请求下的表现：
+- legacy: 旧实现，同步 generate_content 包在 asyncio.to_thread 中，等待网络期间占用默认线程池线程
+- native: 新实现，google-genai 原生异步客户端（client.aio），等待期间只占用事件循环上的一个协程
+
+用 sleep 模拟上游延迟，不会真正调用 Gemini。同时在负载期间周期性提交一个
+使用默认线程池的探测任务，观察其排队延迟。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_gemini_inflight.py --requests 1000 --latency 2
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+
+class InflightCounter:
+    """记录当前与峰值的在途请求数"""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    def enter(self):
+        self.current += 1
+        self.peak = max(self.peak, self.current)
+
+    def leave(self):
+        self.current -= 1
+
+
+def blocking_generate_content(latency: float, counter: InflightCounter):
+    """模拟同步 SDK：阻塞当前线程直到响应返回"""
+    counter.enter()
+    try:
+        time.sleep(latency)
+    finally:
+        counter.leave()
+
+
+async def async_generate_content(latency: float, counter: InflightCounter):
+    """模拟原生异步 SDK：挂起协程直到响应返回"""
+    counter.enter()
+    try:
+        await asyncio.sleep(latency)
+    finally:
+        counter.leave()
+
+
+async def legacy_call(latency: float, counter: InflightCounter):
+    await asyncio.to_thread(blocking_generate_content, latency, counter)
+
+
+async def native_call(latency: float, counter: InflightCounter):
+    await async_generate_content(latency, counter)
+
+
+async def probe(stop: asyncio.Event, samples: list[float], interval: float = 0.05):
+    """周期性向默认线程池提交一个空任务，记录排队+执行耗时"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.to_thread(lambda: None)
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+
+
+async def run_mode(name: str, call, total: int, latency: float) -> dict:
+    counter = InflightCounter()
+    samples: list[float] = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(stop, samples))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call(latency, counter) for _ in range(total)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await probe_task
+
+    samples.sort()
+    return {
+        "mode": name,
+        "requests": total,
+        "peak_inflight": counter.peak,
+        "wall_s": elapsed,
+        "throughput_rps": total / elapsed,
+        "probe_p50_ms": statistics.median(samples) * 1000 if samples else 0.0,
+        "probe_max_ms": samples[-1] * 1000 if samples else 0.0,
+    }
+
+
+def print_row(result: dict):
+    print(
+        f"{result['mode']:<8} requests={result['requests']:<6} "
+        f"peak_inflight={result['peak_inflight']:<6} "
+        f"wall={result['wall_s']:.2f}s "
+        f"throughput={result['throughput_rps']:.1f}/s "
+        f"probe_p50={result['probe_p50_ms']:.1f}ms "
+        f"probe_max={result['probe_max_ms']:.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini 调用并发容量基准测试")
+    parser.add_argument("--requests", type=int, default=1000, help="同时发起的请求数")
+    parser.add_argument("--latency", type=float, default=2.0, help="模拟的上游延迟（秒）")
+    args = parser.parse_args()
+
+    # 每种模式使用独立的事件循环，保证默认线程池互不影响
+    for name, call in (("legacy", legacy_call), ("native", native_call)):
+        result = asyncio.run(run_mode(name, call, args.requests, args.latency))
+        print_row(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+图片载荷解码内存分配基准测试
+
+对比单张图片在一次请求中的解码开销：
+- legacy: 旧写法，x.split(",")[1] if "," in x else x 后再 base64.b64decode，
+  切片复制整段字符串，b64decode 内部又把字符串 encode 成 bytes 再复制一次
+- codec: 共享 codec 模块的 decode_image，只扫描头部找前缀，分块解码到同一个 bytearray，
+  同时识别格式、读取尺寸并计算哈希
+- multipart: multipart 上传的原始字节直接交给 decode_image，不经过 base64
+
+用 tracemalloc 统计每次请求的分配次数、分配总字节数和峰值内存（相对载荷本身）。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_payload_codec.py --size-mb 4.5 --rounds 20
+"""
+import argparse
+import base64
+import binascii
+import os
+import statistics
+import struct
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.codec import decode_image
+
+
+def make_png(size: int) -> bytes:
+    """构造带合法 PNG 文件头的随机载荷（解码阶段只读取文件头，内容无需是完整图片）"""
+    header = b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">IIBBBBB", 4032, 3024, 8, 2, 0, 0, 0)
+    return header + os.urandom(max(0, size - len(header)))
+
+
+def legacy_decode(image: str) -> bytes:
+    data = image.split(",", 1)[1] if "," in image else image
+    try:
+        return base64.b64decode(data, validate=False)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError("图片数据不是有效的 base64 编码") from e
+
+
+def codec_decode(payload):
+    return decode_image(payload)
+
+
+def measure(name: str, func, payload, rounds: int) -> dict:
+    func(payload)  # 预热，排除首次导入等一次性分配
+    allocations, allocated, peaks, durations = [], [], [], []
+    for _ in range(rounds):
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        result = func(payload)
+        durations.append(time.perf_counter() - start)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        stats = after.compare_to(before, "lineno")
+        allocations.append(sum(max(0, s.count_diff) for s in stats))
+        allocated.append(sum(max(0, s.size_diff) for s in stats))
+        peaks.append(peak)
+        del result
+    return {
+        "mode": name,
+        "allocations": statistics.median(allocations),
+        "retained_mb": statistics.median(allocated) / 1e6,
+        "peak_mb": statistics.median(peaks) / 1e6,
+        "p50_ms": statistics.median(durations) * 1000,
+    }
+
+
+def print_row(result: dict):
+    print(
+        f"{result['mode']:<10} allocations={result['allocations']:<6.0f} "
+        f"retained={result['retained_mb']:.2f}MB "
+        f"peak={result['peak_mb']:.2f}MB "
+        f"p50={result['p50_ms']:.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片载荷解码内存分配基准测试")
+    parser.add_argument("--size-mb", type=float, default=4.5, help="解码后的图片大小（MB），base64 后约为 4/3 倍")
+    parser.add_argument("--rounds", type=int, default=20, help="每种模式的测量次数")
+    args = parser.parse_args()
+
+    raw = make_png(int(args.size_mb * 1e6))
+    data_url = "data:image/png;base64," + base64.b64encode(raw).decode("ascii")
+    print(f"payload: raw={len(raw) / 1e6:.2f}MB data_url={len(data_url) / 1e6:.2f}MB")
+
+    print_row(measure("legacy", legacy_decode, data_url, args.rounds))
+    print_row(measure("codec", codec_decode, data_url, args.rounds))
+    print_row(measure("multipart", codec_decode, raw, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,93 @@ class Settings(BaseSettings):
     
     # Gemini API 配置
     gemini_api_key: str = ""
+    # 多 Key 池（JSON 数组），为空时只使用 gemini_api_key
+    gemini_api_keys: str = ""
+    
+    # 图片预处理配置（上传给 Gemini 前的最长边和 JPEG 质量）
+    image_max_edge_try_on: int = 1536
+    image_max_edge_analyze: int = 1024
+    image_max_edge_hairstyle: int = 1024
+    image_jpeg_quality: int = 85
+    
+    # 请求大小限制（request_body_limits 为 JSON 对象，按路由前缀设置请求体字节上限；单张图片限制解码后字节数和像素数）
+    request_body_limits: str = ""
+    request_body_max_bytes: int = 1024 * 1024
+    image_max_decoded_bytes: int = 20 * 1024 * 1024
+    image_max_pixels: int = 40_000_000
+    
+    # 生成图片输出配置（格式为空时保持 Gemini 原始格式；尺寸档位 preview / standard / full）
+    image_output_format: str = ""
+    image_output_size: str = "full"
+    image_output_quality: int = 80
+    image_output_max_edge_preview: int = 512
+    image_output_max_edge_standard: int = 1080
+    image_output_workers: int = 2
+    
+    # 生成图片返回方式（inline 内嵌为 data URL；url 写入 Blob 存储并返回签名 URL，需配置 blob_public_base_url）
+    image_delivery: str = "inline"
+    
+    # Blob 存储（blob_store 为 local 或 s3；local 目录为空时使用系统临时目录，s3 需安装 boto3）
+    blob_store: str = "local"
+    blob_local_dir: str = ""
+    blob_retention_hours: int = 72
+    blob_s3_endpoint: str = ""
+    blob_s3_bucket: str = ""
+    blob_s3_region: str = ""
+    blob_s3_access_key: str = ""
+    blob_s3_secret_key: str = ""
+    # 签名 URL（签名密钥为空时不签发 URL，图片改为内嵌返回；对外地址为空时使用请求的地址）
+    blob_signing_secret: str = ""
+    blob_url_ttl_seconds: int = 3600
+    blob_public_base_url: str = ""
+    
+    # /metrics 端点的访问令牌（为空时关闭该端点）
+    metrics_token: str = ""
+    
+    # 分析结果缓存配置（analyze_cache_dir 为空时仅使用内存缓存）
+    analyze_cache_max_entries: int = 1000
+    analyze_cache_ttl_seconds: int = 86400
+    analyze_cache_dir: str = ""
+    
+    # 生成图片缓存配置（按字节数限制，内存层溢出到本地磁盘；image_cache_dir 为空时使用系统临时目录）
+    image_cache_memory_bytes: int = 64 * 1024 * 1024
+    image_cache_disk_bytes: int = 1024 * 1024 * 1024
+    image_cache_ttl_seconds: int = 3600
+    image_cache_dir: str = ""
+    
+    # AI 调用准入控制（gemini_model_concurrency 为 JSON 对象，按模型设置并发上限）
+    gemini_model_concurrency: str = ""
+    gemini_default_concurrency: int = 8
+    gemini_queue_size: int = 50
+    gemini_queue_timeout_seconds: int = 20
+    
+    # Gemini 配额节流（gemini_rate_limits 为 JSON 对象，按模型设置 rpm/tpm）
+    gemini_rate_limits: str = ""
+    gemini_default_rpm: int = 300
+    gemini_default_tpm: int = 1000000
+    
+    # 进程级重试预算：每个请求积累 ratio 次重试额度，另有每秒保底额度
+    gemini_retry_budget_ratio: float = 0.2
+    gemini_retry_budget_min_per_second: float = 1.0
+    
+    # 各功能的候选模型链（JSON 对象，如 {"try-on": ["gemini-2.5-flash-image", "..."]}），按延迟与失败率路由并自动切换
+    gemini_model_routes: str = ""
+    
+    # 异步任务队列（SQLite 文件路径需在 API 与 worker 进程间共享，为空时使用系统临时目录）
+    job_queue_path: str = ""
+    job_worker_concurrency: int = 4
+    job_lease_seconds: int = 300
+    job_max_attempts: int = 2
+    job_retention_hours: int = 24
+    
+    # 按模型熔断：窗口内失败率或慢调用比例超过阈值时打开，open_seconds 后半开探测
+    circuit_breaker_window_seconds: float = 60.0
+    circuit_breaker_min_requests: int = 10
+    circuit_breaker_error_rate: float = 0.5
+    circuit_breaker_slow_call_seconds: float = 60.0
+    circuit_breaker_slow_call_rate: float = 0.8
+    circuit_breaker_open_seconds: float = 30.0
+    circuit_breaker_half_open_probes: int = 2
     
     # 应用配置
     debug: bool = False
@@ -3,7 +3,10 @@
 
 FastAPI 应用主入口，配置路由、中间件和 CORS
 """
-from fastapi import FastAPI, Request
+import asyncio
+import hmac
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
@@ -11,7 +14,13 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from config import get_settings
-from api import auth, user, ai, payment, admin
+from api import auth, user, ai, payment, admin, blobs
+from services.image_output import shutdown_output_executor
+from services.blob_store import blob_signing_enabled
+from middleware.body_limit import BodyLimitMiddleware
+from middleware.metrics import MetricsMiddleware, MetricsJSONResponse
+from services.config_service import get_config
+from services.metrics import render_metrics, monitor_event_loop
 import logging
 
 # 配置日志
@@ -24,7 +33,8 @@ app = FastAPI(
     description="提供用户认证、AI 试穿、中医分析等服务",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=MetricsJSONResponse
 )
 
 # 全局异常处理
@@ -33,13 +43,19 @@ async def global_exception_handler(request: Request, exc: Exception):
     logger.error(f"GLOBAL ERROR: {str(exc)}", exc_info=True)
     return {"success": False, "message": "后端出了一点小状况，正在拼命修复中...", "detail": str(exc)}
 settings = get_settings()
+# 请求体大小限制在认证和解析之前执行；CORS 在其外层，413 响应同样带跨域头
+app.add_middleware(BodyLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 二进制图片响应的元数据头
+    expose_headers=["X-Image-Width", "X-Image-Height", "X-Failed-Parts", "ETag"],
 )
+# 请求指标在最外层，413 和跨域预检同样计入
+app.add_middleware(MetricsMiddleware)
 
 # 注册路由
 app.include_router(auth.router, prefix="/api")
@@ -47,6 +63,27 @@ app.include_router(user.router, prefix="/api")
 app.include_router(ai.router, prefix="/api")
 app.include_router(payment.router, prefix="/api")
 app.include_router(admin.router, prefix="/api")
+app.include_router(blobs.router, prefix="/api")
+
+
+_loop_monitor: asyncio.Task | None = None
+
+
+@app.on_event("startup")
+async def startup():
+    # 事件循环延迟采样
+    global _loop_monitor
+    _loop_monitor = asyncio.create_task(monitor_event_loop())
+    if get_config("image_delivery", "inline") == "url" and not blob_signing_enabled():
+        logger.error("image_delivery is url but blob_signing_secret is not configured, images will be returned inline")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if _loop_monitor is not None:
+        _loop_monitor.cancel()
+    # 关闭生成图片转码进程池
+    shutdown_output_executor()
 
 
 @app.get("/")
@@ -65,6 +102,22 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """
+    Prometheus 指标端点
+    
+    需携带 Authorization: Bearer <metrics_token>；未配置 metrics_token 时端点关闭（404）
+    """
+    token = get_config("metrics_token", "")
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    auth = request.headers.get("authorization", "")
+    if not hmac.compare_digest(auth, f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="未授权")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
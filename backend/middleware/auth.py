@@ -6,6 +6,7 @@
 from fastapi import HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from services.supabase_client import get_supabase_client
+from services.metrics import stage_duration_seconds
 
 security = HTTPBearer()
 
@@ -25,7 +26,12 @@ async def get_current_user(
     Raises:
         HTTPException: token 无效或用户不存在
     """
-    token = credentials.credentials
+    with stage_duration_seconds.time("auth"):
+        return _load_user(credentials.credentials)
+
+
+def _load_user(token: str) -> dict:
+    """校验 token 并读取用户资料"""
     supabase = get_supabase_client()
     
     try:
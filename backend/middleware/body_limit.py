@@ -0,0 +1,111 @@
+"""
+请求体大小限制中间件
+
+在认证和请求体解析之前按路由限制请求体大小：Content-Length 超限时直接返回 413，
+不读取请求体；未声明长度（分块上传）或声明不实的请求在读取过程中累计字节数，超限即中止
+"""
+import json
+import logging
+from fastapi import HTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from services.config_service import get_config
+
+logger = logging.getLogger(__name__)
+
+# 各路由前缀默认的请求体上限（字节，按最长前缀匹配），
+# 可在 system_config 中通过 request_body_limits（JSON 对象）覆盖；JSON 中的 base64 图片约为原图的 4/3
+DEFAULT_BODY_LIMITS = {
+    "/api/ai/try-on/batch": 64 * 1024 * 1024,
+    "/api/ai/try-on": 32 * 1024 * 1024,
+    "/api/ai/report": 32 * 1024 * 1024,
+    "/api/ai/": 16 * 1024 * 1024,
+}
+# 其余路由的默认上限，可通过 request_body_max_bytes 覆盖
+DEFAULT_MAX_BODY_BYTES = 1024 * 1024
+
+# 解析过的 request_body_limits 配置：原始字符串 -> 上限表
+_parsed_limits: tuple[str, dict[str, int]] = ("", DEFAULT_BODY_LIMITS)
+
+
+def get_body_limits() -> dict[str, int]:
+    """读取各路由前缀的请求体上限（配置未变化时复用上次解析结果）"""
+    global _parsed_limits
+    raw = get_config("request_body_limits", "") or ""
+    if raw != _parsed_limits[0]:
+        limits = dict(DEFAULT_BODY_LIMITS)
+        try:
+            limits.update({prefix: int(value) for prefix, value in json.loads(raw).items()})
+        except (TypeError, ValueError, AttributeError):
+            logger.warning("Invalid request_body_limits config, using defaults")
+        _parsed_limits = (raw, limits)
+    return _parsed_limits[1]
+
+
+def get_body_limit(path: str) -> int:
+    """按最长前缀匹配确定路由的请求体上限"""
+    limits = get_body_limits()
+    prefix = max((p for p in limits if path.startswith(p)), key=len, default=None)
+    if prefix is not None:
+        return limits[prefix]
+    try:
+        return int(get_config("request_body_max_bytes", DEFAULT_MAX_BODY_BYTES))
+    except (TypeError, ValueError):
+        return DEFAULT_MAX_BODY_BYTES
+
+
+def too_large(limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"请求体过大，不能超过 {limit // (1024 * 1024) or 1}MB")
+
+
+class BodyLimitMiddleware:
+    """
+    纯 ASGI 中间件，不缓冲请求体
+
+    读取过程中超限时在 receive 中抛出 413 HTTPException，由 FastAPI 的异常处理返回响应
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS"):
+            await self.app(scope, receive, send)
+            return
+
+        limit = get_body_limit(scope["path"])
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None:
+            try:
+                declared = int(content_length)
+            except ValueError:
+                declared = 0
+            if declared > limit:
+                await self._reject(send, limit)
+                return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise too_large(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    async def _reject(send: Send, limit: int):
+        body = json.dumps({"detail": too_large(limit).detail}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,74 @@
+"""
+请求指标中间件
+
+按方法、路由模板和状态码统计请求数与延迟（到最后一个响应字节为止，流式响应同样计入）；
+路由模板取自 FastAPI 路由匹配后的 scope["route"]（补上路由器的挂载前缀），
+/api/blobs/{key} 等带参数的路径不会产生大量标签
+"""
+import time
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from services.metrics import http_requests_total, http_request_duration_seconds, stage_duration_seconds
+
+# 未匹配到路由（404、路由之前被拒绝的请求）时的路由标签
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_label(scope: Scope) -> str:
+    """
+    请求的路由标签：完整的路由模板，如 /api/blobs/{key}
+
+    以 prefix 挂载的路由器中，route.path 可能不含挂载前缀（取决于 FastAPI 版本），
+    此时用路由自身的正则从实际路径中找出前缀（前缀为固定字符串，不会引入路径参数）
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if not template:
+        return UNMATCHED_ROUTE
+    regex = getattr(route, "path_regex", None)
+    path = scope.get("path", "")
+    root_path = scope.get("root_path", "")
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    if regex is None or regex.match(path):
+        return template
+    for i in range(1, len(path)):
+        if path[i] == "/" and regex.match(path[i:]):
+            return path[:i] + template
+    return template
+
+
+class MetricsMiddleware:
+    """纯 ASGI 中间件，只包装 send 记录状态码，不缓冲响应"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            path = route_label(scope)
+            http_request_duration_seconds.observe(time.perf_counter() - started, scope["method"], path)
+            http_requests_total.inc(scope["method"], path, str(status))
+
+
+class MetricsJSONResponse(JSONResponse):
+    """记录 JSON 序列化耗时的默认响应类（内嵌 base64 图片的响应可达数 MB）"""
+
+    def render(self, content) -> bytes:
+        with stage_duration_seconds.time("json_encode"):
+            return super().render(content)
@@ -26,6 +26,32 @@ class AnalysisType(str, Enum):
     FACE_READING = "face-reading"
 
 
+class RequestMode(str, Enum):
+    """请求模式枚举"""
+    SYNC = "sync"
+    ASYNC = "async"
+
+
+class OutputFormat(str, Enum):
+    """生成图片输出格式枚举"""
+    WEBP = "webp"
+    JPEG = "jpeg"
+    PNG = "png"
+
+
+class OutputSize(str, Enum):
+    """生成图片尺寸档位枚举"""
+    PREVIEW = "preview"
+    STANDARD = "standard"
+    FULL = "full"
+
+
+class OutputDelivery(str, Enum):
+    """生成图片返回方式枚举"""
+    URL = "url"
+    INLINE = "inline"
+
+
 class Gender(str, Enum):
     """性别枚举"""
     MALE = "男"
@@ -34,22 +60,47 @@ class Gender(str, Enum):
 
 class TryOnRequest(BaseModel):
     """试穿/试戴请求"""
-    face_image: str = Field(..., description="人物照片 base64")
-    item_image: str = Field(..., description="服装/配饰照片 base64")
+    face_image: str | bytes = Field(..., description="人物照片（JSON 为 base64，multipart 为文件）")
+    item_image: str | bytes = Field(..., description="服装/配饰照片（JSON 为 base64，multipart 为文件）")
     height: int | None = Field(None, ge=100, le=250, description="身高（cm）")
     body_type: BodyType | None = Field(None, description="体型")
     try_on_type: TryOnType = Field(..., description="试穿类型")
 
 
+class TryOnItem(BaseModel):
+    """批量试穿中的单件服装/配饰"""
+    item_image: str | bytes = Field(..., description="服装/配饰照片（JSON 为 base64，multipart 为文件）")
+    try_on_type: TryOnType = Field(..., description="试穿类型")
+
+
+class BatchTryOnRequest(BaseModel):
+    """批量试穿请求：同一张人物照片搭配多件服装/配饰"""
+    face_image: str | bytes = Field(..., description="人物照片（JSON 为 base64，multipart 为文件）")
+    items: list[TryOnItem] = Field(..., min_length=1, max_length=5, description="服装/配饰列表")
+    height: int | None = Field(None, ge=100, le=250, description="身高（cm）")
+    body_type: BodyType | None = Field(None, description="体型")
+
+
 class AnalyzeRequest(BaseModel):
     """分析请求"""
-    image: str = Field(..., description="图片 base64")
+    image: str | bytes = Field(..., description="图片（JSON 为 base64，multipart 为文件）")
     analysis_type: AnalysisType = Field(..., description="分析类型")
 
 
+class ReportRequest(BaseModel):
+    """综合健康报告请求"""
+    tongue_image: str | bytes | None = Field(None, description="舌头照片（舌诊需要；JSON 为 base64，multipart 为文件）")
+    face_image: str | bytes | None = Field(None, description="正脸照片（面诊、面相需要；JSON 为 base64，multipart 为文件）")
+    analysis_types: list[AnalysisType] = Field(
+        default_factory=lambda: list(AnalysisType),
+        min_length=1,
+        description="需要包含的分析类型，默认全部"
+    )
+
+
 class HairstyleRequest(BaseModel):
     """发型推荐请求"""
-    image: str = Field(..., description="人物照片 base64")
+    image: str | bytes = Field(..., description="人物照片（JSON 为 base64，multipart 为文件）")
     gender: Gender = Field(..., description="性别")
     age: int = Field(..., ge=5, le=100, description="年龄")
 
@@ -61,6 +112,14 @@ class ImageResponse(BaseModel):
     image: str | None = None
 
 
+class BatchTryOnResponse(BaseModel):
+    """批量试穿响应"""
+    success: bool
+    message: str
+    images: list[str | None] = Field(default_factory=list, description="与 items 顺序一致的效果图，失败项为 null")
+    failed_items: list[int] = Field(default_factory=list, description="生成失败的 items 下标")
+
+
 class TextResponse(BaseModel):
     """文本分析响应"""
     success: bool
@@ -68,6 +127,14 @@ class TextResponse(BaseModel):
     text: str | None = None
 
 
+class ReportResponse(BaseModel):
+    """综合健康报告响应"""
+    success: bool
+    message: str
+    sections: dict[str, str] = Field(default_factory=dict, description="分析类型 -> 分析结果文本")
+    failed_types: list[str] = Field(default_factory=list, description="分析失败的类型")
+
+
 class HairstyleResponse(BaseModel):
     """发型推荐响应"""
     success: bool
@@ -75,3 +142,23 @@ class HairstyleResponse(BaseModel):
     analysis: str | None = None
     recommended_image: str | None = None
     catalog_image: str | None = None
+    failed_parts: list[str] = Field(default_factory=list, description="生成失败的部分")
+
+
+class JobResponse(BaseModel):
+    """异步任务提交响应"""
+    success: bool
+    message: str
+    job_id: str
+    status: str
+
+
+class JobStatusResponse(BaseModel):
+    """异步任务状态响应"""
+    success: bool
+    message: str
+    job_id: str
+    kind: str
+    status: str = Field(..., description="queued / running / succeeded / failed")
+    result: dict | None = Field(None, description="任务成功时与同步接口相同的响应内容")
+    error: str | None = None
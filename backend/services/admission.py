@@ -0,0 +1,183 @@
+"""
+AI 调用准入控制模块
+
+按模型限制同时进行的 Gemini 调用数，超出部分进入有界的优先级等待队列：
+付费用户优先出队，队列已满或等待超过截止时间时快速拒绝（503 + Retry-After）
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, List
+from services.resilience_settings import get_resilience_settings
+
+logger = logging.getLogger(__name__)
+
+# 优先级：数值越小越先出队
+PRIORITY_PAID = 0
+PRIORITY_NORMAL = 1
+
+# 当前请求的优先级与排队截止时间（time.monotonic()），由 API 层在请求开始时设置
+request_priority: ContextVar[int] = ContextVar("request_priority", default=PRIORITY_NORMAL)
+request_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+class AdmissionRejected(Exception):
+    """AI 服务繁忙，请求被准入控制拒绝"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def get_model_concurrency(model: str) -> int:
+    """
+    获取模型并发上限
+
+    system_config 中 gemini_model_concurrency 为 JSON 对象，如
+    {"gemini-2.5-flash-image": 4, "gemini-2.0-flash": 16}，未列出的模型使用 gemini_default_concurrency
+    """
+    return get_resilience_settings().concurrency(model)
+
+
+class ModelGate:
+    """单个模型的并发闸门与优先级等待队列"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.active = 0
+        # 堆元素：(优先级, 序号, future)
+        self._waiters: List[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def limit(self) -> int:
+        return get_model_concurrency(self.model)
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def has_capacity(self) -> bool:
+        """是否可以立即执行或进入队列"""
+        return self.active < self.limit or self.queued < get_resilience_settings().queue_size
+
+    def retry_after(self) -> int:
+        """根据排队情况估算客户端重试间隔（秒）"""
+        return max(1, min(60, 2 * (self.queued // max(1, self.limit) + 1)))
+
+    async def acquire(self, priority: int, deadline: float | None):
+        """获取一个执行名额，排队超时或队列已满时抛出 AdmissionRejected"""
+        start = time.monotonic()
+        settings = get_resilience_settings()
+        limit = settings.concurrency(self.model)
+        if self.active < limit and not self.queued:
+            self.active += 1
+            self._record_admit(0.0)
+            return
+
+        if self.queued >= settings.queue_size:
+            self.rejected += 1
+            raise AdmissionRejected("AI 服务繁忙，请稍后再试", self.retry_after())
+
+        if deadline is None:
+            deadline = start + settings.queue_timeout_seconds
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await asyncio.wait_for(fut, timeout=max(0.0, deadline - start))
+        except asyncio.TimeoutError:
+            # 超时与移交同时发生时，名额已属于本请求，需要归还
+            if fut.done() and not fut.cancelled():
+                self.release()
+            self.timeouts += 1
+            raise AdmissionRejected("AI 服务排队超时，请稍后再试", self.retry_after())
+        except asyncio.CancelledError:
+            # 名额已经移交给本请求但请求被取消时，归还名额
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+        self._record_admit(time.monotonic() - start)
+
+    def release(self):
+        """归还名额：优先移交给队列中优先级最高的等待者"""
+        if self.active > self.limit:
+            # 并发上限被调低，先收缩执行中的数量
+            self.active -= 1
+            return
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                # 名额直接移交，active 保持不变
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+    def _record_admit(self, waited: float):
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def stats(self) -> Dict[str, int | float | str]:
+        return {
+            "model": self.model,
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 1) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
+
+
+class AdmissionController:
+    """所有 AI 调用的准入控制器，按模型维护闸门"""
+
+    def __init__(self):
+        self._gates: Dict[str, ModelGate] = {}
+
+    def gate(self, model: str) -> ModelGate:
+        gate = self._gates.get(model)
+        if gate is None:
+            gate = ModelGate(model)
+            self._gates[model] = gate
+        return gate
+
+    def ensure_capacity(self, *models: str):
+        """
+        快速检查模型是否还能接收请求
+
+        在扣减魔法值之前调用，队列已满时直接拒绝，不扣费
+        """
+        for model in models:
+            gate = self.gate(model)
+            if not gate.has_capacity():
+                gate.rejected += 1
+                raise AdmissionRejected("AI 服务繁忙，请稍后再试", gate.retry_after())
+
+    @asynccontextmanager
+    async def slot(self, model: str):
+        """在名额内执行一次模型调用"""
+        gate = self.gate(model)
+        await gate.acquire(request_priority.get(), request_deadline.get())
+        try:
+            yield
+        finally:
+            gate.release()
+
+    def stats(self) -> List[Dict[str, int | float | str]]:
+        return [gate.stats() for gate in self._gates.values()]
+
+
+admission_controller = AdmissionController()
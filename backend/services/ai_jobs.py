@@ -0,0 +1,78 @@
+"""
+AI 异步任务模块
+
+定义 mode=async 时写入任务队列的任务类型，负责任务参数的序列化以及在 worker 中的执行
+"""
+import base64
+from typing import Any, Awaitable, Callable, Dict
+from services import gemini_service
+from services.image_service import PreparedImage
+from services.image_output import OutputSpec, render_image
+
+JOB_TRY_ON = "try-on"
+JOB_HAIRSTYLE = "hairstyle"
+
+
+def encode_image(image: PreparedImage) -> Dict[str, Any]:
+    """将预处理后的图片序列化为可写入任务参数的字典"""
+    return {
+        "data": base64.b64encode(image.data).decode("ascii"),
+        "mime_type": image.mime_type,
+        "width": image.width,
+        "height": image.height,
+        "sha256": image.sha256,
+    }
+
+
+def decode_image(data: Dict[str, Any]) -> PreparedImage:
+    return PreparedImage(
+        data=base64.b64decode(data["data"]),
+        mime_type=data["mime_type"],
+        width=data["width"],
+        height=data["height"],
+        sha256=data.get("sha256", ""),
+    )
+
+
+async def hairstyle_response(result: dict, output: OutputSpec, sign: bool = True) -> Dict[str, Any]:
+    """
+    将 generate_hairstyle 的结果按输出规格转换为 HairstyleResponse 的字段
+
+    sign 为 False 时图片以 Blob 引用保存（异步任务结果，查询时再签名）
+    """
+    failed_parts = result.get("failed", [])
+    return {
+        "success": True,
+        "message": "部分内容生成失败，请稍后重试" if failed_parts else "推荐完成",
+        "analysis": result["analysis"],
+        "recommended_image": await render_image(result["recommendedImage"], output, sign) if result["recommendedImage"] else None,
+        "catalog_image": await render_image(result["catalogImage"], output, sign) if result["catalogImage"] else None,
+        "failed_parts": failed_parts,
+    }
+
+
+async def run_try_on_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    image = await gemini_service.generate_try_on_image(
+        face_image=decode_image(payload["face_image"]),
+        item_image=decode_image(payload["item_image"]),
+        height=payload.get("height"),
+        body_type=payload.get("body_type"),
+        try_on_type=payload["try_on_type"]
+    )
+    output = OutputSpec.from_dict(payload.get("output"))
+    return {"success": True, "message": "生成成功", "image": await render_image(image, output, sign=False)}
+
+
+async def run_hairstyle_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    result = await gemini_service.generate_hairstyle(
+        image=decode_image(payload["image"]),
+        gender=payload["gender"],
+        age=payload["age"]
+    )
+    return await hairstyle_response(result, OutputSpec.from_dict(payload.get("output")), sign=False)
+
+
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]] = {
+    JOB_TRY_ON: run_try_on_job,
+    JOB_HAIRSTYLE: run_hairstyle_job,
+}
@@ -0,0 +1,278 @@
+"""
+生成图片 Blob 存储模块
+
+image_delivery 为 url 时，生成的效果图按内容哈希（SHA-256）写入可插拔的 Blob 存储，响应中只返回短期有效的签名 URL，
+由 GET /api/blobs/{key} 提供下载（支持 ETag、Cache-Control 和 Range）。
+
+- local: 本地文件系统（默认，多实例部署时需指向共享目录）
+- s3: S3 兼容的对象存储（AWS S3、MinIO、R2 等，需安装可选依赖 boto3；
+  本地可用 MinIO 作为替身，blob_s3_endpoint 指向 http://127.0.0.1:9000）
+
+图片本身已是压缩格式，写入时再尝试 zlib 压缩，只有能节省 10% 以上时才以压缩形式保存
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import tempfile
+import time
+import logging
+import zlib
+from dataclasses import dataclass
+from services.config_service import get_config
+
+logger = logging.getLogger(__name__)
+
+# S3 兼容存储为可选依赖，未安装时只能使用本地存储
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+    ClientError = Exception
+
+# 文件扩展名 <-> MIME 类型
+CONTENT_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "webp": "image/webp",
+    "gif": "image/gif",
+}
+EXTENSIONS = {mime: ext for ext, mime in CONTENT_TYPES.items()}
+
+# 压缩后的对象在键名后追加该后缀
+COMPRESSED_SUFFIX = ".z"
+# 压缩至少节省的比例
+MIN_COMPRESSION_SAVING = 0.1
+
+DEFAULT_URL_TTL_SECONDS = 3600
+
+
+class BlobSigningUnavailable(RuntimeError):
+    """未配置签名密钥，不能生成或校验签名 URL"""
+
+
+@dataclass(frozen=True)
+class Blob:
+    """读取出的 Blob（已解压）"""
+    key: str
+    data: bytes
+    content_type: str
+
+    @property
+    def etag(self) -> str:
+        # 键名即内容哈希，可直接作为强 ETag
+        return f'"{self.key.split(".", 1)[0]}"'
+
+
+def make_blob_key(data: bytes, content_type: str) -> str:
+    """按内容哈希生成键名：<sha256>.<扩展名>"""
+    return f"{hashlib.sha256(data).hexdigest()}.{EXTENSIONS.get(content_type, 'bin')}"
+
+
+def is_valid_key(key: str) -> bool:
+    digest, _, ext = key.partition(".")
+    return len(digest) == 64 and all(c in "0123456789abcdef" for c in digest) and ext in CONTENT_TYPES
+
+
+def content_type_of(key: str) -> str:
+    return CONTENT_TYPES.get(key.rsplit(".", 1)[-1], "application/octet-stream")
+
+
+def _compress(data: bytes) -> bytes | None:
+    """压缩数据，节省不足 MIN_COMPRESSION_SAVING 时返回 None"""
+    compressed = zlib.compress(data, 6)
+    return compressed if len(compressed) <= len(data) * (1 - MIN_COMPRESSION_SAVING) else None
+
+
+class LocalBlobStore:
+    """本地文件系统存储：<root>/<哈希前两位>/<键名>[.z]"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def exists(self, key: str) -> bool:
+        path = self._path(key)
+        return os.path.exists(path) or os.path.exists(path + COMPRESSED_SUFFIX)
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        compressed = _compress(data)
+        if compressed is not None:
+            path, data = path + COMPRESSED_SUFFIX, compressed
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写唯一的临时文件再原子替换，多个进程或线程并发写入同一内容时不会互相覆盖或读到半个文件
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def get(self, key: str) -> Blob | None:
+        path = self._path(key)
+        for candidate, compressed in ((path, False), (path + COMPRESSED_SUFFIX, True)):
+            try:
+                with open(candidate, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            if compressed:
+                data = zlib.decompress(data)
+            # 读取即续期，purge 只清理长期未访问的对象
+            os.utime(candidate)
+            return Blob(key=key, data=data, content_type=content_type_of(key))
+        return None
+
+    def purge(self, max_age_seconds: float) -> int:
+        """删除超过 max_age_seconds 未写入或访问的对象"""
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+
+class S3BlobStore:
+    """S3 兼容对象存储（对象过期请使用存储桶的生命周期规则）"""
+
+    def __init__(self, bucket: str, endpoint: str = "", region: str = "", access_key: str = "", secret_key: str = ""):
+        if boto3 is None:
+            raise RuntimeError("使用 S3 存储需要安装 boto3")
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint or None,
+            region_name=region or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+        )
+
+    def _head(self, name: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=name)
+            return True
+        except ClientError:
+            return False
+
+    def exists(self, key: str) -> bool:
+        return self._head(key) or self._head(key + COMPRESSED_SUFFIX)
+
+    def put(self, key: str, data: bytes):
+        compressed = _compress(data)
+        if compressed is not None:
+            key, data = key + COMPRESSED_SUFFIX, compressed
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type_of(key.removesuffix(COMPRESSED_SUFFIX)))
+
+    def get(self, key: str) -> Blob | None:
+        for name, compressed in ((key, False), (key + COMPRESSED_SUFFIX, True)):
+            try:
+                data = self.client.get_object(Bucket=self.bucket, Key=name)["Body"].read()
+            except ClientError:
+                continue
+            return Blob(key=key, data=zlib.decompress(data) if compressed else data, content_type=content_type_of(key))
+        return None
+
+    def purge(self, max_age_seconds: float) -> int:
+        return 0
+
+
+_blob_store: LocalBlobStore | S3BlobStore | None = None
+
+
+def get_blob_store() -> LocalBlobStore | S3BlobStore:
+    """按 blob_store 配置（local / s3）获取存储单例"""
+    global _blob_store
+    if _blob_store is None:
+        if get_config("blob_store", "local") == "s3":
+            _blob_store = S3BlobStore(
+                bucket=get_config("blob_s3_bucket", ""),
+                endpoint=get_config("blob_s3_endpoint", ""),
+                region=get_config("blob_s3_region", ""),
+                access_key=get_config("blob_s3_access_key", ""),
+                secret_key=get_config("blob_s3_secret_key", ""),
+            )
+        else:
+            _blob_store = LocalBlobStore(
+                get_config("blob_local_dir", "") or os.path.join(tempfile.gettempdir(), "ai-beauty-blobs")
+            )
+    return _blob_store
+
+
+async def store_blob(data: bytes, content_type: str) -> str:
+    """写入 Blob（内容相同的对象只写一次），返回键名"""
+    key = make_blob_key(data, content_type)
+    store = get_blob_store()
+    if not await asyncio.to_thread(store.exists, key):
+        await asyncio.to_thread(store.put, key, data)
+    return key
+
+
+async def load_blob(key: str) -> Blob | None:
+    return await asyncio.to_thread(get_blob_store().get, key)
+
+
+def _signing_secret() -> str:
+    # 只使用专用密钥，不复用 Supabase 服务密钥等其他凭据
+    return get_config("blob_signing_secret", "")
+
+
+def blob_signing_enabled() -> bool:
+    """是否配置了签名密钥 blob_signing_secret"""
+    return bool(_signing_secret())
+
+
+def _signing_key() -> bytes:
+    """
+    由 blob_signing_secret 派生的 URL 签名密钥
+
+    Raises:
+        BlobSigningUnavailable: 未配置 blob_signing_secret（否则密钥为公开常量，任何人都能伪造 URL）
+    """
+    secret = _signing_secret()
+    if not secret:
+        raise BlobSigningUnavailable("未配置 blob_signing_secret，无法签名图片 URL")
+    return hashlib.sha256(f"blob-url:{secret}".encode("utf-8")).digest()
+
+
+def sign_blob(key: str, expires: int) -> str:
+    return hmac.new(_signing_key(), f"{key}:{expires}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def verify_blob_signature(key: str, expires: int, signature: str) -> bool:
+    """校验签名；未配置签名密钥时一律视为无效"""
+    if expires < time.time() or not blob_signing_enabled():
+        return False
+    return hmac.compare_digest(sign_blob(key, expires), signature)
+
+
+def signed_blob_url(key: str, base_url: str = "") -> str:
+    """
+    生成短期有效的 Blob 下载地址
+
+    Args:
+        base_url: 对外访问的服务地址（blob_public_base_url 优先），为空时返回相对路径
+    """
+    try:
+        ttl = int(get_config("blob_url_ttl_seconds", DEFAULT_URL_TTL_SECONDS))
+    except (TypeError, ValueError):
+        ttl = DEFAULT_URL_TTL_SECONDS
+    expires = int(time.time()) + ttl
+    base = (get_config("blob_public_base_url", "") or base_url).rstrip("/")
+    return f"{base}/api/blobs/{key}?expires={expires}&sig={sign_blob(key, expires)}"
@@ -0,0 +1,173 @@
+"""
+Gemini 熔断器模块
+
+按模型统计最近一段时间内的失败率和慢调用比例：
+- 关闭（closed）：正常放行，超过阈值时打开
+- 打开（open）：直接拒绝（503 + Retry-After），不再等待超时和重试，也不扣减魔法值
+- 半开（half_open）：打开一段时间后放行少量探测请求，成功则关闭，失败则重新打开
+"""
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+from services.admission import AdmissionRejected
+from services.resilience_settings import CircuitBreakerSettings, get_resilience_settings
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+def _settings() -> CircuitBreakerSettings:
+    """熔断阈值（可在 system_config 中以 circuit_breaker_<名称> 覆盖）"""
+    return get_resilience_settings().circuit_breaker
+
+
+class CircuitOpen(AdmissionRejected):
+    """模型熔断中，请求被直接拒绝"""
+
+    def __init__(self, model: str, retry_after: int):
+        super().__init__("AI 服务繁忙，请稍后再试", retry_after)
+        self.model = model
+
+
+class CircuitBreaker:
+    """单个模型的熔断器"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.state = STATE_CLOSED
+        self.opened_at = 0.0
+        self.probes = 0
+        # 滚动窗口：(完成时间, 是否失败, 耗时)
+        self._calls: Deque[Tuple[float, bool, float]] = deque()
+        self.rejected = 0
+        self.trips = 0
+
+    def _trim(self, now: float, settings: CircuitBreakerSettings):
+        window = settings.window_seconds
+        while self._calls and self._calls[0][0] < now - window:
+            self._calls.popleft()
+
+    def _refresh(self, now: float, settings: CircuitBreakerSettings):
+        """打开时间已满则转为半开"""
+        if self.state == STATE_OPEN and now - self.opened_at >= settings.open_seconds:
+            self.state = STATE_HALF_OPEN
+            self.probes = 0
+            logger.info(f"Circuit breaker for {self.model} half-open, probing")
+
+    def is_open(self) -> bool:
+        self._refresh(time.monotonic(), _settings())
+        return self.state == STATE_OPEN
+
+    def retry_after(self, settings: CircuitBreakerSettings | None = None) -> int:
+        if self.state != STATE_OPEN:
+            return 1
+        settings = settings or _settings()
+        remaining = settings.open_seconds - (time.monotonic() - self.opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def check(self):
+        """
+        快速检查是否可以发起请求（不占用探测名额），在扣减魔法值之前调用
+
+        Raises:
+            CircuitOpen: 熔断器打开，或半开状态下探测名额已用完
+        """
+        settings = _settings()
+        self._refresh(time.monotonic(), settings)
+        if self.state == STATE_OPEN or (
+            self.state == STATE_HALF_OPEN and self.probes >= settings.half_open_probes
+        ):
+            self.rejected += 1
+            raise CircuitOpen(self.model, self.retry_after(settings))
+
+    def acquire(self):
+        """发起一次调用前调用；半开状态下占用一个探测名额"""
+        self.check()
+        if self.state == STATE_HALF_OPEN:
+            self.probes += 1
+
+    def record(self, failed: bool, latency: float):
+        """记录一次调用结果，并根据结果转换状态"""
+        now = time.monotonic()
+        settings = _settings()
+        slow_threshold = settings.slow_call_seconds
+        slow = latency >= slow_threshold
+
+        if self.state == STATE_HALF_OPEN:
+            self.probes = max(0, self.probes - 1)
+            if failed or slow:
+                self._open(now, "probe failed")
+            else:
+                self.state = STATE_CLOSED
+                self._calls.clear()
+                logger.info(f"Circuit breaker for {self.model} closed")
+            return
+
+        self._calls.append((now, failed, latency))
+        if self.state != STATE_CLOSED:
+            return
+        self._trim(now, settings)
+        total = len(self._calls)
+        if total < settings.min_requests:
+            return
+        errors = sum(1 for _, f, _ in self._calls if f)
+        slow_calls = sum(1 for _, _, l in self._calls if l >= slow_threshold)
+        if errors / total >= settings.error_rate:
+            self._open(now, f"error rate {errors}/{total}")
+        elif slow_calls / total >= settings.slow_call_rate:
+            self._open(now, f"slow calls {slow_calls}/{total}")
+
+    def release(self):
+        """调用未产生可判定的结果（如被取消、客户端错误）时归还探测名额"""
+        if self.state == STATE_HALF_OPEN:
+            self.probes = max(0, self.probes - 1)
+
+    def _open(self, now: float, reason: str):
+        self.state = STATE_OPEN
+        self.opened_at = now
+        self.probes = 0
+        self.trips += 1
+        logger.warning(f"Circuit breaker for {self.model} opened: {reason}")
+
+    def stats(self) -> Dict[str, int | float | str]:
+        now = time.monotonic()
+        settings = _settings()
+        self._refresh(now, settings)
+        self._trim(now, settings)
+        total = len(self._calls)
+        errors = sum(1 for _, f, _ in self._calls if f)
+        latencies = [l for _, _, l in self._calls]
+        return {
+            "model": self.model,
+            "state": self.state,
+            "retry_after_s": self.retry_after(settings) if self.state == STATE_OPEN else 0,
+            "window_calls": total,
+            "error_rate": round(errors / total, 3) if total else 0.0,
+            "avg_latency_ms": round(sum(latencies) / total * 1000, 1) if total else 0.0,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreakerRegistry:
+    """按模型管理熔断器"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, model: str) -> CircuitBreaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker(model)
+            self._breakers[model] = breaker
+        return breaker
+
+    def stats(self) -> List[Dict[str, int | float | str]]:
+        return [breaker.stats() for breaker in self._breakers.values()]
+
+
+circuit_breakers = CircuitBreakerRegistry()
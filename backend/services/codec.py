@@ -0,0 +1,38 @@
+"""
+图片载荷编解码模块
+
+实现位于仓库根目录的 api/_codec.py（仅依赖标准库），由后端与 Serverless 函数共用，
+这里按文件路径加载并导出，保证两端解析 data URL、识别格式、解码和协商二进制响应的行为一致
+"""
+import importlib.util
+import os
+import sys
+
+# 与 Serverless 函数共用的模块所在目录（仓库根目录的 api/）
+SHARED_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "api"
+)
+
+
+def load_shared_module(name: str):
+    """按文件路径加载 api/<name>.py，并以 name 注册到 sys.modules（共享模块之间按该名称相互导入）"""
+    module = sys.modules.get(name)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(SHARED_DIR, f"{name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+_codec = load_shared_module("_codec")
+
+ImageCodecError = _codec.ImageCodecError
+ImageTooLargeError = _codec.ImageTooLargeError
+ImagePayload = _codec.ImagePayload
+parse_data_url = _codec.parse_data_url
+sniff_image = _codec.sniff_image
+decode_image = _codec.decode_image
+sniff_base64_mime = _codec.sniff_base64_mime
+prefers_binary = _codec.prefers_binary
+encode_multipart_mixed = _codec.encode_multipart_mixed
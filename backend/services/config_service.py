@@ -4,6 +4,7 @@
 提供从数据库动态加载配置的功能，并支持环境变量回退
 """
 import logging
+import time
 from functools import lru_cache
 from typing import Any, Dict
 from config import get_settings
@@ -11,33 +12,48 @@ from services.supabase_client import get_supabase_client
 
 logger = logging.getLogger(__name__)
 
+# 读取 system_config 失败后，间隔多久再重试（秒），期间使用环境变量
+FETCH_RETRY_SECONDS = 30
+
+
 class ConfigService:
     _config_cache: Dict[str, str] = {}
-    _last_fetch_time = 0
+    # 是否已成功读取过（表为空同样算作已读取，不再反复查询）
+    _loaded = False
+    _last_fetch_time = 0.0
+    # 配置生成号：每次重新读取或清除缓存时递增，供派生的配置快照判断是否失效
+    _generation = 0
 
     @classmethod
     def clear_cache(cls):
         """清除配置缓存，确保下次获取时从数据库读取最新值"""
         cls._config_cache = {}
+        cls._loaded = False
+        cls._last_fetch_time = 0.0
+        cls._generation += 1
 
     @classmethod
     def get_all_config(cls, force_refresh: bool = False) -> Dict[str, str]:
         """
         获取所有动态配置项
+
+        读取结果（包括空表）缓存到 clear_cache() 为止；读取失败时 FETCH_RETRY_SECONDS 内不再重试，
+        避免每次读取配置都阻塞在一次数据库查询上
         """
-        # 简单缓存逻辑，实际生产环境可增加 TTL
-        if not cls._config_cache or force_refresh:
-            try:
-                supabase = get_supabase_client()
-                res = supabase.table("system_config").select("key", "value").execute()
-                if res.data:
-                    cls._config_cache = {item["key"]: item["value"] for item in res.data}
-                else:
-                    cls._config_cache = {}
-            except Exception as e:
-                logger.error(f"Failed to fetch system config: {str(e)}")
-                # 如果数据库查询失败，确保返回空字典而不是报错
-                return {}
+        if cls._loaded and not force_refresh:
+            return cls._config_cache
+        now = time.monotonic()
+        if not force_refresh and cls._last_fetch_time and now - cls._last_fetch_time < FETCH_RETRY_SECONDS:
+            return cls._config_cache
+        cls._last_fetch_time = now
+        try:
+            supabase = get_supabase_client()
+            res = supabase.table("system_config").select("key", "value").execute()
+            cls._config_cache = {item["key"]: item["value"] for item in res.data or []}
+            cls._loaded = True
+            cls._generation += 1
+        except Exception as e:
+            logger.error(f"Failed to fetch system config: {str(e)}")
         return cls._config_cache
 
     @classmethod
@@ -64,3 +80,16 @@ def get_config(key: str, default: Any = None) -> Any:
 def clear_config_cache():
     """清除配置缓存"""
     ConfigService.clear_cache()
+
+def refresh_config() -> Dict[str, str]:
+    """
+    重新读取 system_config（同步阻塞调用）
+
+    与 clear_config_cache() 不同，读取期间及读取失败时继续使用旧值；
+    长期运行的 worker 进程据此定期拉取管理后台修改的配置
+    """
+    return ConfigService.get_all_config(force_refresh=True)
+
+def config_generation() -> int:
+    """当前配置生成号，配置重新读取或缓存被清除后变化"""
+    return ConfigService._generation
@@ -0,0 +1,34 @@
+"""
+魔法值服务模块
+
+生成失败时退还已扣减的魔法值；API 进程（批量试穿部分失败）与 worker 进程（异步任务失败）共用
+"""
+import logging
+from services.supabase_client import get_supabase_client
+
+logger = logging.getLogger(__name__)
+
+
+def refund_credits(user_id: str, amount: int = 1) -> int | None:
+    """
+    退还魔法值（同步阻塞调用，在事件循环中应通过 asyncio.to_thread 调用）
+
+    退还失败只记录日志，不影响原有的错误响应
+
+    Returns:
+        退还后的魔法值，未退还时返回 None
+    """
+    if amount <= 0:
+        return None
+    try:
+        supabase = get_supabase_client()
+        res = supabase.table("user_profiles").select("credits").eq("id", user_id).execute()
+        if not res.data:
+            return None
+        new_credits = res.data[0]["credits"] + amount
+        supabase.table("user_profiles").update({"credits": new_credits}).eq("id", user_id).execute()
+    except Exception as e:
+        logger.error(f"Failed to refund {amount} credits to user {user_id}: {e}")
+        return None
+    logger.info(f"Refunded {amount} credits to user {user_id}")
+    return new_credits
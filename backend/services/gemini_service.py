@@ -3,54 +3,435 @@ Gemini AI 服务模块
 
 封装所有与 Google Gemini API 的交互逻辑
 """
-import google.generativeai as genai
 import base64
 import asyncio
-from google.api_core import exceptions
-from config import get_settings
-from services.config_service import get_config
+import json
+import logging
+import time
+from typing import AsyncIterator, Dict, Tuple
+from google import genai
+from google.genai import types, errors
+from services.admission import admission_controller, request_deadline
+from services.rate_limiter import rate_limiter, estimate_tokens, QuotaLimiter
+from services.key_pool import key_pool, KeyState
+from services.image_service import PreparedImage
+from services.result_cache import get_analyze_cache, get_image_cache, make_cache_key
+from services.single_flight import SingleFlight
+from services.retry_policy import RetryPolicy, RETRYABLE_EXCEPTIONS, retry_budget
+from services.circuit_breaker import circuit_breakers, CircuitOpen
+from services.admission import AdmissionRejected
+from services.model_router import model_router, get_route
+from services.metrics import (
+    gemini_call_duration_seconds, gemini_rate_limited_total, gemini_retries_total, gemini_failovers_total
+)
 
+logger = logging.getLogger(__name__)
 
-def get_gemini_client():
-    """初始化并返回 Gemini 客户端"""
-    # 优先从数据库动态配置获取 API Key
-    api_key = get_config("gemini_api_key")
-    genai.configure(api_key=api_key)
-    return genai
+# 各功能使用的模型由 model_router 按 system_config 中的候选链选择
+# 修改中医/面相分析提示词时需同步递增版本号，使旧缓存失效
+TCM_PROMPT_VERSION = "1"
 
+# 修改试穿/发型提示词时需同步递增版本号
+IMAGE_PROMPT_VERSION = "1"
 
-async def call_gemini_with_retry(model, contents, generation_config=None, max_retries=3):
+# 各调用点的重试策略：文本分析响应快，图像生成单次耗时长，给予更长的超时和总预算
+TEXT_RETRY_POLICY = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=8.0, deadline=45.0, attempt_timeout=30.0)
+IMAGE_RETRY_POLICY = RetryPolicy(max_attempts=3, base_delay=2.0, max_delay=16.0, deadline=120.0, attempt_timeout=90.0)
+
+# 所有 AI 生成共用的单飞（single-flight）合并器，键与结果缓存键相同
+ai_single_flight = SingleFlight("ai")
+
+
+class GeminiModel:
+    """
+    绑定客户端、模型名称和系统指令的模型对象
+    
+    由 GeminiClientRegistry 创建并在请求之间共享，不应在请求中直接实例化
+    """
+    
+    def __init__(self, client: genai.Client, api_key: str, name: str, system_instruction: str | None = None):
+        self.client = client
+        self.api_key = api_key
+        self.name = name
+        self.system_instruction = system_instruction
+        self._base_config = (
+            types.GenerateContentConfig(system_instruction=system_instruction)
+            if system_instruction else None
+        )
+    
+    def build_config(self, generation_config: dict | None = None) -> types.GenerateContentConfig | None:
+        """合并系统指令与本次调用的生成参数"""
+        if not generation_config:
+            return self._base_config
+        return types.GenerateContentConfig(
+            system_instruction=self.system_instruction,
+            **generation_config
+        )
+    
+    async def generate_content(self, contents, generation_config: dict | None = None):
+        """使用原生异步客户端生成内容"""
+        return await self.client.aio.models.generate_content(
+            model=self.name,
+            contents=contents,
+            config=self.build_config(generation_config)
+        )
+    
+    async def generate_content_stream(self, contents, generation_config: dict | None = None):
+        """流式生成内容，返回按片段产出响应的异步迭代器"""
+        return await self.client.aio.models.generate_content_stream(
+            model=self.name,
+            contents=contents,
+            config=self.build_config(generation_config)
+        )
+
+
+class GeminiClientRegistry:
+    """
+    Gemini 客户端/模型注册表
+    
+    客户端按 API Key 缓存，模型按 (API Key, 模型名称, 系统指令) 缓存，
+    每个对象只构建一次并在请求之间共享。管理员更新 API Key 后调用 reset() 重建。
+    """
+    _clients: Dict[str, genai.Client] = {}
+    _models: Dict[Tuple[str, str, str | None], GeminiModel] = {}
+    
+    @classmethod
+    def get_client(cls, api_key: str) -> genai.Client:
+        """获取指定 API Key 对应的客户端"""
+        client = cls._clients.get(api_key)
+        if client is None:
+            client = genai.Client(api_key=api_key)
+            cls._clients[api_key] = client
+        return client
+    
+    @classmethod
+    def get_model(cls, api_key: str, name: str, system_instruction: str | None = None) -> GeminiModel:
+        """获取指定 API Key、模型名称和系统指令对应的模型对象"""
+        key = (api_key, name, system_instruction)
+        model = cls._models.get(key)
+        if model is None:
+            model = GeminiModel(cls.get_client(api_key), api_key, name, system_instruction)
+            cls._models[key] = model
+        return model
+    
+    @classmethod
+    def reset(cls):
+        """清空所有已缓存的客户端和模型"""
+        cls._clients = {}
+        cls._models = {}
+
+
+def get_gemini_client() -> genai.Client:
+    """返回 Key 池中默认可用 Key 对应的共享 Gemini 客户端"""
+    return GeminiClientRegistry.get_client(key_pool.default_key())
+
+
+def get_gemini_model(name: str, system_instruction: str | None = None) -> GeminiModel:
+    """
+    获取共享模型对象
+    
+    返回对象绑定的 API Key 仅作为默认值，call_gemini_with_retry 每次尝试都会从 Key 池重新选择
+    """
+    return GeminiClientRegistry.get_model(key_pool.default_key(), name, system_instruction)
+
+
+def reset_gemini_clients():
+    """清空客户端缓存，API Key 变更后调用"""
+    GeminiClientRegistry.reset()
+
+
+def build_image_part(image: PreparedImage) -> types.Part:
+    """将预处理后的图片构建为 Gemini 请求中的图片部分"""
+    return types.Part.from_bytes(data=image.data, mime_type=image.mime_type)
+
+
+def build_contents(contents: list) -> list:
+    """将请求内容中的 PreparedImage 转换为 Gemini 图片部分，其余原样保留"""
+    return [build_image_part(item) if isinstance(item, PreparedImage) else item for item in contents]
+
+
+def extract_image(response) -> str:
+    """从响应中提取图片 base64，未生成图片时返回空字符串"""
+    if not response.candidates or not response.candidates[0].content:
+        return ""
+    for part in response.candidates[0].content.parts or []:
+        if part.inline_data and part.inline_data.data:
+            data = part.inline_data.data
+            # 如果是 bytes，转换为 base64 字符串
+            if isinstance(data, bytes):
+                return base64.b64encode(data).decode('utf-8')
+            return str(data)
+    return ""
+
+
+def _attempt_timeout(policy: RetryPolicy, deadline: float | None) -> float | None:
+    """单次尝试的超时：取策略超时与剩余时间预算中较小者"""
+    timeout = policy.attempt_timeout
+    if deadline is not None:
+        remaining = max(0.0, deadline - time.monotonic())
+        timeout = remaining if timeout is None else min(timeout, remaining)
+    return timeout
+
+
+def _is_model_failure(e: BaseException) -> bool:
+    """是否为模型侧故障（计入熔断统计）：5xx、超时、连接错误；429 和其他客户端错误不计入"""
+    if isinstance(e, errors.APIError):
+        return e.code is not None and (e.code >= 500 or e.code == 408)
+    return isinstance(e, RETRYABLE_EXCEPTIONS)
+
+
+def _record_success(model_name: str, key_state: KeyState, limiter: QuotaLimiter, latency: float):
+    """记录一次成功调用（熔断器、模型路由、配额节流、Key 池、运行指标）"""
+    gemini_call_duration_seconds.observe(latency, model_name, "ok")
+    circuit_breakers.get(model_name).record(failed=False, latency=latency)
+    model_router.record(model_name, failed=False, latency=latency)
+    limiter.on_success()
+    key_pool.report_success(key_state)
+
+
+def _record_failure(
+    e: BaseException,
+    model_name: str,
+    key_state: KeyState,
+    limiter: QuotaLimiter,
+    started: float | None
+):
+    """记录一次失败调用，模型侧故障计入熔断与路由统计，其余只归还熔断探测名额"""
+    breaker = circuit_breakers.get(model_name)
+    latency = time.monotonic() - started if started else 0.0
+    if _is_model_failure(e):
+        breaker.record(failed=True, latency=latency)
+        model_router.record(model_name, failed=True, latency=latency)
+    else:
+        breaker.release()
+    
+    code = getattr(e, "code", None)
+    if started:
+        gemini_call_duration_seconds.observe(latency, model_name, str(code) if code else type(e).__name__)
+    if code == 429:
+        gemini_rate_limited_total.inc(model_name)
+        # 主动节流后仍被限流，说明预算偏高，自动下调
+        limiter.on_throttled()
+        key_pool.report_throttled(key_state)
+    elif code in (401, 403):
+        key_pool.report_auth_error(key_state)
+    else:
+        key_pool.report_error(key_state)
+
+
+async def call_gemini_with_retry(
+    model: GeminiModel,
+    contents: list,
+    generation_config: dict | None = None,
+    policy: RetryPolicy | None = None
+):
     """
     带重试机制的 Gemini API 调用
-    支持指数退避处理 429 错误
+    
+    使用 google-genai 的原生异步客户端（client.aio），等待网络响应期间
+    不占用线程池线程，并发请求数不再受默认线程池大小限制。
+    每次尝试从 Key 池中选择 API Key，发出请求前按 (模型, API Key) 的 RPM/TPM 预算节流；
+    某个 Key 返回 429 或鉴权错误时剔除该 Key，并立即换用其他 Key 重试。
+    其余可重试错误（5xx、超时、连接重置）按 policy 全抖动退避，服务端给出重试间隔时以其为准；
+    所有重试不会超出 policy.deadline，并受进程级重试预算限制。
+    模型熔断时直接抛出 CircuitOpen，不再等待超时。
+    contents 中的图片可直接传 PreparedImage。
     """
-    for attempt in range(max_retries):
+    policy = policy or TEXT_RETRY_POLICY
+    deadline = time.monotonic() + policy.deadline if policy.deadline else None
+    estimated_tokens = estimate_tokens(contents)
+    request_contents = build_contents(contents)
+    failed_keys: set[str] = set()
+    breaker = circuit_breakers.get(model.name)
+    retry_budget.record_request()
+    
+    for attempt in range(policy.max_attempts):
+        breaker.acquire()
+        key_state = None
+        limiter = None
+        started = None
         try:
-            if generation_config:
-                return await asyncio.to_thread(
-                    model.generate_content,
-                    contents=contents,
-                    generation_config=generation_config
+            # 选 Key 失败（如未配置任何 Key）时同样需要归还半开探测名额，因此放在 try 内
+            key_state = key_pool.select(model.name, exclude=failed_keys)
+            attempt_model = GeminiClientRegistry.get_model(key_state.key, model.name, model.system_instruction)
+            limiter = rate_limiter.get(model.name, key_state.key)
+            await rate_limiter.pace(model.name, key_state.key, estimated_tokens, request_deadline.get())
+            # 每次尝试都需通过准入控制，重试等待期间不占用名额
+            async with admission_controller.slot(model.name):
+                started = time.monotonic()
+                response = await asyncio.wait_for(
+                    attempt_model.generate_content(request_contents, generation_config),
+                    timeout=_attempt_timeout(policy, deadline)
                 )
-            else:
-                return await asyncio.to_thread(
-                    model.generate_content,
-                    contents=contents
-                )
-        except exceptions.ResourceExhausted:
-            if attempt == max_retries - 1:
+            _record_success(model.name, key_state, limiter, time.monotonic() - started)
+            return response
+        except (errors.APIError, *RETRYABLE_EXCEPTIONS) as e:
+            if key_state is None:
+                breaker.release()
+                raise
+            code = getattr(e, "code", None)
+            _record_failure(e, model.name, key_state, limiter, started)
+            
+            key_failure = code in (429, 401, 403)
+            if key_failure:
+                failed_keys.add(key_state.key)
+            switch_key = key_failure and key_pool.has_alternative(failed_keys)
+            
+            # 鉴权错误只有在能换 Key 时才重试
+            retryable = switch_key if code in (401, 403) else policy.is_retryable(e)
+            if not retryable or attempt == policy.max_attempts - 1:
+                raise
+            
+            # 还有其他可用 Key 时立即换 Key 重试，否则退避等待
+            delay = 0.0 if switch_key else policy.next_delay(attempt, e)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                logger.warning(f"Gemini {model.name} retry skipped: deadline exhausted")
+                raise
+            if not retry_budget.try_acquire():
+                logger.warning(f"Gemini {model.name} retry skipped: retry budget exhausted")
+                raise
+            
+            logger.warning(
+                f"Gemini {model.name} failed ({code or type(e).__name__}) with key {key_state.name}, "
+                f"retrying in {delay:.1f}s (attempt {attempt + 2}/{policy.max_attempts})"
+            )
+            gemini_retries_total.inc(model.name, "switch_key" if switch_key else "backoff")
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            # 排队被拒、请求取消等情况不计入熔断统计
+            breaker.release()
+            raise
+
+
+def _should_failover(e: BaseException) -> bool:
+    """调用失败后是否换用候选链中的下一个模型"""
+    if isinstance(e, AdmissionRejected):
+        # 熔断、排队已满或配额不足
+        return True
+    if isinstance(e, errors.APIError):
+        # 模型故障、限流，或模型不存在/已下线
+        return _is_model_failure(e) or e.code in (404, 429)
+    return isinstance(e, RETRYABLE_EXCEPTIONS)
+
+
+def try_on_feature(try_on_type: str) -> str:
+    """试穿类型对应的路由功能名"""
+    return "try-on" if try_on_type == "clothing" else "accessory"
+
+
+def route_signature(feature: str) -> str:
+    """功能的候选模型链，用于结果缓存键（修改候选链后旧缓存自动失效）"""
+    return ",".join(get_route(feature))
+
+
+async def call_gemini_routed(
+    feature: str,
+    contents: list,
+    generation_config: dict | None = None,
+    system_instruction: str | None = None,
+    policy: RetryPolicy | None = None
+):
+    """
+    按功能的候选模型链调用 Gemini
+    
+    模型顺序由 model_router 根据最近的延迟和失败率决定；当前模型熔断、限流、
+    出现服务端故障或不存在时，自动切换到下一个候选模型
+    
+    Args:
+        feature: 功能名称，如 "try-on", "tongue", "hairstyle-image"
+    """
+    candidates = model_router.rank(feature)
+    last_error: BaseException | None = None
+    for index, name in enumerate(candidates):
+        model = get_gemini_model(name, system_instruction=system_instruction)
+        try:
+            return await call_gemini_with_retry(model, contents, generation_config, policy)
+        except Exception as e:
+            if not _should_failover(e) or index == len(candidates) - 1:
+                raise
+            last_error = e
+            gemini_failovers_total.inc(feature, name)
+            logger.warning(f"Gemini {name} unavailable for {feature} ({e}), failing over to {candidates[index + 1]}")
+    raise last_error or ValueError(f"未配置 {feature} 的候选模型")
+
+
+async def stream_gemini_routed(
+    feature: str,
+    contents: list,
+    generation_config: dict | None = None,
+    system_instruction: str | None = None,
+    policy: RetryPolicy | None = None
+) -> AsyncIterator[str]:
+    """
+    按功能的候选模型链流式调用 Gemini，逐段产出文本
+    
+    第一段文本产出之前失败时切换到下一个候选模型；已经产出内容后不再重试，错误直接抛出。
+    准入名额在整个流式输出期间保持占用，两段之间的等待时间不超过 policy.attempt_timeout
+    """
+    policy = policy or TEXT_RETRY_POLICY
+    candidates = model_router.rank(feature)
+    estimated_tokens = estimate_tokens(contents)
+    request_contents = build_contents(contents)
+    
+    for index, name in enumerate(candidates):
+        breaker = circuit_breakers.get(name)
+        key_state = None
+        limiter = None
+        started = None
+        emitted = False
+        try:
+            breaker.acquire()
+        except CircuitOpen:
+            if index == len(candidates) - 1:
                 raise
-            wait_time = (attempt + 1) * 2  # 2s, 4s
-            print(f"Gemini API 429 频率受限，{wait_time}秒后重试第 {attempt + 1} 次...")
-            await asyncio.sleep(wait_time)
+            gemini_failovers_total.inc(feature, name)
+            continue
+        try:
+            key_state = key_pool.select(name)
+            model = GeminiClientRegistry.get_model(key_state.key, name, system_instruction)
+            limiter = rate_limiter.get(name, key_state.key)
+            await rate_limiter.pace(name, key_state.key, estimated_tokens, request_deadline.get())
+            async with admission_controller.slot(name):
+                started = time.monotonic()
+                stream = await asyncio.wait_for(
+                    model.generate_content_stream(request_contents, generation_config),
+                    timeout=policy.attempt_timeout
+                )
+                iterator = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(iterator.__anext__(), timeout=policy.attempt_timeout)
+                    except StopAsyncIteration:
+                        break
+                    if chunk.text:
+                        emitted = True
+                        yield chunk.text
+            _record_success(name, key_state, limiter, time.monotonic() - started)
+            return
         except Exception as e:
-            # 其他错误不重试，直接抛出
-            raise e
+            if key_state is not None and isinstance(e, (errors.APIError, *RETRYABLE_EXCEPTIONS)):
+                _record_failure(e, name, key_state, limiter, started)
+            else:
+                breaker.release()
+            if emitted or not _should_failover(e) or index == len(candidates) - 1:
+                raise
+            gemini_failovers_total.inc(feature, name)
+            logger.warning(f"Gemini {name} stream unavailable for {feature} ({e}), failing over to {candidates[index + 1]}")
+        except BaseException:
+            # 客户端断开等导致生成器被关闭
+            breaker.release()
+            raise
+
+
+def _image_digest(image: PreparedImage) -> str | bytes:
+    """缓存键中的图片部分：优先使用预处理时算好的哈希，不再重复哈希整张图片"""
+    return image.sha256 or image.data
 
 
 async def generate_try_on_image(
-    face_image_base64: str,
-    item_image_base64: str,
+    face_image: PreparedImage,
+    item_image: PreparedImage,
     height: int | None = None,
     body_type: str | None = None,
     try_on_type: str = "clothing"
@@ -59,8 +440,8 @@ async def generate_try_on_image(
     生成试穿/试戴效果图
     
     Args:
-        face_image_base64: 人物照片的 base64 编码
-        item_image_base64: 服装/配饰照片的 base64 编码
+        face_image: 预处理后的人物照片
+        item_image: 预处理后的服装/配饰照片
         height: 身高（仅云试衣需要）
         body_type: 体型（仅云试衣需要）
         try_on_type: 类型，"clothing" 或 "accessory"
@@ -68,23 +449,34 @@ async def generate_try_on_image(
     Returns:
         生成图片的 base64 编码
     """
-    get_gemini_client()
-    
-    # 构建图片部分
-    face_part = {
-        "inline_data": {
-            "mime_type": "image/jpeg",
-            "data": face_image_base64
-        }
-    }
+    # 相同输入图片和参数直接返回缓存的生成结果
+    cache = get_image_cache()
+    cache_key = make_cache_key(
+        "try-on", _image_digest(face_image), _image_digest(item_image),
+        str(height), str(body_type), try_on_type,
+        route_signature(try_on_feature(try_on_type)), IMAGE_PROMPT_VERSION
+    )
+    cached = await cache.get(cache_key)
+    if cached is not None:
+        return cached.decode("ascii")
     
-    item_part = {
-        "inline_data": {
-            "mime_type": "image/jpeg",
-            "data": item_image_base64
-        }
-    }
+    async def generate() -> str:
+        image = await _generate_try_on_image(face_image, item_image, height, body_type, try_on_type)
+        await cache.set(cache_key, image.encode("ascii"))
+        return image
     
+    # 相同输入的并发请求（重复点击、前端重试）共享同一次上游调用
+    return await ai_single_flight.do(cache_key, generate)
+
+
+async def _generate_try_on_image(
+    face_image: PreparedImage,
+    item_image: PreparedImage,
+    height: int | None,
+    body_type: str | None,
+    try_on_type: str
+) -> str:
+    """调用 Gemini 生成试穿/试戴效果图（不经过缓存）"""
     # 构建提示词
     if try_on_type == "clothing":
         prompt = f"""生成一张高度写实的全身或半身照片。
@@ -102,47 +494,106 @@ async def generate_try_on_image(
         保持五官特征和肤色真实。输出必须是佩戴耳饰后的效果图。"""
     
     # 调用 Gemini API
-    model = genai.GenerativeModel("gemini-2.5-flash-image")
-    response = await call_gemini_with_retry(
-        model=model,
-        contents=[face_part, item_part, prompt]
+    response = await call_gemini_routed(
+        try_on_feature(try_on_type),
+        contents=[face_image, item_image, prompt],
+        policy=IMAGE_RETRY_POLICY
     )
     
     # 提取图片
-    for part in response.parts:
-        if hasattr(part, "inline_data") and part.inline_data:
-            data = part.inline_data.data
-            if isinstance(data, bytes):
-                return base64.b64encode(data).decode('utf-8')
-            return str(data)
+    image = extract_image(response)
+    if image:
+        return image
     
     raise ValueError("AI 未能生成有效的图像")
 
 
+TCM_FALLBACK_TEXT = "AI 暂时无法给出分析结果，请稍后再试。"
+
+
+def _tcm_cache_key(image: PreparedImage, analysis_type: str) -> str:
+    """相同图片 + 分析类型 + 候选模型 + 提示词版本共享缓存结果"""
+    return make_cache_key(_image_digest(image), analysis_type, route_signature(analysis_type), TCM_PROMPT_VERSION)
+
+
 async def analyze_tcm(
-    image_base64: str,
+    image: PreparedImage,
     analysis_type: str
 ) -> str:
     """
     中医/面相分析
     
     Args:
-        image_base64: 图片的 base64 编码
+        image: 预处理后的图片
         analysis_type: 分析类型 - "tongue", "face-analysis", "face-reading"
     
     Returns:
         分析结果文本
     """
-    get_gemini_client()
+    cache = get_analyze_cache()
+    cache_key = _tcm_cache_key(image, analysis_type)
+    cached = await cache.get(cache_key)
+    if cached is not None:
+        return cached
     
-    image_part = {
-        "inline_data": {
-            "mime_type": "image/jpeg",
-            "data": image_base64
-        }
-    }
+    async def generate() -> str:
+        text = await _analyze_tcm(image, analysis_type)
+        if text:
+            await cache.set(cache_key, text)
+        return text
+    
+    text = await ai_single_flight.do(cache_key, generate)
+    return text or TCM_FALLBACK_TEXT
+
+
+async def stream_analyze_tcm(image: PreparedImage, analysis_type: str) -> AsyncIterator[str]:
+    """
+    流式中医/面相分析，逐段产出文本
+    
+    命中缓存时一次产出完整结果；完整生成后写入与 analyze_tcm 相同的缓存
+    """
+    cache = get_analyze_cache()
+    cache_key = _tcm_cache_key(image, analysis_type)
+    cached = await cache.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+    
+    system_instruction, prompt = _build_tcm_prompt(analysis_type)
+    parts = []
+    async for text in stream_gemini_routed(
+        analysis_type,
+        contents=[image, prompt],
+        generation_config={"temperature": 0.7},
+        system_instruction=system_instruction,
+        policy=TEXT_RETRY_POLICY
+    ):
+        parts.append(text)
+        yield text
+    
+    if parts:
+        await cache.set(cache_key, "".join(parts))
+    else:
+        yield TCM_FALLBACK_TEXT
+
+
+async def _analyze_tcm(image: PreparedImage, analysis_type: str) -> str:
+    """调用 Gemini 进行中医/面相分析（不经过缓存），未返回文本时为空字符串"""
+    system_instruction, prompt = _build_tcm_prompt(analysis_type)
+    
+    response = await call_gemini_routed(
+        analysis_type,
+        contents=[image, prompt],
+        generation_config={"temperature": 0.7},
+        system_instruction=system_instruction,
+        policy=TEXT_RETRY_POLICY
+    )
     
-    # 根据类型构建系统指令和提示词
+    return response.text or ""
+
+
+def _build_tcm_prompt(analysis_type: str) -> Tuple[str, str]:
+    """根据分析类型构建 (系统指令, 提示词)"""
     system_instruction = "你是一位拥有深厚底蕴的中医及传统文化学者。"
     
     if analysis_type == "tongue":
@@ -170,22 +621,21 @@ async def analyze_tcm(
         4. 命运总括：结合整体面部比例，对其人生大势给出一个富有哲学智慧的总结，并给出一些正向的人生指导建议。
         请用中文分段回复，语气庄重、富有智慧，且需明确说明分析仅供参考。"""
     
-    model = genai.GenerativeModel(
-        "gemini-2.0-flash",
-        system_instruction=system_instruction
-    )
-    
-    response = await call_gemini_with_retry(
-        model=model,
-        contents=[image_part, prompt],
-        generation_config={"temperature": 0.7}
+    return system_instruction, prompt
+
+
+HAIRSTYLE_PARTS = ("analysis", "recommended_image", "catalog_image")
+
+
+def _hairstyle_cache_key(image: PreparedImage, gender: str, age: int) -> str:
+    return make_cache_key(
+        "hairstyle", _image_digest(image), gender, str(age),
+        route_signature("hairstyle-analysis"), route_signature("hairstyle-image"), IMAGE_PROMPT_VERSION
     )
-    
-    return response.text or "AI 暂时无法给出分析结果，请稍后再试。"
 
 
 async def generate_hairstyle(
-    image_base64: str,
+    image: PreparedImage,
     gender: str,
     age: int
 ) -> dict:
@@ -193,22 +643,76 @@ async def generate_hairstyle(
     发型推荐
     
     Args:
-        image_base64: 人物照片的 base64 编码
+        image: 预处理后的人物照片
         gender: 性别 - "男" 或 "女"
         age: 年龄
     
     Returns:
-        包含分析文本和生成图片的字典
+        包含分析文本和生成图片的字典，failed 列出生成失败的部分
     """
-    get_gemini_client()
+    # 相同输入图片和参数直接返回缓存的生成结果
+    cache = get_image_cache()
+    cache_key = _hairstyle_cache_key(image, gender, age)
+    cached = await cache.get(cache_key)
+    if cached is not None:
+        return json.loads(cached)
+    
+    async def generate() -> dict:
+        result = await _generate_hairstyle(image, gender, age)
+        # 只缓存完整结果，部分失败的结果在重试时重新生成
+        if not result["failed"]:
+            await cache.set(cache_key, json.dumps(result).encode("utf-8"))
+        return result
     
-    image_part = {
-        "inline_data": {
-            "mime_type": "image/jpeg",
-            "data": image_base64
-        }
+    return await ai_single_flight.do(cache_key, generate)
+
+
+async def stream_hairstyle(
+    image: PreparedImage,
+    gender: str,
+    age: int
+) -> AsyncIterator[Tuple[str, str]]:
+    """
+    渐进式发型推荐：按完成顺序逐个产出 (部分名称, 内容)
+    
+    部分名称为 HAIRSTYLE_PARTS 之一，分析为文本、图片为 base64，生成失败时内容为空字符串。
+    三个部分全部成功时写入与 generate_hairstyle 相同的缓存
+    """
+    cache = get_image_cache()
+    cache_key = _hairstyle_cache_key(image, gender, age)
+    cached = await cache.get(cache_key)
+    if cached is not None:
+        result = json.loads(cached)
+        yield "analysis", result["analysis"]
+        yield "recommended_image", result["recommendedImage"]
+        yield "catalog_image", result["catalogImage"]
+        return
+    
+    tasks = {
+        asyncio.ensure_future(call): name
+        for name, call in _hairstyle_calls(image, gender, age).items()
     }
+    parts: Dict[str, str] = {}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = tasks[task]
+                parts[name] = _hairstyle_part(name, task.exception() or task.result())
+                yield name, parts[name]
+    finally:
+        # 客户端提前断开时取消尚未完成的生成
+        for task in pending:
+            task.cancel()
     
+    result = _hairstyle_result(parts)
+    if not result["failed"]:
+        await cache.set(cache_key, json.dumps(result).encode("utf-8"))
+
+
+def _hairstyle_calls(image: PreparedImage, gender: str, age: int) -> dict:
+    """构建发型分析、推荐效果图、发型目录图三个互不依赖的调用（协程）"""
     is_male = gender == "男"
     gender_term = "男士" if is_male else "女士"
     
@@ -231,14 +735,7 @@ async def generate_hairstyle(
     3. 最优发型推荐：[发型名称] 及针对该年龄段的推荐理由。
     语言要专业且富有亲和力。"""
     
-    analysis_model = genai.GenerativeModel("gemini-2.0-flash")
-    analysis_response = await call_gemini_with_retry(
-        model=analysis_model,
-        contents=[image_part, analysis_prompt]
-    )
-    analysis_text = analysis_response.text or "未能生成分析。"
-    
-    # 2. 生成推荐发型图片
+    # 2. 推荐发型图片提示词
     rec_prompt = f"""生成一张高度写实的【正面视角】照片。
     **核心要求**：
     - 必须使用原图中的人物面部，确保五官特征与原图【完全一致】。
@@ -246,13 +743,7 @@ async def generate_hairstyle(
     - 发型必须符合该年龄段的审美，如果是男士，严禁出现长发。
     - 背景简洁专业。"""
     
-    image_model = genai.GenerativeModel("gemini-2.5-flash-image")
-    rec_response = await call_gemini_with_retry(
-        model=image_model,
-        contents=[image_part, rec_prompt]
-    )
-    
-    # 3. 生成发型目录图
+    # 3. 发型目录图提示词
     cat_prompt = f"""生成一张专业的【{age}岁】【{gender_term}】正面发型参考画报。
     **关键核心要求**：
     1. **视角统一**：全部为【正面照】。
@@ -261,24 +752,47 @@ async def generate_hairstyle(
     4. **多样性**：10种风格迥异的{gender_term}发型，绝不重复。
     5. **排版**：整齐网格排版。"""
     
-    cat_response = await call_gemini_with_retry(
-        model=image_model,
-        contents=[image_part, cat_prompt]
-    )
-    
-    def extract_image(response) -> str:
-        """从响应中提取图片 base64"""
-        for part in response.parts:
-            if hasattr(part, "inline_data") and part.inline_data:
-                data = part.inline_data.data
-                # 如果是 bytes，转换为 base64 字符串
-                if isinstance(data, bytes):
-                    return base64.b64encode(data).decode('utf-8')
-                return str(data)
+    return {
+        "analysis": call_gemini_routed("hairstyle-analysis", contents=[image, analysis_prompt], policy=TEXT_RETRY_POLICY),
+        "recommended_image": call_gemini_routed("hairstyle-image", contents=[image, rec_prompt], policy=IMAGE_RETRY_POLICY),
+        "catalog_image": call_gemini_routed("hairstyle-image", contents=[image, cat_prompt], policy=IMAGE_RETRY_POLICY),
+    }
+
+
+def _hairstyle_part(name: str, result) -> str:
+    """从单个调用结果中提取分析文本或图片 base64，失败时为空字符串"""
+    if isinstance(result, BaseException):
+        logger.warning(f"Hairstyle {name} failed: {result}")
         return ""
-    
+    if name == "analysis":
+        return result.text or ""
+    return extract_image(result)
+
+
+def _hairstyle_result(parts: Dict[str, str]) -> dict:
+    """组装发型推荐结果，failed 列出生成失败的部分"""
     return {
-        "analysis": analysis_text,
-        "recommendedImage": extract_image(rec_response),
-        "catalogImage": extract_image(cat_response)
+        "analysis": parts.get("analysis") or "未能生成分析。",
+        "recommendedImage": parts.get("recommended_image", ""),
+        "catalogImage": parts.get("catalog_image", ""),
+        "failed": [name for name in HAIRSTYLE_PARTS if not parts.get(name)]
     }
+
+
+async def _generate_hairstyle(image: PreparedImage, gender: str, age: int) -> dict:
+    """调用 Gemini 进行发型分析并生成效果图（不经过缓存）"""
+    calls = _hairstyle_calls(image, gender, age)
+    
+    # 三个调用互不依赖，并发执行；单个失败不影响其余结果
+    results = await asyncio.gather(*calls.values(), return_exceptions=True)
+    parts = {name: _hairstyle_part(name, result) for name, result in zip(calls, results)}
+    
+    result = _hairstyle_result(parts)
+    if len(result["failed"]) == 3:
+        # 三个部分全部失败，抛出第一个异常（若有）以便上层返回错误
+        for item in results:
+            if isinstance(item, BaseException):
+                raise item
+        raise ValueError("AI 未能生成发型分析和图像")
+    
+    return result
@@ -0,0 +1,200 @@
+"""
+生成图片输出模块
+
+Gemini 返回的效果图为原尺寸 PNG，直接内嵌到响应中对手机端来说过大。
+本模块按客户端协商的格式（WebP / 渐进式 JPEG / PNG）和尺寸档位转码输出，
+转码在进程池中执行，不阻塞事件循环；输出以签名 URL（写入 Blob 存储）或内嵌 data URL 的形式返回
+"""
+import asyncio
+import base64
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from services.config_service import get_config
+from services.result_cache import get_image_cache, make_cache_key
+from services.codec import sniff_base64_mime
+from services.image_pipeline import (
+    OUTPUT_FORMATS, SIZE_PRESETS, DEFAULT_OUTPUT_QUALITY,
+    normalize_format, accepted_format, source_format, transcode_image
+)
+from services.blob_store import store_blob, signed_blob_url, blob_signing_enabled, is_valid_key
+from services.metrics import stage_duration_seconds, register_executor
+
+# 输出格式、尺寸档位和转码实现见共享的 api/_image_pipeline.py，
+# 各档位的最长边可在 system_config 中通过 image_output_max_edge_<档位> 覆盖
+DEFAULT_OUTPUT_WORKERS = 2
+
+# 返回方式：inline 内嵌为 data URL（默认），url 写入 Blob 存储并返回签名 URL
+DELIVERY_URL = "url"
+DELIVERY_INLINE = "inline"
+DELIVERY_MODES = (DELIVERY_URL, DELIVERY_INLINE)
+
+# Blob 引用前缀：异步任务结果保留时间比签名 URL 有效期长，结果中只保存键名，查询任务时再签名
+BLOB_REF_PREFIX = "blob:"
+
+@dataclass(frozen=True)
+class OutputSpec:
+    """
+    输出规格
+
+    format 为 None 时不转码格式，size 为 full 且不转码格式时原样输出；
+    base_url 为生成签名 URL 时使用的服务地址
+    """
+    format: str | None = None
+    size: str = "full"
+    delivery: str = DELIVERY_INLINE
+    base_url: str = ""
+
+    @property
+    def passthrough(self) -> bool:
+        return self.format is None and self.size == "full"
+
+    def to_dict(self) -> dict:
+        return {"format": self.format, "size": self.size, "delivery": self.delivery, "base_url": self.base_url}
+
+    @classmethod
+    def from_dict(cls, data: dict | None) -> "OutputSpec":
+        return cls(**data) if data else cls()
+
+
+def _config_int(key: str, default: int) -> int:
+    try:
+        return int(get_config(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def negotiate_output(
+    accept: str = "",
+    format: str | None = None,
+    size: str | None = None,
+    delivery: str | None = None,
+    base_url: str = ""
+) -> OutputSpec:
+    """
+    确定本次请求的输出规格
+
+    优先级：请求参数 > Accept 头 > system_config 中的 image_output_format / image_output_size / image_delivery；
+    都未指定时保持原格式、原尺寸，内嵌为 data URL 返回；未配置 Blob 签名密钥时始终内嵌
+    """
+    fmt = (
+        normalize_format(format)
+        or accepted_format(accept or "")
+        or normalize_format(get_config("image_output_format", ""))
+    )
+    if size not in SIZE_PRESETS:
+        size = get_config("image_output_size", "") or "full"
+        if size not in SIZE_PRESETS:
+            size = "full"
+    if delivery not in DELIVERY_MODES:
+        delivery = get_config("image_delivery", DELIVERY_INLINE)
+        if delivery not in DELIVERY_MODES:
+            delivery = DELIVERY_INLINE
+    # 未配置签名密钥时不生成签名 URL（启动时已记录错误日志）
+    if delivery == DELIVERY_URL and not blob_signing_enabled():
+        delivery = DELIVERY_INLINE
+    return OutputSpec(format=fmt, size=size, delivery=delivery, base_url=base_url)
+
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def get_output_executor() -> ProcessPoolExecutor:
+    """
+    获取转码进程池单例
+
+    使用 spawn 启动子进程，避免在多线程的服务进程中 fork
+    """
+    global _executor
+    if _executor is None:
+        workers = max(1, _config_int("image_output_workers", DEFAULT_OUTPUT_WORKERS))
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+register_executor("image_output", lambda: _executor)
+
+
+def shutdown_output_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def render_image(image_b64: str, spec: OutputSpec, sign: bool = True) -> str:
+    """
+    按输出规格生成返回给客户端的图片地址
+
+    Args:
+        image_b64: Gemini 返回的 base64 图片
+        spec: 输出规格
+        sign: 为 False 时 url 方式返回 Blob 引用（blob:<键名>），由 sign_blob_refs 在读取时签名
+
+    Returns:
+        delivery 为 url 时为短期有效的签名 URL，否则为 data:<mime>;base64,... 格式的图片
+    """
+    with stage_duration_seconds.time("response_encode"):
+        mime_type, encoded = await encode_image(image_b64, spec)
+        if spec.delivery == DELIVERY_URL:
+            key = await store_blob(base64.b64decode(encoded), mime_type)
+            return signed_blob_url(key, spec.base_url) if sign else BLOB_REF_PREFIX + key
+        return f"data:{mime_type};base64,{encoded}"
+
+
+def sign_blob_refs(value, base_url: str = ""):
+    """将任务结果中的 Blob 引用替换为新签发的签名 URL（递归处理字典和列表）"""
+    if isinstance(value, str):
+        key = value[len(BLOB_REF_PREFIX):]
+        if value.startswith(BLOB_REF_PREFIX) and is_valid_key(key):
+            return signed_blob_url(key, base_url)
+        return value
+    if isinstance(value, dict):
+        return {name: sign_blob_refs(item, base_url) for name, item in value.items()}
+    if isinstance(value, list):
+        return [sign_blob_refs(item, base_url) for item in value]
+    return value
+
+
+async def render_binary(image_b64: str, spec: OutputSpec) -> tuple[str, bytes]:
+    """
+    按输出规格生成二进制图片（Accept: image/* 时直接作为响应体，不经过 base64 和 JSON）
+
+    Returns:
+        (MIME 类型, 图片字节)
+    """
+    with stage_duration_seconds.time("response_encode"):
+        mime_type, encoded = await encode_image(image_b64, spec)
+        return mime_type, base64.b64decode(encoded)
+
+
+async def encode_image(image_b64: str, spec: OutputSpec) -> tuple[str, str]:
+    """
+    按输出规格转码图片
+
+    Returns:
+        (MIME 类型, 转码后的 base64 图片)；无需转码时原样返回
+    """
+    source_mime = sniff_base64_mime(image_b64)
+    if spec.passthrough:
+        return source_mime, image_b64
+
+    fmt = spec.format or source_format(source_mime)
+    max_edge = _config_int(f"image_output_max_edge_{spec.size}", SIZE_PRESETS[spec.size])
+    quality = _config_int("image_output_quality", DEFAULT_OUTPUT_QUALITY)
+    mime_type = OUTPUT_FORMATS[fmt][1]
+
+    # 同一张生成图的同一规格只转码一次
+    cache = get_image_cache()
+    cache_key = make_cache_key("output", image_b64, fmt, str(max_edge), str(quality))
+    cached = await cache.get(cache_key)
+    if cached is not None:
+        return mime_type, cached.decode("ascii")
+
+    loop = asyncio.get_running_loop()
+    data = await loop.run_in_executor(
+        get_output_executor(), transcode_image, base64.b64decode(image_b64), fmt, max_edge, quality
+    )
+    encoded = base64.b64encode(data).decode("ascii")
+    await cache.set(cache_key, encoded.encode("ascii"))
+    return mime_type, encoded
@@ -0,0 +1,33 @@
+"""
+图片处理流水线模块
+
+实现位于仓库根目录的 api/_image_pipeline.py，由后端与 Serverless 函数共用，
+这里按文件路径加载并导出，保证两端的预处理默认值、输出格式协商、转码和二进制响应头一致
+"""
+from services.codec import load_shared_module
+
+# _image_pipeline 导入 _codec，services.codec 已先行加载并注册
+_pipeline = load_shared_module("_image_pipeline")
+
+DEFAULT_MAX_EDGE = _pipeline.DEFAULT_MAX_EDGE
+DEFAULT_JPEG_QUALITY = _pipeline.DEFAULT_JPEG_QUALITY
+DEFAULT_MAX_DECODED_BYTES = _pipeline.DEFAULT_MAX_DECODED_BYTES
+DEFAULT_MAX_PIXELS = _pipeline.DEFAULT_MAX_PIXELS
+OUTPUT_FORMATS = _pipeline.OUTPUT_FORMATS
+SIZE_PRESETS = _pipeline.SIZE_PRESETS
+DEFAULT_OUTPUT_QUALITY = _pipeline.DEFAULT_OUTPUT_QUALITY
+normalize_image = _pipeline.normalize_image
+normalize_format = _pipeline.normalize_format
+accepted_format = _pipeline.accepted_format
+source_format = _pipeline.source_format
+image_headers = _pipeline.image_headers
+
+
+def transcode_image(data: bytes, fmt: str, max_edge: int, quality: int) -> bytes:
+    """
+    转码生成图片，见 _image_pipeline.transcode_image
+
+    转码进程池以 spawn 启动子进程，任务按模块路径序列化；子进程的 sys.path 中没有 api/，
+    因此通过本模块中转，而不是直接提交 _image_pipeline 中的函数
+    """
+    return _pipeline.transcode_image(data, fmt, max_edge, quality)
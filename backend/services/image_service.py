@@ -0,0 +1,114 @@
+"""
+图片预处理服务模块
+
+在上传给 Gemini 之前统一处理用户图片：解码一次、按 EXIF 方向摆正、
+按功能限制最长边、去除元数据并以固定质量重新编码为 JPEG。
+载荷解析与格式识别由共享的 codec 模块完成，规范化由共享的 image_pipeline 模块完成
+"""
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from services.config_service import get_config
+from services.codec import ImageCodecError, ImageTooLargeError, ImagePayload, decode_image
+from services.image_pipeline import (
+    DEFAULT_MAX_EDGE, DEFAULT_JPEG_QUALITY, DEFAULT_MAX_DECODED_BYTES, DEFAULT_MAX_PIXELS,
+    normalize_image as _normalize_image
+)
+from services.metrics import stage_duration_seconds
+
+# 默认值与规范化实现见共享的 api/_image_pipeline.py；
+# 最长边可在 system_config 中通过 image_max_edge_<功能> 覆盖，
+# 单张图片上限可通过 image_max_decoded_bytes / image_max_pixels 覆盖
+
+
+class ImageDecodeError(ValueError):
+    """图片无法解码"""
+
+
+class ImageTooLarge(ImageDecodeError):
+    """图片解码后的字节数或像素数超过上限（返回 413）"""
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    """
+    预处理后的图片
+
+    sha256 为 data 的哈希，预处理时计算一次，缓存键等直接复用
+    """
+    data: bytes
+    mime_type: str = "image/jpeg"
+    width: int = 0
+    height: int = 0
+    sha256: str = ""
+
+
+def _config_int(key: str, default: int) -> int:
+    """读取整数配置，配置值非法时回退到默认值"""
+    try:
+        return int(get_config(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_max_edge(feature: str) -> int:
+    """获取指定功能的最长边限制"""
+    return _config_int(f"image_max_edge_{feature}", DEFAULT_MAX_EDGE.get(feature, 1024))
+
+
+def decode_upload(image: str | bytes) -> ImagePayload:
+    """
+    解析 base64 / data URL 字符串或原始字节，识别真实格式（每张图片只解码一次）
+
+    超过大小上限的 base64 载荷在解码前即被拒绝，像素数按文件头检查，不会进入 Pillow
+    """
+    try:
+        return decode_image(
+            image,
+            max_bytes=_config_int("image_max_decoded_bytes", DEFAULT_MAX_DECODED_BYTES),
+            max_pixels=_config_int("image_max_pixels", DEFAULT_MAX_PIXELS)
+        )
+    except ImageTooLargeError as e:
+        raise ImageTooLarge(str(e)) from e
+    except ImageCodecError as e:
+        raise ImageDecodeError(str(e)) from e
+
+
+def normalize_image(raw: bytes | bytearray, max_edge: int, quality: int = DEFAULT_JPEG_QUALITY) -> tuple[bytes, int, int]:
+    """
+    规范化图片（CPU 密集，需在线程中执行）
+
+    Returns:
+        (不含元数据的 JPEG 字节, 宽, 高)
+
+    Raises:
+        ImageDecodeError: 图片无法解码
+    """
+    try:
+        return _normalize_image(raw, max_edge, quality)
+    except ImageCodecError as e:
+        raise ImageDecodeError(str(e)) from e
+
+
+def _prepare_upload(image: str | bytes, max_edge: int, quality: int) -> PreparedImage:
+    """解码并规范化上传图片（base64 解码、哈希与 Pillow 处理都是 CPU 密集的，整体在线程中执行）"""
+    source = decode_upload(image)
+    data, width, height = normalize_image(source.data, max_edge, quality)
+    return PreparedImage(data=data, width=width, height=height, sha256=hashlib.sha256(data).hexdigest())
+
+
+async def prepare_image(image: str | bytes, feature: str) -> PreparedImage:
+    """
+    解码并规范化上传的图片
+
+    Args:
+        image: base64 或 data URL 格式的图片，或 multipart 上传的原始图片字节
+        feature: 功能名称 - "try_on", "analyze", "hairstyle"
+
+    Returns:
+        可直接上传给 Gemini 的图片
+    """
+    with stage_duration_seconds.time("image_preprocess"):
+        max_edge = get_max_edge(feature)
+        quality = _config_int("image_jpeg_quality", DEFAULT_JPEG_QUALITY)
+        return await asyncio.to_thread(_prepare_upload, image, max_edge, quality)
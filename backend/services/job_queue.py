@@ -0,0 +1,224 @@
+"""
+异步任务队列模块
+
+基于 SQLite（WAL 模式）的持久化任务队列，API 进程入队、worker 进程（worker.py）出队执行，
+两者可以独立扩容。worker 领取任务时写入租约并在执行期间定期续约，进程崩溃导致租约过期的任务会被重新领取。
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List
+from services.config_service import get_config
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED)
+
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 2
+DEFAULT_RETENTION_HOURS = 24
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 1,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority, created_at);
+"""
+
+
+def _config_number(key: str, default: float) -> float:
+    try:
+        return float(get_config(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class JobQueue:
+    """
+    SQLite 持久化任务队列
+
+    每个线程使用独立连接；所有方法都是同步阻塞调用，在事件循环中应通过 asyncio.to_thread 调用
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            # WAL 模式下 API 进程读取状态不会阻塞 worker 写入
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind: str, user_id: str, payload: Dict[str, Any], priority: int = 1) -> str:
+        """写入一个新任务，返回任务 ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, kind, user_id, status, priority, payload, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, user_id, STATUS_QUEUED, priority, json.dumps(payload), now, now)
+        )
+        return job_id
+
+    def expire(self) -> List[Dict[str, Any]]:
+        """
+        将租约已过期且达到最大尝试次数的任务标记为失败
+
+        Returns:
+            本次标记为失败的任务（由调用方退还魔法值）
+        """
+        max_attempts = int(_config_number("job_max_attempts", DEFAULT_MAX_ATTEMPTS))
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (STATUS_RUNNING, now, max_attempts)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+                [(STATUS_FAILED, "任务执行超时", now, row["id"]) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [self._to_dict(row) for row in rows]
+
+    def claim(self, worker: str) -> Dict[str, Any] | None:
+        """
+        领取一个任务：优先级高、入队早的排队任务优先，租约已过期的执行中任务也可被重新领取
+
+        达到最大尝试次数的过期任务不再领取，由 expire() 标记为失败
+        """
+        lease = _config_number("job_lease_seconds", DEFAULT_LEASE_SECONDS)
+        max_attempts = int(_config_number("job_max_attempts", DEFAULT_MAX_ATTEMPTS))
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? OR (status = ? AND lease_until < ? AND attempts < ?) "
+                "ORDER BY priority, created_at LIMIT 1",
+                (STATUS_QUEUED, STATUS_RUNNING, now, max_attempts)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ?",
+                (STATUS_RUNNING, worker, now + lease, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        job = self._to_dict(row)
+        job["status"] = STATUS_RUNNING
+        job["worker"] = worker
+        job["attempts"] += 1
+        return job
+
+    def renew(self, job_id: str, worker: str) -> bool:
+        """
+        续约执行中的任务，执行时间超过租约的任务不会被其他 worker 重复领取
+
+        Returns:
+            False 表示任务已不属于该 worker（租约过期后被重新领取或已结束）
+        """
+        lease = _config_number("job_lease_seconds", DEFAULT_LEASE_SECONDS)
+        now = time.time()
+        cursor = self._connect().execute(
+            "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = ?",
+            (now + lease, now, job_id, worker, STATUS_RUNNING)
+        )
+        return cursor.rowcount > 0
+
+    def complete(self, job_id: str, result: Dict[str, Any], worker: str | None = None) -> bool:
+        return self._finish(job_id, STATUS_SUCCEEDED, worker, result=json.dumps(result))
+
+    def fail(self, job_id: str, error: str, worker: str | None = None) -> bool:
+        return self._finish(job_id, STATUS_FAILED, worker, error=error)
+
+    def _finish(
+        self, job_id: str, status: str, worker: str | None, result: str | None = None, error: str | None = None
+    ) -> bool:
+        """
+        写入任务结果；指定 worker 时只在任务仍由该 worker 执行时写入
+
+        Returns:
+            是否写入（False 表示租约已被其他 worker 接手或任务已结束）
+        """
+        sql = "UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ?"
+        params = [status, result, error, time.time(), job_id]
+        if worker is not None:
+            sql += " AND worker = ? AND status = ?"
+            params += [worker, STATUS_RUNNING]
+        return self._connect().execute(sql, params).rowcount > 0
+
+    def get(self, job_id: str) -> Dict[str, Any] | None:
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def purge(self) -> int:
+        """删除超过保留时间的已完成任务"""
+        hours = _config_number("job_retention_hours", DEFAULT_RETENTION_HOURS)
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (*FINISHED_STATUSES, time.time() - hours * 3600)
+        )
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in (STATUS_QUEUED, STATUS_RUNNING, *FINISHED_STATUSES)}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+_job_queue: JobQueue | None = None
+
+
+def get_job_queue() -> JobQueue:
+    """获取任务队列单例（API 进程与 worker 进程需配置相同的 job_queue_path）"""
+    global _job_queue
+    if _job_queue is None:
+        path = get_config("job_queue_path", "") or os.path.join(tempfile.gettempdir(), "ai-beauty-jobs.sqlite3")
+        _job_queue = JobQueue(path)
+    return _job_queue
@@ -0,0 +1,185 @@
+"""
+Gemini API Key 池模块
+
+在多个 API Key（可来自不同项目）之间按权重和剩余配额分配请求，
+返回 429 或鉴权错误的 Key 会被暂时剔除，并记录每个 Key 的使用情况
+"""
+import json
+import logging
+import random
+import time
+from typing import Dict, List
+from services.resilience_settings import get_resilience_settings
+from services.rate_limiter import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# 剔除时长：429 按连续次数指数增长，鉴权错误直接剔除较长时间
+THROTTLE_EJECT_SECONDS = 30
+MAX_THROTTLE_EJECT_SECONDS = 300
+AUTH_EJECT_SECONDS = 600
+
+# 剩余配额再低也保留一点被选中的机会，便于配额恢复后重新分流
+MIN_HEADROOM = 0.05
+
+
+class KeyState:
+    """单个 API Key 的配置与运行状态"""
+
+    def __init__(self, key: str, weight: float = 1.0, name: str = ""):
+        self.key = key
+        self.weight = weight
+        self.name = name or f"{key[:6]}..."
+        self.ejected_until = 0.0
+        self.consecutive_throttles = 0
+        self.requests = 0
+        self.successes = 0
+        self.throttled = 0
+        self.auth_errors = 0
+        self.errors = 0
+        self.last_used = 0.0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def eject(self, seconds: float):
+        self.ejected_until = max(self.ejected_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, int | float | str | bool]:
+        remaining = max(0.0, self.ejected_until - time.monotonic())
+        return {
+            "name": self.name,
+            "key": f"{self.key[:6]}...{self.key[-4:]}" if len(self.key) > 10 else "invalid",
+            "weight": self.weight,
+            "available": remaining == 0,
+            "ejected_for_s": round(remaining, 1),
+            "requests": self.requests,
+            "successes": self.successes,
+            "throttled": self.throttled,
+            "auth_errors": self.auth_errors,
+            "errors": self.errors,
+        }
+
+
+def parse_key_config(raw, fallback_key: str) -> List[KeyState]:
+    """
+    解析 Key 池配置
+
+    gemini_api_keys 为 JSON 数组，元素可以是字符串，或 {"key": "...", "weight": 2, "name": "项目A"}；
+    未配置时退回单个 gemini_api_key
+    """
+    states = []
+    if raw:
+        try:
+            entries = json.loads(raw) if isinstance(raw, str) else raw
+            for entry in entries:
+                if isinstance(entry, str):
+                    entry = {"key": entry}
+                key = (entry.get("key") or "").strip()
+                weight = float(entry.get("weight", 1))
+                if key and weight > 0:
+                    states.append(KeyState(key, weight, entry.get("name", "")))
+        except (AttributeError, TypeError, ValueError):
+            logger.warning("Invalid gemini_api_keys config, falling back to gemini_api_key")
+            states = []
+    if not states and fallback_key:
+        states.append(KeyState(fallback_key, 1.0, "default"))
+    return states
+
+
+class GeminiKeyPool:
+    """按权重和剩余配额选择 API Key，并跟踪各 Key 的健康状况"""
+
+    def __init__(self):
+        self._raw = None
+        self._states: Dict[str, KeyState] = {}
+
+    def _refresh(self):
+        """配置变化时重建 Key 列表，保留已有 Key 的统计与剔除状态"""
+        settings = get_resilience_settings()
+        raw, fallback = settings.api_keys, settings.api_key
+        signature = (raw, fallback)
+        if signature == self._raw:
+            return
+        self._raw = signature
+        states = {}
+        for state in parse_key_config(raw, fallback):
+            old = self._states.get(state.key)
+            if old is not None:
+                old.weight = state.weight
+                old.name = state.name
+                state = old
+            states[state.key] = state
+        self._states = states
+
+    def keys(self) -> List[KeyState]:
+        self._refresh()
+        return list(self._states.values())
+
+    def default_key(self) -> str:
+        """不计入使用统计地返回一个可用 Key（用于构建默认客户端）"""
+        states = self.keys()
+        if not states:
+            raise ValueError("未配置 Gemini API 密钥，请在管理后台设置")
+        available = [s for s in states if s.available]
+        return (available or states)[0].key
+
+    def select(self, model: str, exclude: set[str] | None = None) -> KeyState:
+        """
+        为一次调用选择 API Key
+
+        在可用 Key 中按 权重 x 该模型剩余配额 加权随机选择；
+        全部被剔除时选择最早恢复的 Key，而不是直接失败
+        """
+        states = self.keys()
+        if not states:
+            raise ValueError("未配置 Gemini API 密钥，请在管理后台设置")
+
+        candidates = [s for s in states if s.available and s.key not in (exclude or set())]
+        if not candidates:
+            candidates = [s for s in states if s.key not in (exclude or set())] or states
+            state = min(candidates, key=lambda s: s.ejected_until)
+        else:
+            scores = [
+                s.weight * max(MIN_HEADROOM, rate_limiter.get(model, s.key).headroom())
+                for s in candidates
+            ]
+            state = random.choices(candidates, weights=scores, k=1)[0]
+
+        state.requests += 1
+        state.last_used = time.time()
+        return state
+
+    def report_success(self, state: KeyState):
+        state.successes += 1
+        state.consecutive_throttles = 0
+
+    def report_throttled(self, state: KeyState):
+        """429：按连续次数指数延长剔除时间"""
+        state.throttled += 1
+        state.consecutive_throttles += 1
+        seconds = min(
+            MAX_THROTTLE_EJECT_SECONDS,
+            THROTTLE_EJECT_SECONDS * 2 ** (state.consecutive_throttles - 1)
+        )
+        state.eject(seconds)
+        logger.warning(f"Gemini key {state.name} throttled, ejected for {seconds}s")
+
+    def report_auth_error(self, state: KeyState):
+        state.auth_errors += 1
+        state.eject(AUTH_EJECT_SECONDS)
+        logger.error(f"Gemini key {state.name} rejected (auth error), ejected for {AUTH_EJECT_SECONDS}s")
+
+    def report_error(self, state: KeyState):
+        state.errors += 1
+
+    def has_alternative(self, exclude: set[str]) -> bool:
+        """除 exclude 之外是否还有可用的 Key"""
+        return any(s.available and s.key not in exclude for s in self.keys())
+
+    def stats(self) -> List[Dict[str, int | float | str | bool]]:
+        return [state.stats() for state in self.keys()]
+
+
+key_pool = GeminiKeyPool()
@@ -0,0 +1,319 @@
+"""
+运行指标模块
+
+进程内的 Prometheus 风格指标（计数器、直方图、采集时计算的仪表），由 GET /metrics
+以文本暴露格式（text/plain; version=0.0.4）输出，不依赖 prometheus_client。
+
+记录一次观测只做一次字典查找、一次 bisect 和几次整数加法，可在生产环境常开：
+- 请求数与延迟：按方法、路由模板（而不是实际路径）和状态码统计
+- 阶段耗时：认证、扣减魔法值、图片预处理、响应编码
+- Gemini：每次尝试按模型统计耗时，以及 429 次数、重试次数和模型切换次数
+- Supabase：按表和操作统计耗时与失败次数
+- 饱和度：事件循环延迟、默认线程池与转码进程池的排队数、各模型的准入名额占用
+"""
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 延迟直方图的默认分桶（秒），覆盖从毫秒级数据库调用到分钟级图像生成
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# 事件循环延迟的分桶（秒）
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# 事件循环延迟的采样间隔（秒）
+LOOP_LAG_INTERVAL = 0.5
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增的计数器"""
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class _Timer:
+    """Histogram.time() 返回的计时上下文（比 contextmanager 生成器开销更小）"""
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: "Histogram", labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    """累计分桶直方图"""
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各分桶计数（非累计，最后一个为 +Inf）, 总和, 次数]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[labels] = state
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, *labels: str) -> _Timer:
+        """计时上下文：with histogram.time("auth"): ..."""
+        return _Timer(self, labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._values.items()]
+        lines = []
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """采集时由回调计算的仪表，回调返回 [(标签值, 数值)]"""
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        collect: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]] | None = None
+    ):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        if self.collect is None:
+            return []
+        try:
+            items = list(self.collect())
+        except Exception as e:
+            logger.warning(f"Metric {self.name} collection failed: {e}")
+            return []
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# 请求
+http_requests_total = registry.register(Counter(
+    "http_requests_total", "HTTP requests by method, route template and status code",
+    ("method", "route", "status")
+))
+http_request_duration_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency until the last response byte (streaming responses included)",
+    ("method", "route")
+))
+
+# 请求内的各阶段：auth / credit / image_preprocess / response_encode（生成图片转码、写入 Blob）/ json_encode
+stage_duration_seconds = registry.register(Histogram(
+    "request_stage_duration_seconds", "Latency of individual request stages",
+    ("stage",)
+))
+
+# Gemini
+gemini_call_duration_seconds = registry.register(Histogram(
+    "gemini_call_duration_seconds", "Latency of each Gemini attempt by model and outcome",
+    ("model", "outcome")
+))
+gemini_rate_limited_total = registry.register(Counter(
+    "gemini_rate_limited_total", "Gemini responses with HTTP 429 by model",
+    ("model",)
+))
+gemini_retries_total = registry.register(Counter(
+    "gemini_retries_total", "Gemini retries by model and reason (switch_key or backoff)",
+    ("model", "reason")
+))
+gemini_failovers_total = registry.register(Counter(
+    "gemini_failovers_total", "Failovers to the next candidate model by feature and failed model",
+    ("feature", "model")
+))
+
+# Supabase
+supabase_call_duration_seconds = registry.register(Histogram(
+    "supabase_call_duration_seconds", "Latency of Supabase calls by table and operation",
+    ("table", "operation")
+))
+supabase_errors_total = registry.register(Counter(
+    "supabase_errors_total", "Failed Supabase calls by table and operation",
+    ("table", "operation")
+))
+
+# 饱和度
+event_loop_lag_seconds = registry.register(Histogram(
+    "event_loop_lag_seconds", "Delay between a scheduled event loop wake-up and when it actually ran",
+    buckets=LOOP_LAG_BUCKETS
+))
+
+# 采集时读取的执行器：名称 -> 返回执行器的函数（执行器可能尚未创建）
+_executors: Dict[str, Callable[[], object]] = {}
+
+
+def register_executor(name: str, getter: Callable[[], object]):
+    """注册需要统计排队数的线程池或进程池"""
+    _executors[name] = getter
+
+
+def _executor_stats(executor) -> Tuple[int, int, int]:
+    """(最大工作数, 已启动工作数, 排队任务数)，读取 concurrent.futures 的内部状态"""
+    max_workers = getattr(executor, "_max_workers", 0)
+    if hasattr(executor, "_work_queue"):
+        # ThreadPoolExecutor
+        return max_workers, len(getattr(executor, "_threads", ())), executor._work_queue.qsize()
+    # ProcessPoolExecutor：已提交但未完成的任务（含执行中的）减去工作进程数即为排队数
+    workers = len(getattr(executor, "_processes", None) or ())
+    pending = len(getattr(executor, "_pending_work_items", None) or ())
+    return max_workers, workers, max(0, pending - workers)
+
+
+def _collect_executors(index: int):
+    def collect():
+        for name, getter in _executors.items():
+            executor = getter()
+            if executor is not None:
+                yield (name,), _executor_stats(executor)[index]
+    return collect
+
+
+registry.register(Gauge(
+    "executor_max_workers", "Configured worker count of thread and process pools",
+    ("executor",), _collect_executors(0)
+))
+registry.register(Gauge(
+    "executor_workers", "Started workers of thread and process pools",
+    ("executor",), _collect_executors(1)
+))
+registry.register(Gauge(
+    "executor_queue_depth", "Tasks waiting for a free worker in thread and process pools",
+    ("executor",), _collect_executors(2)
+))
+
+
+def _collect_admission(field: str):
+    def collect():
+        from services.admission import admission_controller
+        for stats in admission_controller.stats():
+            yield (stats["model"],), stats[field]
+    return collect
+
+
+registry.register(Gauge(
+    "gemini_slots_active", "Gemini calls holding an admission slot by model",
+    ("model",), _collect_admission("active")
+))
+registry.register(Gauge(
+    "gemini_slots_queued", "Gemini calls waiting for an admission slot by model",
+    ("model",), _collect_admission("queued")
+))
+registry.register(Gauge(
+    "gemini_slots_limit", "Admission slot limit by model",
+    ("model",), _collect_admission("limit")
+))
+
+
+def render_metrics() -> str:
+    """以 Prometheus 文本暴露格式输出全部指标"""
+    return registry.render()
+
+
+async def monitor_event_loop(interval: float = LOOP_LAG_INTERVAL):
+    """
+    周期性测量事件循环延迟：睡眠 interval 后实际唤醒时间与预期的差值
+
+    阻塞事件循环的同步调用（如同步的 Supabase 请求）会直接体现为延迟升高
+    """
+    loop = asyncio.get_running_loop()
+    # 默认线程池（asyncio.to_thread）在首次使用时才创建
+    register_executor("default", lambda: getattr(loop, "_default_executor", None))
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        event_loop_lag_seconds.observe(max(0.0, loop.time() - expected))
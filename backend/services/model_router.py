@@ -0,0 +1,147 @@
+"""
+模型路由模块
+
+每个 AI 功能在 system_config 的 gemini_model_routes 中配置有序的候选模型列表，
+路由器按各模型最近的延迟（p50/p95）和失败率选择最健康、最快的候选，
+调用失败时沿候选链自动切换到下一个模型
+"""
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+from services.circuit_breaker import circuit_breakers, CircuitOpen
+from services.resilience_settings import DEFAULT_ROUTES, get_resilience_settings
+
+logger = logging.getLogger(__name__)
+
+# 统计窗口与样本数：样本不足的模型不参与按延迟排序，保持配置顺序
+WINDOW_SECONDS = 300
+MAX_SAMPLES = 500
+MIN_SAMPLES = 10
+
+# 失败率超过该值的模型视为不健康，排在健康模型之后
+UNHEALTHY_ERROR_RATE = 0.3
+# 排序分数 = p95 延迟 x (1 + 失败率 x ERROR_PENALTY)
+ERROR_PENALTY = 2.0
+
+
+def get_route(feature: str) -> List[str]:
+    """
+    获取功能配置的候选模型链
+
+    system_config 中 gemini_model_routes 为 JSON 对象，如
+    {"try-on": ["gemini-2.5-flash-image", "gemini-2.0-flash-preview-image-generation"]}，
+    未列出的功能使用默认模型
+    """
+    return get_resilience_settings().route(feature)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class ModelHealth:
+    """单个模型最近调用的延迟与失败统计"""
+
+    def __init__(self, model: str):
+        self.model = model
+        # (完成时间, 是否失败, 耗时)
+        self._samples: Deque[Tuple[float, bool, float]] = deque(maxlen=MAX_SAMPLES)
+
+    def record(self, failed: bool, latency: float):
+        self._samples.append((time.monotonic(), failed, latency))
+
+    def _recent(self) -> List[Tuple[float, bool, float]]:
+        cutoff = time.monotonic() - WINDOW_SECONDS
+        return [s for s in self._samples if s[0] >= cutoff]
+
+    def summary(self) -> Dict[str, int | float | str]:
+        samples = self._recent()
+        # 失败调用的耗时不代表模型正常响应速度，延迟只按成功调用统计
+        latencies = [latency for _, failed, latency in samples if not failed]
+        errors = sum(1 for _, failed, _ in samples if failed)
+        return {
+            "model": self.model,
+            "samples": len(samples),
+            "error_rate": round(errors / len(samples), 3) if samples else 0.0,
+            "p50_ms": round(_percentile(latencies, 0.5) * 1000, 1) if latencies else 0.0,
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 1) if latencies else 0.0,
+        }
+
+
+class ModelRouter:
+    """按功能在候选模型之间路由"""
+
+    def __init__(self):
+        self._health: Dict[str, ModelHealth] = {}
+
+    def health(self, model: str) -> ModelHealth:
+        health = self._health.get(model)
+        if health is None:
+            health = ModelHealth(model)
+            self._health[model] = health
+        return health
+
+    def record(self, model: str, failed: bool, latency: float):
+        self.health(model).record(failed, latency)
+
+    def rank(self, feature: str) -> List[str]:
+        """
+        返回本次调用的候选模型顺序
+
+        熔断中的模型排在最后；其余模型中不健康的排在健康的之后，
+        同类之间按 p95 延迟（叠加失败率惩罚）排序，样本不足的模型与当前最优者并列，保持配置顺序
+        """
+        chain = get_route(feature)
+        summaries = {model: self.health(model).summary() for model in chain}
+        scored = {}
+        for model, summary in summaries.items():
+            if summary["samples"] >= MIN_SAMPLES and summary["p95_ms"]:
+                scored[model] = summary["p95_ms"] * (1 + summary["error_rate"] * ERROR_PENALTY)
+        best = min(scored.values(), default=0.0)
+
+        def sort_key(item: Tuple[int, str]):
+            index, model = item
+            summary = summaries[model]
+            return (
+                circuit_breakers.get(model).is_open(),
+                summary["samples"] >= MIN_SAMPLES and summary["error_rate"] > UNHEALTHY_ERROR_RATE,
+                scored.get(model, best),
+                index,
+            )
+
+        return [model for _, model in sorted(enumerate(chain), key=sort_key)]
+
+    def ensure_available(self, feature: str) -> str:
+        """
+        检查功能至少有一个未熔断的候选模型，在扣减魔法值之前调用
+
+        Returns:
+            本次预计使用的模型
+
+        Raises:
+            CircuitOpen: 所有候选模型均在熔断中
+        """
+        first_error: CircuitOpen | None = None
+        for model in self.rank(feature):
+            try:
+                circuit_breakers.get(model).check()
+                return model
+            except CircuitOpen as e:
+                first_error = first_error or e
+        raise first_error
+
+    def stats(self) -> Dict[str, list]:
+        features = sorted(set(DEFAULT_ROUTES))
+        return {
+            "routes": [
+                {"feature": feature, "chain": get_route(feature), "ranked": self.rank(feature)}
+                for feature in features
+            ],
+            "models": [health.summary() for health in self._health.values()],
+        }
+
+
+model_router = ModelRouter()
@@ -0,0 +1,234 @@
+"""
+Gemini 配额节流模块
+
+按 (模型, API Key) 维护每分钟请求数（RPM）和每分钟 Token 数（TPM）两个令牌桶，
+在发出请求前主动排队等待，使调用速率保持在配额以内，而不是等 Google 返回 429 后再退避。
+收到 429 时自动下调有效预算，之后随成功调用逐步恢复。
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, Iterable, Tuple
+from services.resilience_settings import get_resilience_settings
+from services.image_service import PreparedImage
+from services.admission import AdmissionRejected
+
+logger = logging.getLogger(__name__)
+
+# Gemini 图片计费：两边都不超过 384px 计 258 tokens，否则按 768x768 切块，每块 258 tokens
+IMAGE_TILE_SIZE = 768
+IMAGE_SMALL_EDGE = 384
+IMAGE_TOKENS_PER_TILE = 258
+
+# 自适应调整：429 时乘性下调，成功时加性恢复
+THROTTLE_DECREASE = 0.7
+RECOVERY_STEP = 0.02
+MIN_FACTOR = 0.1
+
+
+def estimate_image_tokens(image: PreparedImage) -> int:
+    """根据图片尺寸估算输入 token 数"""
+    if not image.width or not image.height:
+        # 尺寸未知时按 1536px 图片（4 个切块）估算
+        return IMAGE_TOKENS_PER_TILE * 4
+    if image.width <= IMAGE_SMALL_EDGE and image.height <= IMAGE_SMALL_EDGE:
+        return IMAGE_TOKENS_PER_TILE
+    tiles = math.ceil(image.width / IMAGE_TILE_SIZE) * math.ceil(image.height / IMAGE_TILE_SIZE)
+    return IMAGE_TOKENS_PER_TILE * tiles
+
+
+def estimate_text_tokens(text: str) -> int:
+    """估算文本 token 数（中文约 1 字 1 token，英文约 3~4 字符 1 token）"""
+    return math.ceil(len(text.encode("utf-8")) / 3)
+
+
+def estimate_tokens(contents: Iterable) -> int:
+    """估算一次请求的输入 token 数"""
+    total = 0
+    for item in contents:
+        if isinstance(item, PreparedImage):
+            total += estimate_image_tokens(item)
+        elif isinstance(item, str):
+            total += estimate_text_tokens(item)
+    return max(1, total)
+
+
+class TokenBucket:
+    """
+    允许透支的令牌桶
+
+    reserve() 立即扣除令牌并返回需要等待的秒数，后到的请求在前面请求的透支之后排队，
+    从而按到达顺序匀速放行
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.per_minute, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        # 单次请求超过桶容量时按容量计，避免永远无法放行
+        self.tokens -= min(amount, self.per_minute)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def level(self) -> float:
+        """当前令牌占容量的比例（0~1，透支时为 0）"""
+        self._refill(time.monotonic())
+        return max(0.0, self.tokens / self.per_minute)
+
+    def drain(self):
+        """清空当前令牌（收到 429 后暂停突发）"""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0.0)
+
+    def resize(self, per_minute: float):
+        self._refill(time.monotonic())
+        self.per_minute = per_minute
+        self.tokens = min(self.tokens, per_minute)
+
+
+class QuotaLimiter:
+    """单个 (模型, API Key) 的 RPM/TPM 节流器"""
+
+    def __init__(self, model: str, rpm: int, tpm: int):
+        self.model = model
+        self.base_rpm = rpm
+        self.base_tpm = tpm
+        self.factor = 1.0
+        self.rpm_bucket = TokenBucket(rpm)
+        self.tpm_bucket = TokenBucket(tpm)
+        self.requests = 0
+        self.paced = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+
+    def configure(self, rpm: int, tpm: int):
+        """同步最新的配额配置"""
+        if rpm != self.base_rpm or tpm != self.base_tpm:
+            self.base_rpm = rpm
+            self.base_tpm = tpm
+            self._apply_factor()
+
+    def reserve(self, tokens: int) -> float:
+        """预留一次请求的配额，返回需要等待的秒数"""
+        self.requests += 1
+        wait = max(self.rpm_bucket.reserve(1), self.tpm_bucket.reserve(tokens))
+        if wait > 0:
+            self.paced += 1
+            self.total_wait += wait
+        return wait
+
+    def headroom(self) -> float:
+        """剩余配额比例（0~1），取 RPM 与 TPM 中较紧的一项"""
+        return min(self.rpm_bucket.level(), self.tpm_bucket.level())
+
+    def refund(self, tokens: int):
+        """归还未实际使用的预留配额"""
+        self.rpm_bucket.tokens += 1
+        self.tpm_bucket.tokens += min(tokens, self.tpm_bucket.per_minute)
+
+    def on_success(self):
+        if self.factor < 1.0:
+            self.factor = min(1.0, self.factor + RECOVERY_STEP)
+            self._apply_factor()
+
+    def on_throttled(self):
+        """仍然收到 429：下调有效预算并清空突发额度"""
+        self.throttled += 1
+        self.factor = max(MIN_FACTOR, self.factor * THROTTLE_DECREASE)
+        self._apply_factor()
+        self.rpm_bucket.drain()
+        self.tpm_bucket.drain()
+        logger.warning(f"Gemini 429 on {self.model}, pacing budget reduced to {self.factor:.0%}")
+
+    def _apply_factor(self):
+        self.rpm_bucket.resize(max(1.0, self.base_rpm * self.factor))
+        self.tpm_bucket.resize(max(1.0, self.base_tpm * self.factor))
+
+    def stats(self) -> Dict[str, int | float | str]:
+        return {
+            "model": self.model,
+            "rpm": self.base_rpm,
+            "tpm": self.base_tpm,
+            "factor": round(self.factor, 3),
+            "effective_rpm": round(self.rpm_bucket.per_minute, 1),
+            "effective_tpm": round(self.tpm_bucket.per_minute, 1),
+            "requests": self.requests,
+            "paced": self.paced,
+            "throttled": self.throttled,
+            "total_wait_s": round(self.total_wait, 2),
+        }
+
+
+def get_quota(model: str) -> Tuple[int, int]:
+    """
+    获取模型的 (RPM, TPM) 预算
+
+    system_config 中 gemini_rate_limits 为 JSON 对象，如
+    {"gemini-2.0-flash": {"rpm": 2000, "tpm": 4000000}}，未列出的模型使用 gemini_default_rpm / gemini_default_tpm
+    """
+    return get_resilience_settings().quota(model)
+
+
+class RateLimiterRegistry:
+    """按 (模型, API Key) 管理节流器"""
+
+    def __init__(self):
+        self._limiters: Dict[Tuple[str, str], QuotaLimiter] = {}
+
+    def get(self, model: str, api_key: str) -> QuotaLimiter:
+        rpm, tpm = get_quota(model)
+        limiter = self._limiters.get((model, api_key))
+        if limiter is None:
+            limiter = QuotaLimiter(model, rpm, tpm)
+            self._limiters[(model, api_key)] = limiter
+        else:
+            limiter.configure(rpm, tpm)
+        return limiter
+
+    async def pace(self, model: str, api_key: str, tokens: int, deadline: float | None = None):
+        """
+        按配额等待到可以发出请求
+
+        Raises:
+            RateLimitExceeded: 需要等待的时间超过请求截止时间
+        """
+        limiter = self.get(model, api_key)
+        wait = limiter.reserve(tokens)
+        if wait <= 0:
+            return
+        if deadline is not None and time.monotonic() + wait > deadline:
+            limiter.refund(tokens)
+            raise RateLimitExceeded(math.ceil(wait))
+        await asyncio.sleep(wait)
+
+    def stats(self) -> list[Dict[str, int | float | str]]:
+        result = []
+        for (_, api_key), limiter in self._limiters.items():
+            item = limiter.stats()
+            item["api_key"] = f"{api_key[:6]}..." if api_key else ""
+            result.append(item)
+        return result
+
+
+class RateLimitExceeded(AdmissionRejected):
+    """按当前配额在截止时间内无法发出请求"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("AI 服务请求过于频繁，请稍后再试", retry_after)
+
+
+rate_limiter = RateLimiterRegistry()
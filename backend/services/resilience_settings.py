@@ -0,0 +1,200 @@
+"""
+弹性策略配置快照
+
+准入控制、配额节流、Key 池、重试预算、熔断器和模型路由在每次 Gemini 调用中都要读取配置。
+这里一次性读取并解析全部相关配置项，得到不可变的快照；热路径只读取快照，
+快照在 SNAPSHOT_TTL_SECONDS 之后或 clear_config_cache() 之后重新加载
+"""
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+from services.config_service import get_config, config_generation
+
+logger = logging.getLogger(__name__)
+
+# 快照有效期（秒）
+SNAPSHOT_TTL_SECONDS = 30.0
+
+# 准入控制
+DEFAULT_CONCURRENCY = 8
+DEFAULT_QUEUE_SIZE = 50
+DEFAULT_QUEUE_TIMEOUT = 20
+
+# 配额节流
+DEFAULT_RPM = 300
+DEFAULT_TPM = 1_000_000
+
+# 重试预算
+DEFAULT_RETRY_BUDGET_RATIO = 0.2
+DEFAULT_RETRY_BUDGET_MIN_PER_SECOND = 1.0
+
+# 熔断器阈值，均可在 system_config 中以 circuit_breaker_<名称> 覆盖
+CIRCUIT_BREAKER_DEFAULTS = {
+    "window_seconds": 60.0,
+    "min_requests": 10,
+    "error_rate": 0.5,
+    "slow_call_seconds": 60.0,
+    "slow_call_rate": 0.8,
+    "open_seconds": 30.0,
+    "half_open_probes": 2,
+}
+
+# 模型路由
+DEFAULT_TEXT_MODEL = "gemini-2.0-flash"
+DEFAULT_IMAGE_MODEL = "gemini-2.5-flash-image"
+
+# 各功能默认的候选模型链
+DEFAULT_ROUTES: Dict[str, List[str]] = {
+    "try-on": [DEFAULT_IMAGE_MODEL],
+    "accessory": [DEFAULT_IMAGE_MODEL],
+    "tongue": [DEFAULT_TEXT_MODEL],
+    "face-analysis": [DEFAULT_TEXT_MODEL],
+    "face-reading": [DEFAULT_TEXT_MODEL],
+    "hairstyle-analysis": [DEFAULT_TEXT_MODEL],
+    "hairstyle-image": [DEFAULT_IMAGE_MODEL],
+}
+
+
+@dataclass(frozen=True)
+class CircuitBreakerSettings:
+    window_seconds: float = CIRCUIT_BREAKER_DEFAULTS["window_seconds"]
+    min_requests: float = CIRCUIT_BREAKER_DEFAULTS["min_requests"]
+    error_rate: float = CIRCUIT_BREAKER_DEFAULTS["error_rate"]
+    slow_call_seconds: float = CIRCUIT_BREAKER_DEFAULTS["slow_call_seconds"]
+    slow_call_rate: float = CIRCUIT_BREAKER_DEFAULTS["slow_call_rate"]
+    open_seconds: float = CIRCUIT_BREAKER_DEFAULTS["open_seconds"]
+    half_open_probes: float = CIRCUIT_BREAKER_DEFAULTS["half_open_probes"]
+
+
+@dataclass(frozen=True)
+class ResilienceSettings:
+    """一次加载得到的全部弹性策略配置"""
+    # 准入控制：未在 model_concurrency 中列出的模型使用 default_concurrency
+    model_concurrency: Dict[str, int] = field(default_factory=dict)
+    default_concurrency: int = DEFAULT_CONCURRENCY
+    queue_size: int = DEFAULT_QUEUE_SIZE
+    queue_timeout_seconds: int = DEFAULT_QUEUE_TIMEOUT
+    # 配额节流：模型 -> (RPM, TPM)
+    rate_limits: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    default_rpm: int = DEFAULT_RPM
+    default_tpm: int = DEFAULT_TPM
+    # Key 池：原始配置，由 key_pool 解析
+    api_keys: str = ""
+    api_key: str = ""
+    # 重试预算
+    retry_budget_ratio: float = DEFAULT_RETRY_BUDGET_RATIO
+    retry_budget_min_per_second: float = DEFAULT_RETRY_BUDGET_MIN_PER_SECOND
+    # 熔断器
+    circuit_breaker: CircuitBreakerSettings = field(default_factory=CircuitBreakerSettings)
+    # 模型路由：功能 -> 候选模型链
+    model_routes: Dict[str, List[str]] = field(default_factory=dict)
+
+    def concurrency(self, model: str) -> int:
+        return self.model_concurrency.get(model, self.default_concurrency)
+
+    def quota(self, model: str) -> Tuple[int, int]:
+        return self.rate_limits.get(model, (self.default_rpm, self.default_tpm))
+
+    def route(self, feature: str) -> List[str]:
+        return list(self.model_routes.get(feature) or DEFAULT_ROUTES.get(feature, [DEFAULT_TEXT_MODEL]))
+
+
+def _number(key: str, default, cast=int):
+    try:
+        return cast(get_config(key, default))
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid {key} config, using default")
+        return default
+
+
+def _json(key: str):
+    raw = get_config(key, "")
+    if not raw:
+        return None
+    try:
+        return json.loads(raw) if isinstance(raw, str) else raw
+    except ValueError:
+        logger.warning(f"Invalid {key} config, using defaults")
+        return None
+
+
+def _parse_concurrency(value) -> Dict[str, int]:
+    """gemini_model_concurrency：{"gemini-2.5-flash-image": 4, "gemini-2.0-flash": 16}"""
+    try:
+        return {str(model): max(1, int(limit)) for model, limit in (value or {}).items()}
+    except (AttributeError, TypeError, ValueError):
+        logger.warning("Invalid gemini_model_concurrency config, using default")
+        return {}
+
+
+def _parse_rate_limits(value, rpm: int, tpm: int) -> Dict[str, Tuple[int, int]]:
+    """gemini_rate_limits：{"gemini-2.0-flash": {"rpm": 2000, "tpm": 4000000}}"""
+    try:
+        return {
+            str(model): (max(1, int(limits.get("rpm", rpm))), max(1, int(limits.get("tpm", tpm))))
+            for model, limits in (value or {}).items()
+        }
+    except (AttributeError, TypeError, ValueError):
+        logger.warning("Invalid gemini_rate_limits config, using defaults")
+        return {}
+
+
+def _parse_routes(value) -> Dict[str, List[str]]:
+    """gemini_model_routes：{"try-on": ["gemini-2.5-flash-image", "..."]}"""
+    routes = {}
+    try:
+        for feature, chain in (value or {}).items():
+            if isinstance(chain, str):
+                chain = [chain]
+            models = [str(name) for name in chain or [] if name]
+            if models:
+                routes[str(feature)] = models
+    except (AttributeError, TypeError):
+        logger.warning("Invalid gemini_model_routes config, using defaults")
+        return {}
+    return routes
+
+
+def load_resilience_settings() -> ResilienceSettings:
+    """读取并解析全部弹性策略配置"""
+    rpm = max(1, _number("gemini_default_rpm", DEFAULT_RPM))
+    tpm = max(1, _number("gemini_default_tpm", DEFAULT_TPM))
+    breaker = CircuitBreakerSettings(**{
+        name: _number(f"circuit_breaker_{name}", float(default), float)
+        for name, default in CIRCUIT_BREAKER_DEFAULTS.items()
+    })
+    return ResilienceSettings(
+        model_concurrency=_parse_concurrency(_json("gemini_model_concurrency")),
+        default_concurrency=max(1, _number("gemini_default_concurrency", DEFAULT_CONCURRENCY)),
+        queue_size=_number("gemini_queue_size", DEFAULT_QUEUE_SIZE),
+        queue_timeout_seconds=_number("gemini_queue_timeout_seconds", DEFAULT_QUEUE_TIMEOUT),
+        rate_limits=_parse_rate_limits(_json("gemini_rate_limits"), rpm, tpm),
+        default_rpm=rpm,
+        default_tpm=tpm,
+        api_keys=get_config("gemini_api_keys", "") or "",
+        api_key=get_config("gemini_api_key", "") or "",
+        retry_budget_ratio=_number("gemini_retry_budget_ratio", DEFAULT_RETRY_BUDGET_RATIO, float),
+        retry_budget_min_per_second=_number(
+            "gemini_retry_budget_min_per_second", DEFAULT_RETRY_BUDGET_MIN_PER_SECOND, float
+        ),
+        circuit_breaker=breaker,
+        model_routes=_parse_routes(_json("gemini_model_routes")),
+    )
+
+
+# 当前快照：(配置生成号, 过期时间, 快照)
+_snapshot: Tuple[int, float, ResilienceSettings] | None = None
+
+
+def get_resilience_settings() -> ResilienceSettings:
+    """获取弹性策略配置快照（过期或配置缓存被清除后重新加载）"""
+    global _snapshot
+    now = time.monotonic()
+    generation = config_generation()
+    if _snapshot is None or _snapshot[0] != generation or _snapshot[1] <= now:
+        settings = load_resilience_settings()
+        # 首次加载会触发配置读取并更新生成号，以加载之后的生成号为准
+        _snapshot = (config_generation(), now + SNAPSHOT_TTL_SECONDS, settings)
+    return _snapshot[2]
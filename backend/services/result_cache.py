@@ -0,0 +1,419 @@
+"""
+AI 结果缓存模块
+
+按内容哈希缓存 AI 结果，重复提交相同图片时直接返回，不再消耗 Gemini 配额
+"""
+import hashlib
+import json
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Dict
+from services.config_service import get_config
+
+logger = logging.getLogger(__name__)
+
+
+def _atomic_write(path: str, data: bytes):
+    """
+    原子写入文件：先写入同目录下唯一的临时文件再替换
+
+    API 进程与 worker 进程可能同时写入同一个键，固定的临时文件名会互相覆盖
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def make_cache_key(*parts: str | bytes) -> str:
+    """根据若干部分计算缓存键（SHA-256）"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        # 写入长度前缀，避免不同切分方式拼出相同的字节序列
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    带 TTL 的 LRU 文本结果缓存
+
+    内存层按条目数淘汰最久未使用的结果；配置了 disk_dir 时，
+    结果同时写入磁盘，服务重启后仍可命中。磁盘读写通过 asyncio.to_thread 在线程中执行
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl_seconds: int, disk_dir: str | None = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir or None
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    async def get(self, key: str) -> str | None:
+        """读取缓存，未命中或已过期时返回 None"""
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        if self.disk_dir:
+            disk_entry = await asyncio.to_thread(self._read_disk, key)
+            if disk_entry is not None and disk_entry[0] > now:
+                self._put_memory(key, *disk_entry)
+                self.disk_hits += 1
+                return disk_entry[1]
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        """写入缓存"""
+        expires_at = time.time() + self.ttl_seconds
+        self._put_memory(key, expires_at, value)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, expires_at, value)
+
+    def clear(self):
+        """清空内存层缓存"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int | str | None]:
+        """缓存命中统计"""
+        return {
+            "name": self.name,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_dir": self.disk_dir,
+        }
+
+    def _put_memory(self, key: str, expires_at: float, value: str):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str) -> tuple[float, str] | None:
+        """读取磁盘文件（在线程中执行）"""
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to read cache file {path}: {str(e)}")
+            return None
+        if data["expires_at"] <= time.time():
+            # 过期文件顺手清理
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return data["expires_at"], data["value"]
+
+    def _write_disk(self, key: str, expires_at: float, value: str):
+        """写入磁盘文件（在线程中执行），原子替换，避免并发读取到写了一半的文件"""
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = json.dumps({"expires_at": expires_at, "value": value}, ensure_ascii=False)
+            _atomic_write(path, data.encode("utf-8"))
+        except OSError as e:
+            logger.warning(f"Failed to write cache file {path}: {str(e)}")
+
+
+class ByteBoundedCache:
+    """
+    按总字节数限制的二进制结果缓存
+
+    热数据保存在内存中，内存层超出 memory_bytes 时最久未使用的条目溢出到本地磁盘文件；
+    磁盘层超出 disk_bytes 时删除最旧的文件。索引只在事件循环中修改，
+    文件读写和删除通过 asyncio.to_thread 在线程中执行，不阻塞事件循环
+    """
+
+    def __init__(self, name: str, memory_bytes: int, disk_bytes: int, ttl_seconds: int, disk_dir: str):
+        self.name = name
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self._memory: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._memory_size = 0
+        # 磁盘层索引：key -> (过期时间, 文件大小)
+        self._disk: OrderedDict[str, tuple[float, int]] = OrderedDict()
+        self._disk_size = 0
+        # 正在写入磁盘的条目，写完之前仍可从这里读取
+        self._spilling: Dict[str, bytes] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.spills = 0
+        self.evictions = 0
+        os.makedirs(self.disk_dir, exist_ok=True)
+        self._load_disk_index()
+
+    async def get(self, key: str) -> bytes | None:
+        """读取缓存，未命中或已过期时返回 None"""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+            self._drop_memory(key)
+
+        value = self._spilling.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        disk_entry = self._pop_disk(key)
+        if disk_entry is not None:
+            expires_at, _ = disk_entry
+            # 从磁盘层取出（读取后删除文件），命中的数据重新提升到内存层
+            value = await asyncio.to_thread(self._take_file, key, expires_at > now)
+            if value is not None:
+                await self._put_memory(key, expires_at, value)
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: bytes):
+        """写入缓存"""
+        if self._pop_disk(key) is not None:
+            await asyncio.to_thread(self._remove_files, [key])
+        await self._put_memory(key, time.time() + self.ttl_seconds, value)
+
+    def stats(self) -> Dict[str, int | str | None]:
+        """缓存命中及容量统计"""
+        return {
+            "name": self.name,
+            "entries": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "max_memory_bytes": self.memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_size,
+            "max_disk_bytes": self.disk_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "spills": self.spills,
+            "evictions": self.evictions,
+            "disk_dir": self.disk_dir,
+        }
+
+    async def _put_memory(self, key: str, expires_at: float, value: bytes):
+        if key in self._memory:
+            self._drop_memory(key)
+        self._memory[key] = (expires_at, value)
+        self._memory_size += len(value)
+        spilled = []
+        now = time.time()
+        while self._memory_size > self.memory_bytes and self._memory:
+            old_key, (old_expires_at, old_value) = self._memory.popitem(last=False)
+            self._memory_size -= len(old_value)
+            if old_expires_at <= now:
+                continue
+            if len(old_value) > self.disk_bytes:
+                self.evictions += 1
+                continue
+            spilled.append((old_key, old_expires_at, old_value))
+        if spilled:
+            await self._spill(spilled)
+
+    def _drop_memory(self, key: str):
+        _, value = self._memory.pop(key)
+        self._memory_size -= len(value)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.bin")
+
+    async def _spill(self, entries: list[tuple[str, float, bytes]]):
+        """将从内存层淘汰的条目写入磁盘，并按 disk_bytes 删除最旧的文件"""
+        for key, _, value in entries:
+            self._spilling[key] = value
+        try:
+            written = await asyncio.to_thread(self._write_files, entries)
+        finally:
+            for key, _, _ in entries:
+                self._spilling.pop(key, None)
+
+        self.evictions += len(entries) - len(written)
+        for key, expires_at, size in written:
+            self._pop_disk(key)
+            self._disk[key] = (expires_at, size)
+            self._disk_size += size
+            self.spills += 1
+        evicted = []
+        while self._disk_size > self.disk_bytes and self._disk:
+            old_key = next(iter(self._disk))
+            self._pop_disk(old_key)
+            evicted.append(old_key)
+        if evicted:
+            self.evictions += len(evicted)
+            await asyncio.to_thread(self._remove_files, evicted)
+
+    def _pop_disk(self, key: str) -> tuple[float, int] | None:
+        """从磁盘层索引中移除（不删除文件）"""
+        entry = self._disk.pop(key, None)
+        if entry is not None:
+            self._disk_size -= entry[1]
+        return entry
+
+    def _write_files(self, entries: list[tuple[str, float, bytes]]) -> list[tuple[str, float, int]]:
+        """写入磁盘文件（在线程中执行），返回写入成功的 (key, 过期时间, 大小)"""
+        written = []
+        for key, expires_at, value in entries:
+            path = self._disk_path(key)
+            try:
+                _atomic_write(path, value)
+                # 用文件修改时间记录写入时间，便于重启后恢复过期时间
+                os.utime(path, (expires_at - self.ttl_seconds, expires_at - self.ttl_seconds))
+            except OSError as e:
+                logger.warning(f"Failed to spill cache entry to {path}: {str(e)}")
+                continue
+            written.append((key, expires_at, len(value)))
+        return written
+
+    def _take_file(self, key: str, read: bool) -> bytes | None:
+        """读取并删除磁盘文件（在线程中执行）；read 为 False 时只删除"""
+        path = self._disk_path(key)
+        value = None
+        if read:
+            try:
+                with open(path, "rb") as f:
+                    value = f.read()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Failed to read cache file {path}: {str(e)}")
+        self._remove_files([key])
+        return value
+
+    def _remove_files(self, keys: list[str]):
+        for key in keys:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def _load_disk_index(self):
+        """启动时扫描磁盘目录，恢复上次运行溢出的条目"""
+        now = time.time()
+        files = []
+        for filename in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, filename)
+            if not filename.endswith(".bin"):
+                # 清理上次中断留下的临时文件
+                if filename.endswith(".tmp"):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            expires_at = st.st_mtime + self.ttl_seconds
+            if expires_at <= now:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            files.append((st.st_mtime, filename[:-4], expires_at, st.st_size))
+        for _, key, expires_at, size in sorted(files):
+            self._disk[key] = (expires_at, size)
+            self._disk_size += size
+        evicted = []
+        while self._disk_size > self.disk_bytes and self._disk:
+            old_key = next(iter(self._disk))
+            self._pop_disk(old_key)
+            evicted.append(old_key)
+        self._remove_files(evicted)
+
+
+_analyze_cache: ResultCache | None = None
+_image_cache: ByteBoundedCache | None = None
+
+
+def _config_int(key: str, default: int) -> int:
+    try:
+        return int(get_config(key, default))
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid {key} config, using default")
+        return default
+
+
+def get_analyze_cache() -> ResultCache:
+    """获取中医/面相分析结果缓存单例"""
+    global _analyze_cache
+    if _analyze_cache is None:
+        _analyze_cache = ResultCache(
+            name="analyze",
+            max_entries=_config_int("analyze_cache_max_entries", 1000),
+            ttl_seconds=_config_int("analyze_cache_ttl_seconds", 86400),
+            disk_dir=get_config("analyze_cache_dir", ""),
+        )
+    return _analyze_cache
+
+
+def get_image_cache() -> ByteBoundedCache:
+    """获取生成图片（试穿/发型）结果缓存单例"""
+    global _image_cache
+    if _image_cache is None:
+        disk_dir = get_config("image_cache_dir", "") or os.path.join(
+            tempfile.gettempdir(), "ai-beauty-image-cache"
+        )
+        _image_cache = ByteBoundedCache(
+            name="image",
+            memory_bytes=_config_int("image_cache_memory_bytes", 64 * 1024 * 1024),
+            disk_bytes=_config_int("image_cache_disk_bytes", 1024 * 1024 * 1024),
+            ttl_seconds=_config_int("image_cache_ttl_seconds", 3600),
+            disk_dir=disk_dir,
+        )
+    return _image_cache
+
+
+def get_cache_stats() -> list[dict]:
+    """所有已创建缓存的统计信息"""
+    return [cache.stats() for cache in (_analyze_cache, _image_cache) if cache is not None]
@@ -0,0 +1,154 @@
+"""
+重试策略模块
+
+为每个调用点提供可配置的重试策略：全抖动指数退避、遵循服务端给出的重试间隔、
+单次请求的总时间预算，以及进程级重试预算（防止故障期间重试风暴放大流量）
+"""
+import asyncio
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict
+import httpx
+from google.genai import errors
+from services.resilience_settings import get_resilience_settings
+
+# 可重试的 HTTP 状态码：限流、服务端错误、网关超时（DeadlineExceeded 对应 504）
+DEFAULT_RETRY_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+# 可重试的网络层异常：连接被重置、读超时等
+RETRYABLE_EXCEPTIONS = (
+    httpx.TransportError,
+    ConnectionError,
+    asyncio.TimeoutError,
+)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    单个调用点的重试策略
+
+    Attributes:
+        max_attempts: 最多尝试次数（含首次）
+        base_delay: 退避基数（秒），第 n 次重试的等待上限为 base_delay * 2^n
+        max_delay: 单次等待上限（秒）
+        deadline: 整个调用（含所有重试和等待）的时间预算（秒），None 表示不限
+        attempt_timeout: 单次尝试的超时（秒），None 表示不限
+        retry_status: 可重试的 HTTP 状态码
+    """
+    max_attempts: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 20.0
+    deadline: float | None = 60.0
+    attempt_timeout: float | None = None
+    retry_status: frozenset = field(default=DEFAULT_RETRY_STATUS)
+
+    def is_retryable(self, exc: BaseException) -> bool:
+        if isinstance(exc, errors.APIError):
+            return exc.code in self.retry_status
+        return isinstance(exc, RETRYABLE_EXCEPTIONS)
+
+    def backoff(self, retry_index: int) -> float:
+        """全抖动（full jitter）退避：在 [0, min(max_delay, base * 2^n)] 中均匀取值"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry_index))
+
+    def next_delay(self, retry_index: int, exc: BaseException) -> float:
+        """计算下一次重试前的等待时间，服务端给出重试间隔时以其为下限"""
+        delay = self.backoff(retry_index)
+        hint = retry_hint(exc)
+        if hint is not None:
+            delay = max(delay, hint)
+        return delay
+
+
+_DURATION_RE = re.compile(r"^\s*([\d.]+)\s*s\s*$")
+
+
+def retry_hint(exc: BaseException) -> float | None:
+    """
+    从异常中提取服务端建议的重试间隔（秒）
+
+    依次尝试 HTTP Retry-After 响应头和 google.rpc.RetryInfo 中的 retryDelay
+    """
+    if not isinstance(exc, errors.APIError):
+        return None
+
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                pass
+
+    details = getattr(exc, "details", None)
+    if isinstance(details, dict):
+        error = details.get("error", details)
+        for item in error.get("details", []) if isinstance(error, dict) else []:
+            if isinstance(item, dict) and str(item.get("@type", "")).endswith("RetryInfo"):
+                match = _DURATION_RE.match(str(item.get("retryDelay", "")))
+                if match:
+                    return float(match.group(1))
+    return None
+
+
+class RetryBudget:
+    """
+    进程级重试预算
+
+    每个首次请求存入 ratio 个令牌，每次重试消耗 1 个；另有每秒 min_per_second 个保底令牌。
+    正常情况下重试不受影响，上游整体故障时重试量被限制在请求量的 ratio 倍以内。
+    """
+
+    def __init__(self):
+        # 首次使用时装满（见 _refill），冷启动后第一次故障也能重试
+        self.tokens: float | None = None
+        self.updated = time.monotonic()
+        self.requests = 0
+        self.retries = 0
+        self.denied = 0
+
+    def _settings(self) -> tuple[float, float]:
+        settings = get_resilience_settings()
+        return settings.retry_budget_ratio, settings.retry_budget_min_per_second
+
+    def _refill(self, ratio: float, min_per_second: float):
+        now = time.monotonic()
+        # 令牌上限：10 秒保底量 + 100 次请求对应的额度
+        cap = min_per_second * 10 + ratio * 100
+        if self.tokens is None:
+            self.tokens = cap
+        self.tokens = min(cap, self.tokens + (now - self.updated) * min_per_second)
+        self.updated = now
+
+    def record_request(self):
+        ratio, min_per_second = self._settings()
+        self._refill(ratio, min_per_second)
+        self.requests += 1
+        self.tokens += ratio
+
+    def try_acquire(self) -> bool:
+        """尝试为一次重试取得预算"""
+        ratio, min_per_second = self._settings()
+        self._refill(ratio, min_per_second)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.retries += 1
+            return True
+        self.denied += 1
+        return False
+
+    def stats(self) -> Dict[str, int | float]:
+        return {
+            "tokens": round(self.tokens, 2) if self.tokens is not None else None,
+            "requests": self.requests,
+            "retries": self.retries,
+            "denied": self.denied,
+        }
+
+
+retry_budget = RetryBudget()
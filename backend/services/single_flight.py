@@ -0,0 +1,63 @@
+"""
+单飞（single-flight）请求合并模块
+
+相同键的并发请求只执行一次上游调用，所有等待者共享同一个结果（或异常）
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    按键合并进行中的异步调用
+
+    第一个请求（leader）启动实际调用，之后到达的相同键请求直接等待该调用完成。
+    调用以独立任务运行：某个等待者被取消（如客户端断开）不会取消共享调用。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行或加入键为 key 的调用
+
+        Args:
+            key: 请求指纹
+            fn: 无参协程函数，仅在没有相同键的进行中调用时执行
+
+        Returns:
+            共享调用的结果
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+        else:
+            self.coalesced += 1
+            logger.info(f"Coalesced in-flight request {key[:12]} ({self.name})")
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有等待者都已取消时读取异常，避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int | str]:
+        """合并统计"""
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
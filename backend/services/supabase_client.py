@@ -1,33 +1,109 @@
 """
 Supabase 客户端模块
 
-提供 Supabase 客户端的初始化和管理
+提供 Supabase 客户端的初始化和管理；返回的客户端按表和操作记录调用耗时（见 services.metrics）
 """
+import time
 from supabase import create_client, Client
 from config import get_settings
+from services.metrics import supabase_call_duration_seconds, supabase_errors_total
 
+# 查询构建器上决定操作类型的方法
+_OPERATIONS = {"select", "insert", "update", "upsert", "delete"}
 
-def get_supabase_client() -> Client:
+
+def _timed(func, table: str, operation: str):
+    """执行一次 Supabase 请求并记录耗时，失败时计数"""
+    def call(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            supabase_errors_total.inc(table, operation)
+            raise
+        finally:
+            supabase_call_duration_seconds.observe(time.perf_counter() - started, table, operation)
+    return call
+
+
+class _QueryProxy:
+    """
+    包装 table() 返回的查询构建器
+
+    链式调用返回的构建器继续被包装，第一个 select / insert / update / upsert / delete
+    确定操作类型，execute() 时计时
+    """
+    __slots__ = ("_builder", "_table", "_operation")
+
+    def __init__(self, builder, table: str, operation: str = "unknown"):
+        self._builder = builder
+        self._table = table
+        self._operation = operation
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._builder, name)
+        if name == "execute":
+            return _timed(attr, self._table, self._operation)
+        if not callable(attr):
+            return attr
+        operation = name if self._operation == "unknown" and name in _OPERATIONS else self._operation
+
+        def chain(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return _QueryProxy(result, self._table, operation) if result is not None else result
+        return chain
+
+
+class _AuthProxy:
+    """包装 client.auth，每个方法按 auth 表记录耗时"""
+    __slots__ = ("_auth",)
+
+    def __init__(self, auth):
+        self._auth = auth
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._auth, name)
+        return _timed(attr, "auth", name) if callable(attr) else attr
+
+
+class InstrumentedClient:
+    """记录调用耗时的 Supabase 客户端，除 table / rpc / auth 外的属性直接转发"""
+
+    def __init__(self, client: Client):
+        self._client = client
+        self.auth = _AuthProxy(client.auth)
+
+    def table(self, name: str) -> _QueryProxy:
+        return _QueryProxy(self._client.table(name), name)
+
+    def rpc(self, fn: str, *args, **kwargs) -> _QueryProxy:
+        return _QueryProxy(self._client.rpc(fn, *args, **kwargs), f"rpc:{fn}", "rpc")
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+
+def get_supabase_client() -> InstrumentedClient:
     """
     获取 Supabase 客户端实例
     
     使用 service_role_key 以便后端拥有完整权限
     """
     settings = get_settings()
-    return create_client(
+    return InstrumentedClient(create_client(
         settings.supabase_url,
         settings.supabase_service_role_key
-    )
+    ))
 
 
-def get_supabase_anon_client() -> Client:
+def get_supabase_anon_client() -> InstrumentedClient:
     """
     获取匿名权限的 Supabase 客户端
     
     用于前端认证场景的模拟
     """
     settings = get_settings()
-    return create_client(
+    return InstrumentedClient(create_client(
         settings.supabase_url,
         settings.supabase_anon_key
-    )
+    ))
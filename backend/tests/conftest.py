@@ -0,0 +1,57 @@
+"""
+测试公共夹具
+
+测试不连接 Supabase：system_config 的内容直接写入 ConfigService 的缓存，
+未设置的配置项回退到 Settings 默认值
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.config_service import ConfigService  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def system_config(monkeypatch):
+    """
+    模拟已读取的 system_config 表
+
+    返回 set_config(**values)：写入配置项并递增配置生成号，使派生的配置快照失效
+    """
+    monkeypatch.setattr(ConfigService, "_config_cache", {})
+    monkeypatch.setattr(ConfigService, "_loaded", True)
+
+    def set_config(**values):
+        ConfigService._config_cache.update(values)
+        ConfigService._generation += 1
+
+    set_config()
+    yield set_config
+    ConfigService._generation += 1
+
+
+# 1x1 透明 PNG
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489"
+    "0000000d49444154789c6360606060000000050001a5f645400000000049454e44ae426082"
+)
+
+
+@pytest.fixture
+def user():
+    return {"id": "user-1", "credits": 10, "is_admin": False}
+
+
+@pytest.fixture
+def client(user):
+    """完整应用（含中间件）的测试客户端，跳过 Supabase 认证"""
+    from fastapi.testclient import TestClient
+    from main import app
+    from middleware.auth import get_current_user
+
+    app.dependency_overrides[get_current_user] = lambda: user
+    yield TestClient(app)
+    app.dependency_overrides.clear()
@@ -0,0 +1,98 @@
+"""准入控制：优先级出队顺序、队列上限、付费用户判定"""
+import asyncio
+import threading
+
+import pytest
+
+from api import ai
+from services.admission import (
+    ModelGate, AdmissionRejected, admission_controller, request_priority, PRIORITY_PAID, PRIORITY_NORMAL
+)
+
+
+@pytest.fixture(autouse=True)
+def limits(system_config):
+    system_config(gemini_default_concurrency=1, gemini_queue_size=4, gemini_queue_timeout_seconds=5)
+
+
+async def admit_in_order(gate: ModelGate, priorities: list[int]) -> list[int]:
+    """占满名额后按给定优先级依次排队，返回各等待者的出队顺序"""
+    order = []
+
+    async def waiter(index: int, priority: int):
+        await gate.acquire(priority, None)
+        order.append(index)
+        gate.release()
+
+    await gate.acquire(PRIORITY_NORMAL, None)
+    tasks = []
+    for index, priority in enumerate(priorities):
+        tasks.append(asyncio.create_task(waiter(index, priority)))
+        await asyncio.sleep(0)
+    gate.release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_paid_waiters_leave_queue_first():
+    gate = ModelGate("m")
+    order = asyncio.run(admit_in_order(gate, [PRIORITY_NORMAL, PRIORITY_PAID, PRIORITY_NORMAL, PRIORITY_PAID]))
+    # 付费用户先出队，同优先级按入队顺序
+    assert order == [1, 3, 0, 2]
+    assert gate.active == 0
+    assert gate.admitted == 5
+
+
+def test_full_queue_rejects():
+    gate = ModelGate("m")
+
+    async def run():
+        await gate.acquire(PRIORITY_NORMAL, None)
+        tasks = [asyncio.create_task(gate.acquire(PRIORITY_NORMAL, None)) for _ in range(4)]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await gate.acquire(PRIORITY_PAID, None)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(run())
+    assert gate.rejected == 1
+
+
+def test_queue_deadline_rejects():
+    gate = ModelGate("m")
+
+    async def run():
+        await gate.acquire(PRIORITY_NORMAL, None)
+        loop = asyncio.get_running_loop()
+        with pytest.raises(AdmissionRejected):
+            await gate.acquire(PRIORITY_NORMAL, loop.time() - 1)
+
+    asyncio.run(run())
+    assert gate.timeouts == 1
+    assert gate.queued == 0
+
+
+def test_paid_user_lookup_runs_off_loop(monkeypatch):
+    threads = []
+
+    def query(user_id):
+        threads.append(threading.current_thread())
+        return True
+
+    monkeypatch.setattr(ai, "_query_paid_user", query)
+    monkeypatch.setattr(ai, "_paid_user_cache", {})
+    monkeypatch.setattr(ai.model_router, "ensure_available", lambda feature: feature)
+    monkeypatch.setattr(admission_controller, "_gates", {})
+
+    async def run():
+        await ai.admit_request({"id": "user-1"}, "analyze")
+        priority = request_priority.get()
+        # 第二次命中缓存，不再查询
+        await ai.admit_request({"id": "user-1"}, "analyze")
+        return priority
+
+    assert asyncio.run(run()) == PRIORITY_PAID
+    assert len(threads) == 1
+    assert threads[0] is not threading.main_thread()
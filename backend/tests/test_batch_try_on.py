@@ -0,0 +1,134 @@
+"""批量试穿：部分失败时退还未生成件数的魔法值"""
+import asyncio
+import base64
+import json
+
+import pytest
+
+from api import ai
+from services.image_service import PreparedImage
+from tests.conftest import PNG_BYTES
+
+PNG_B64 = base64.b64encode(PNG_BYTES).decode("ascii")
+
+
+@pytest.fixture
+def refunds(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ai, "refund_credits", lambda user_id, amount: calls.append((user_id, amount)))
+    return calls
+
+
+@pytest.fixture
+def generate(monkeypatch):
+    """第 failing 件（按 item_image 内容识别）生成失败"""
+    failing = set()
+
+    async def prepare_image(image, purpose):
+        return PreparedImage(data=image if isinstance(image, bytes) else image.encode())
+
+    async def admit_request(current_user, *features):
+        pass
+
+    async def consume_credit(user_id, current_credits, amount=1):
+        return current_credits - amount
+
+    async def generate_try_on_image(face_image, item_image, height, body_type, try_on_type):
+        if item_image.data.decode() in failing:
+            raise RuntimeError("no image")
+        return PNG_B64
+
+    monkeypatch.setattr(ai, "prepare_image", prepare_image)
+    monkeypatch.setattr(ai, "admit_request", admit_request)
+    monkeypatch.setattr(ai, "consume_credit", consume_credit)
+    monkeypatch.setattr(ai.gemini_service, "generate_try_on_image", generate_try_on_image)
+    return failing
+
+
+def batch(*names):
+    return {
+        "face_image": "face",
+        "items": [{"item_image": name, "try_on_type": "clothing"} for name in names],
+    }
+
+
+def test_json_refunds_failed_items(client, generate, refunds):
+    generate.update({"b", "c"})
+    response = client.post("/api/ai/try-on/batch", json=batch("a", "b", "c"))
+    assert response.status_code == 200
+    body = response.json()
+    assert body["failed_items"] == [1, 2]
+    assert body["images"][0].startswith("data:image/png;base64,")
+    assert refunds == [("user-1", 2)]
+
+
+def test_json_all_failed_refunds_everything(client, generate, refunds):
+    generate.update({"a", "b"})
+    response = client.post("/api/ai/try-on/batch", json=batch("a", "b"))
+    assert response.status_code == 500
+    assert refunds == [("user-1", 2)]
+
+
+def test_json_success_keeps_credits(client, generate, refunds):
+    response = client.post("/api/ai/try-on/batch", json=batch("a", "b"))
+    assert response.json()["failed_items"] == []
+    assert refunds == []
+
+
+def test_event_stream_refunds_failed_items(client, generate, refunds):
+    generate.add("b")
+    response = client.post(
+        "/api/ai/try-on/batch", json=batch("a", "b", "c"), headers={"Accept": "text/event-stream"}
+    )
+    events = [line for line in response.text.splitlines() if line.startswith("event:")]
+    assert events.count("event: item") == 2
+    assert events.count("event: item_failed") == 1
+    done = response.text.split("event: done\ndata: ", 1)[1].split("\n", 1)[0]
+    assert json.loads(done)["failed_items"] == [1]
+    assert refunds == [("user-1", 1)]
+
+
+def test_event_stream_disconnect_refunds_undelivered(refunds):
+    async def remaining():
+        yield 1, PNG_B64
+        yield 2, PNG_B64
+
+    async def run():
+        events = ai.batch_try_on_events("user-1", 3, ai.OutputSpec(), (0, PNG_B64), remaining())
+        assert (await anext(events)).startswith("event: item")
+        # 客户端断开：StreamingResponse 关闭生成器
+        await events.aclose()
+
+    asyncio.run(run())
+    assert refunds == [("user-1", 2)]
+
+
+def test_event_stream_cancelled_refunds_undelivered(refunds):
+    async def remaining():
+        await asyncio.sleep(10)
+        yield 1, PNG_B64
+
+    async def consume():
+        async for _ in ai.batch_try_on_events("user-1", 2, ai.OutputSpec(), (0, PNG_B64), remaining()):
+            pass
+
+    async def run():
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert refunds == [("user-1", 1)]
+
+
+def test_form_with_mismatched_items_is_rejected(client, generate, refunds):
+    response = client.post(
+        "/api/ai/try-on/batch",
+        data={"try_on_type": ["clothing"]},
+        files=[("face_image", ("f.png", b"face")), ("item_image", ("a.png", b"a")), ("item_image", ("b.png", b"b"))],
+    )
+    assert response.status_code == 422
+    assert "数量不一致" in response.text
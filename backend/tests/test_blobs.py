@@ -0,0 +1,141 @@
+"""Blob 签名 URL 与下载端点（签名校验、ETag、Range）"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api import blobs
+from api.blobs import parse_range
+from services import blob_store
+from services.blob_store import BlobSigningUnavailable, LocalBlobStore, sign_blob, verify_blob_signature
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def signing(system_config):
+    system_config(blob_signing_secret="test-secret", supabase_service_role_key="")
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, signing):
+    monkeypatch.setattr(blob_store, "_blob_store", LocalBlobStore(str(tmp_path)))
+    app = FastAPI()
+    app.include_router(blobs.router, prefix="/api")
+    return TestClient(app)
+
+
+@pytest.fixture
+def blob_url(client):
+    key = blob_store.make_blob_key(DATA, "image/png")
+    blob_store.get_blob_store().put(key, DATA)
+    return blob_store.signed_blob_url(key)
+
+
+def test_signature_round_trip(signing):
+    expires = int(time.time()) + 60
+    signature = sign_blob("a" * 64 + ".png", expires)
+    assert verify_blob_signature("a" * 64 + ".png", expires, signature)
+    assert not verify_blob_signature("b" * 64 + ".png", expires, signature)
+    assert not verify_blob_signature("a" * 64 + ".png", expires + 1, signature)
+
+
+def test_expired_signature_is_invalid(signing):
+    expires = int(time.time()) - 1
+    assert not verify_blob_signature("a" * 64 + ".png", expires, sign_blob("a" * 64 + ".png", expires))
+
+
+def test_refuses_to_sign_without_secret(system_config):
+    system_config(blob_signing_secret="", supabase_service_role_key="")
+    with pytest.raises(BlobSigningUnavailable):
+        sign_blob("a" * 64 + ".png", int(time.time()) + 60)
+    assert not verify_blob_signature("a" * 64 + ".png", int(time.time()) + 60, "0" * 64)
+
+
+def test_service_role_key_is_not_a_signing_secret(system_config):
+    system_config(blob_signing_secret="", supabase_service_role_key="service-role")
+    assert not blob_store.blob_signing_enabled()
+    with pytest.raises(BlobSigningUnavailable):
+        sign_blob("a" * 64 + ".png", int(time.time()) + 60)
+
+
+def test_download_full_blob(client, blob_url):
+    response = client.get(blob_url)
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["accept-ranges"] == "bytes"
+
+    cached = client.get(blob_url, headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+
+
+def test_bad_signature_is_rejected(client, blob_url):
+    assert client.get(blob_url[:-4] + "0000").status_code == 403
+
+
+def test_range_request(client, blob_url):
+    response = client.get(blob_url, headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == DATA[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(DATA)}"
+
+    suffix = client.get(blob_url, headers={"Range": "bytes=-5"})
+    assert suffix.content == DATA[-5:]
+
+    unsatisfiable = client.get(blob_url, headers={"Range": f"bytes={len(DATA)}-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == f"bytes */{len(DATA)}"
+
+
+def test_if_range_mismatch_returns_full_body(client, blob_url):
+    response = client.get(blob_url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-0", (0, 0)),
+    ("bytes=5-", (5, 99)),
+    ("bytes=90-200", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-0", None),
+    ("bytes=50-40", None),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+    ("bytes=abc", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+def test_job_results_are_signed_when_read(signing):
+    from services.image_output import BLOB_REF_PREFIX, sign_blob_refs
+
+    key = "c" * 64 + ".webp"
+    result = {"image": BLOB_REF_PREFIX + key, "items": [None, BLOB_REF_PREFIX + key], "message": "blob:note"}
+    signed = sign_blob_refs(result, "http://testserver/")
+    assert signed["image"].startswith(f"http://testserver/api/blobs/{key}?expires=")
+    assert signed["items"][1] == signed["image"]
+    assert signed["message"] == "blob:note"
+
+
+def test_head_matches_get_and_is_hidden_from_openapi(client, blob_url):
+    response = client.head(blob_url)
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(len(DATA))
+    assert response.content == b""
+    operation = client.get("/openapi.json").json()["paths"]["/api/blobs/{key}"]
+    assert set(operation) == {"get"}
+
+
+def test_concurrent_puts_of_same_key(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    key = blob_store.make_blob_key(DATA, "image/png")
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: store.put(key, DATA), range(32)))
+    assert store.get(key).data == DATA
+    assert not [name for _, _, names in os.walk(tmp_path) for name in names if name.endswith(".tmp")]
@@ -0,0 +1,58 @@
+"""请求体大小限制：在认证和解析之前拒绝超限请求"""
+import json
+
+import pytest
+
+from api import ai
+from middleware.auth import get_current_user
+
+
+@pytest.fixture(autouse=True)
+def limits(system_config):
+    system_config(request_body_limits=json.dumps({"/api/ai/analyze": 1024}), request_body_max_bytes=512)
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """记录请求是否进入了认证或请求体解析"""
+    calls = []
+
+    async def prepare_image(image, purpose):
+        calls.append("prepare_image")
+        raise ai.ImageDecodeError("无法识别的图片格式")
+
+    monkeypatch.setattr(ai, "prepare_image", prepare_image)
+    return calls
+
+
+def test_declared_length_over_limit_is_rejected(client, parsed):
+    client.app.dependency_overrides[get_current_user] = lambda: parsed.append("auth")
+    response = client.post(
+        "/api/ai/analyze",
+        content=b"x" * 2048,
+        headers={"Content-Type": "application/json"},
+    )
+    assert response.status_code == 413
+    assert "请求体过大" in response.json()["detail"]
+    assert parsed == []
+
+
+def test_chunked_body_over_limit_is_rejected(client, parsed):
+    def chunks():
+        for _ in range(4):
+            yield b"x" * 512
+
+    response = client.post("/api/ai/analyze", content=chunks(), headers={"Content-Type": "application/json"})
+    assert response.status_code == 413
+    assert parsed == []
+
+
+def test_other_routes_use_default_limit(client):
+    response = client.post("/api/auth/login", content=b"x" * 600, headers={"Content-Type": "application/json"})
+    assert response.status_code == 413
+
+
+def test_body_within_limit_passes_through(client, parsed):
+    response = client.post("/api/ai/analyze", json={"image": "x", "analysis_type": "tongue"})
+    assert response.status_code == 400
+    assert parsed == ["prepare_image"]
@@ -0,0 +1,132 @@
+"""熔断器状态转换"""
+import asyncio
+
+import pytest
+
+from services import circuit_breaker as cb
+from services import gemini_service
+from services.circuit_breaker import CircuitBreaker, CircuitOpen
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的 time.monotonic"""
+    now = [1000.0]
+    monkeypatch.setattr(cb.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture(autouse=True)
+def thresholds(system_config):
+    system_config(
+        circuit_breaker_min_requests=4,
+        circuit_breaker_error_rate=0.5,
+        circuit_breaker_slow_call_seconds=10,
+        circuit_breaker_slow_call_rate=0.75,
+        circuit_breaker_open_seconds=30,
+        circuit_breaker_half_open_probes=1,
+    )
+
+
+def trip(breaker: CircuitBreaker):
+    for _ in range(4):
+        breaker.record(failed=True, latency=0.1)
+
+
+def test_stays_closed_below_min_requests(clock):
+    breaker = CircuitBreaker("m")
+    for _ in range(3):
+        breaker.record(failed=True, latency=0.1)
+    assert breaker.state == cb.STATE_CLOSED
+    breaker.check()
+
+
+def test_opens_on_error_rate_and_rejects(clock):
+    breaker = CircuitBreaker("m")
+    breaker.record(failed=False, latency=0.1)
+    breaker.record(failed=False, latency=0.1)
+    breaker.record(failed=True, latency=0.1)
+    breaker.record(failed=True, latency=0.1)
+    assert breaker.state == cb.STATE_OPEN
+    with pytest.raises(CircuitOpen) as info:
+        breaker.check()
+    assert info.value.retry_after == 30
+    assert breaker.rejected == 1
+
+
+def test_opens_on_slow_calls(clock):
+    breaker = CircuitBreaker("m")
+    breaker.record(failed=False, latency=0.1)
+    for _ in range(3):
+        breaker.record(failed=False, latency=12)
+    assert breaker.state == cb.STATE_OPEN
+
+
+def test_half_open_probe_success_closes(clock):
+    breaker = CircuitBreaker("m")
+    trip(breaker)
+    clock[0] += 30
+    assert not breaker.is_open()
+    assert breaker.state == cb.STATE_HALF_OPEN
+
+    breaker.acquire()
+    # 探测名额用完后，其余请求仍被拒绝
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    breaker.record(failed=False, latency=0.1)
+    assert breaker.state == cb.STATE_CLOSED
+    breaker.check()
+
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = CircuitBreaker("m")
+    trip(breaker)
+    clock[0] += 30
+    breaker.acquire()
+    breaker.record(failed=True, latency=0.1)
+    assert breaker.state == cb.STATE_OPEN
+    assert breaker.trips == 2
+
+
+def test_release_returns_probe(clock):
+    breaker = CircuitBreaker("m")
+    trip(breaker)
+    clock[0] += 30
+    breaker.acquire()
+    breaker.release()
+    breaker.acquire()
+
+
+def test_old_calls_leave_window(clock):
+    breaker = CircuitBreaker("m")
+    for _ in range(3):
+        breaker.record(failed=True, latency=0.1)
+    clock[0] += 61
+    breaker.record(failed=True, latency=0.1)
+    assert breaker.state == cb.STATE_CLOSED
+
+
+def test_settings_snapshot_follows_config_changes(clock, system_config):
+    breaker = CircuitBreaker("m")
+    system_config(circuit_breaker_min_requests=2)
+    breaker.record(failed=True, latency=0.1)
+    breaker.record(failed=True, latency=0.1)
+    assert breaker.state == cb.STATE_OPEN
+
+
+def test_key_selection_failure_releases_probe(clock, monkeypatch):
+    breaker = CircuitBreaker("probe-model")
+    trip(breaker)
+    clock[0] += 30
+    monkeypatch.setattr(gemini_service.circuit_breakers, "get", lambda name: breaker)
+
+    def no_keys(model, exclude=None):
+        raise ValueError("未配置 Gemini API 密钥")
+
+    monkeypatch.setattr(gemini_service.key_pool, "select", no_keys)
+    model = gemini_service.GeminiModel(None, "", "probe-model")
+    with pytest.raises(ValueError):
+        asyncio.run(gemini_service.call_gemini_with_retry(model, ["hi"]))
+    assert breaker.state == cb.STATE_HALF_OPEN
+    assert breaker.probes == 0
+    breaker.check()
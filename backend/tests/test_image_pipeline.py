@@ -0,0 +1,81 @@
+"""后端与 Serverless 共用的图片处理流水线"""
+import asyncio
+import base64
+import io
+import threading
+
+import pytest
+from PIL import Image
+
+from services import image_output, image_service
+from services.image_output import OutputSpec, encode_image
+from services.image_pipeline import accepted_format, image_headers, normalize_format
+
+
+def png(width: int, height: int, mode: str = "RGBA") -> bytes:
+    out = io.BytesIO()
+    Image.new(mode, (width, height)).save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_format_negotiation():
+    assert normalize_format(" JPG ") == "jpeg"
+    assert normalize_format("gif") is None
+    assert accepted_format("image/png;q=0.5, image/webp") == "webp"
+    assert accepted_format("image/*, */*") is None
+
+
+def test_backend_uses_shared_defaults():
+    import _image_pipeline
+    assert image_service.DEFAULT_MAX_EDGE is _image_pipeline.DEFAULT_MAX_EDGE
+    assert image_output.SIZE_PRESETS is _image_pipeline.SIZE_PRESETS
+
+
+def test_normalize_flattens_and_resizes():
+    data, width, height = image_service.normalize_image(png(3000, 1500), 1024)
+    assert (width, height) == (1024, 512)
+    assert Image.open(io.BytesIO(data)).format == "JPEG"
+
+
+def test_image_headers():
+    headers = image_headers("image/png", png(4, 3), "try-on")
+    assert headers["X-Image-Width"] == "4"
+    assert headers["X-Image-Height"] == "3"
+    assert headers["Content-Disposition"].endswith('filename="try-on.png"')
+
+
+def test_transcode_in_process_pool(tmp_path, system_config, monkeypatch):
+    from services import result_cache
+    monkeypatch.setattr(result_cache, "_image_cache", None)
+    system_config(image_cache_dir=str(tmp_path))
+    source = base64.b64encode(png(800, 400, "RGB")).decode("ascii")
+    try:
+        mime_type, encoded = asyncio.run(encode_image(source, OutputSpec(format="webp", size="preview")))
+    finally:
+        image_output.shutdown_output_executor()
+        monkeypatch.setattr(result_cache, "_image_cache", None)
+    assert mime_type == "image/webp"
+    assert Image.open(io.BytesIO(base64.b64decode(encoded))).size == (512, 256)
+
+
+def test_prepare_image_decodes_off_loop(monkeypatch):
+    threads = []
+    decode = image_service.decode_upload
+
+    def tracked(image):
+        threads.append(threading.current_thread())
+        return decode(image)
+
+    monkeypatch.setattr(image_service, "decode_upload", tracked)
+    prepared = asyncio.run(image_service.prepare_image(base64.b64encode(png(8, 8)).decode(), "analyze"))
+    assert prepared.data.startswith(b"\xff\xd8")
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_heic_upload_is_normalized():
+    pillow_heif = pytest.importorskip("pillow_heif")
+    out = io.BytesIO()
+    pillow_heif.from_pillow(Image.new("RGB", (64, 48), "red")).save(out, quality=80)
+    prepared = asyncio.run(image_service.prepare_image(out.getvalue(), "analyze"))
+    assert Image.open(io.BytesIO(prepared.data)).format == "JPEG"
+    assert (prepared.width, prepared.height) == (64, 48)
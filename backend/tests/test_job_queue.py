@@ -0,0 +1,162 @@
+"""异步任务队列：领取顺序、租约续期与过期，以及失败任务退还魔法值"""
+import asyncio
+
+import pytest
+
+import worker
+from services import config_service, job_queue
+from services.job_queue import JobQueue, STATUS_FAILED, STATUS_RUNNING, STATUS_SUCCEEDED
+from services.resilience_settings import get_resilience_settings
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(job_queue.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch, system_config):
+    system_config(job_lease_seconds=60, job_max_attempts=2)
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(job_queue, "_job_queue", queue)
+    return queue
+
+
+def test_claim_orders_by_priority_then_age(queue, clock):
+    low = queue.enqueue("try-on", "u1", {}, priority=2)
+    clock[0] += 1
+    high = queue.enqueue("try-on", "u2", {}, priority=0)
+    clock[0] += 1
+    normal = queue.enqueue("try-on", "u3", {}, priority=1)
+
+    assert [queue.claim("w")["id"] for _ in range(3)] == [high, normal, low]
+    assert queue.claim("w") is None
+
+
+def test_claimed_job_is_leased(queue, clock):
+    job_id = queue.enqueue("try-on", "u1", {"a": 1})
+    job = queue.claim("w1")
+    assert job["id"] == job_id
+    assert job["worker"] == "w1"
+    assert job["status"] == STATUS_RUNNING
+    assert job["attempts"] == 1
+    assert job["payload"] == {"a": 1}
+    # 租约有效期内不会被其他 worker 领取
+    clock[0] += 59
+    assert queue.claim("w2") is None
+
+
+def test_expired_lease_is_reclaimed(queue, clock):
+    job_id = queue.enqueue("try-on", "u1", {})
+    queue.claim("w1")
+    clock[0] += 61
+    job = queue.claim("w2")
+    assert job["id"] == job_id
+    assert job["attempts"] == 2
+    # 原 worker 失去租约后不能再写入结果
+    assert not queue.complete(job_id, {"ok": True}, "w1")
+    assert queue.complete(job_id, {"ok": True}, "w2")
+    assert queue.get(job_id)["status"] == STATUS_SUCCEEDED
+
+
+def test_renew_extends_lease(queue, clock):
+    job_id = queue.enqueue("try-on", "u1", {})
+    queue.claim("w1")
+    clock[0] += 50
+    assert queue.renew(job_id, "w1")
+    clock[0] += 50
+    assert queue.claim("w2") is None
+    assert not queue.renew(job_id, "w2")
+
+
+def test_expire_fails_jobs_out_of_attempts(queue, clock):
+    job_id = queue.enqueue("try-on", "u1", {})
+    queue.claim("w1")
+    clock[0] += 61
+    queue.claim("w2")
+    clock[0] += 61
+    assert queue.claim("w3") is None
+    expired = queue.expire()
+    assert [job["id"] for job in expired] == [job_id]
+    assert queue.get(job_id)["status"] == STATUS_FAILED
+    assert queue.expire() == []
+
+
+@pytest.fixture
+def refunds(monkeypatch):
+    calls = []
+    monkeypatch.setattr(worker, "refund_credits", lambda user_id, amount: calls.append((user_id, amount)))
+    return calls
+
+
+def test_failed_job_refunds_credit(queue, refunds, monkeypatch):
+    async def boom(payload):
+        raise RuntimeError("gemini down")
+
+    monkeypatch.setitem(worker.JOB_HANDLERS, "try-on", boom)
+    job_id = queue.enqueue("try-on", "u1", {"credits": 1})
+    asyncio.run(worker.run_job(queue.claim("w1")))
+    assert queue.get(job_id)["status"] == STATUS_FAILED
+    assert refunds == [("u1", 1)]
+
+
+def test_succeeded_job_keeps_credit(queue, refunds, monkeypatch):
+    async def ok(payload):
+        return {"success": True}
+
+    monkeypatch.setitem(worker.JOB_HANDLERS, "try-on", ok)
+    job_id = queue.enqueue("try-on", "u1", {"credits": 1})
+    asyncio.run(worker.run_job(queue.claim("w1")))
+    assert queue.get(job_id)["result"] == {"success": True}
+    assert refunds == []
+
+
+def test_timed_out_job_refunds_credit(queue, refunds, clock):
+    queue.enqueue("try-on", "u1", {"credits": 1})
+    queue.claim("w1")
+    clock[0] += 61
+    queue.claim("w2")
+    clock[0] += 61
+    asyncio.run(worker.expire_jobs())
+    assert refunds == [("u1", 1)]
+
+
+
+class FakeSupabase:
+    """只支持 system_config 查询的 Supabase 替身"""
+
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+        self.data = None
+
+    def table(self, name: str):
+        return self
+
+    def select(self, *columns: str):
+        return self
+
+    def execute(self):
+        self.data = list(self.rows)
+        return self
+
+
+def test_worker_refreshes_config(monkeypatch):
+    supabase = FakeSupabase([{"key": "gemini_api_keys", "value": "old-key"}])
+    monkeypatch.setattr(config_service, "get_supabase_client", lambda: supabase)
+    monkeypatch.setattr(worker, "CONFIG_REFRESH_INTERVAL", 0.01)
+    config_service.refresh_config()
+    assert get_resilience_settings().api_keys == "old-key"
+
+    async def run():
+        stopping = asyncio.Event()
+        task = asyncio.create_task(worker.config_refresh_loop(stopping))
+        # 管理后台轮换 Key 后，worker 无需重启即可读到新值
+        supabase.rows = [{"key": "gemini_api_keys", "value": "rotated-key"}]
+        await asyncio.sleep(0.1)
+        stopping.set()
+        await task
+
+    asyncio.run(run())
+    assert get_resilience_settings().api_keys == "rotated-key"
@@ -0,0 +1,88 @@
+"""API Key 池：配置解析、按权重选择、429 / 鉴权错误剔除"""
+import json
+from collections import Counter
+
+import pytest
+
+from services import key_pool as kp
+from services.key_pool import GeminiKeyPool, parse_key_config
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(kp.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def keys(system_config):
+    """配置 Key 池，返回 set_keys(*entries)"""
+    def set_keys(*entries):
+        system_config(gemini_api_keys=json.dumps(list(entries)), gemini_api_key="")
+    return set_keys
+
+
+class FullQuota:
+    def headroom(self) -> float:
+        return 1.0
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    # 剩余配额相同，选择只由权重决定
+    monkeypatch.setattr(kp.rate_limiter, "get", lambda model, key: FullQuota())
+    return GeminiKeyPool()
+
+
+def test_parse_key_config():
+    states = parse_key_config('["a", {"key": "b", "weight": 3, "name": "项目B"}, {"key": "c", "weight": 0}]', "")
+    assert [(s.key, s.weight) for s in states] == [("a", 1.0), ("b", 3.0)]
+    assert states[1].name == "项目B"
+    assert [s.key for s in parse_key_config("not json", "fallback")] == ["fallback"]
+
+
+def test_selection_follows_weights(keys, pool, clock):
+    keys({"key": "light", "weight": 1}, {"key": "heavy", "weight": 3})
+    kp.random.seed(7)
+    counts = Counter(pool.select("m").key for _ in range(4000))
+    assert counts["heavy"] / counts["light"] == pytest.approx(3, rel=0.15)
+
+
+def test_excluded_and_ejected_keys_are_skipped(keys, pool, clock):
+    keys("a", "b", "c")
+    pool.report_throttled(pool.keys()[0])
+    assert {pool.select("m", exclude={"b"}).key for _ in range(50)} == {"c"}
+    assert pool.has_alternative({"b"})
+    assert not pool.has_alternative({"b", "c"})
+
+
+def test_throttle_ejection_grows_and_expires(keys, pool, clock):
+    keys("a", "b")
+    state = pool.keys()[0]
+    pool.report_throttled(state)
+    assert state.ejected_until == clock[0] + kp.THROTTLE_EJECT_SECONDS
+    pool.report_throttled(state)
+    assert state.ejected_until == clock[0] + kp.THROTTLE_EJECT_SECONDS * 2
+    clock[0] += kp.THROTTLE_EJECT_SECONDS * 2
+    assert state.available
+    pool.report_success(state)
+    assert state.consecutive_throttles == 0
+
+
+def test_all_ejected_picks_earliest_recovery(keys, pool, clock):
+    keys("a", "b")
+    a, b = pool.keys()
+    pool.report_auth_error(a)
+    pool.report_throttled(b)
+    assert pool.select("m").key == "b"
+
+
+def test_config_change_keeps_key_state(keys, pool, clock):
+    keys("a", "b")
+    pool.report_throttled(pool.keys()[0])
+    keys({"key": "a", "weight": 2}, "c")
+    states = {s.key: s for s in pool.keys()}
+    assert set(states) == {"a", "c"}
+    assert states["a"].weight == 2
+    assert not states["a"].available
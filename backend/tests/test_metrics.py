@@ -0,0 +1,27 @@
+"""/metrics 端点访问控制与路由标签"""
+import pytest
+
+
+@pytest.fixture
+def token(system_config):
+    system_config(metrics_token="scrape-token")
+    return "scrape-token"
+
+
+def test_disabled_without_token(client):
+    assert client.get("/metrics").status_code == 404
+
+
+def test_requires_token(client, token):
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+
+def test_route_label_includes_router_prefix(client, token):
+    client.get("/api/blobs/" + "0" * 64)
+    client.get("/health")
+    text = client.get("/metrics", headers={"Authorization": f"Bearer {token}"}).text
+    assert 'route="/api/blobs/{key}"' in text
+    assert 'route="/health"' in text
+    assert 'route="/blobs/{key}"' not in text
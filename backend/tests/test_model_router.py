@@ -0,0 +1,120 @@
+"""模型路由：候选排序与失败时沿候选链切换"""
+import asyncio
+import json
+
+import pytest
+from google.genai import errors
+
+from services import gemini_service
+from services import model_router as mr
+from services.circuit_breaker import CircuitBreaker, CircuitOpen
+from services.model_router import ModelRouter
+
+
+@pytest.fixture
+def route(system_config):
+    system_config(gemini_model_routes=json.dumps({"feature": ["primary", "secondary", "tertiary"]}))
+    return ["primary", "secondary", "tertiary"]
+
+
+@pytest.fixture
+def breakers(monkeypatch):
+    """每个模型独立的熔断器，测试间互不影响"""
+    registry = {}
+    monkeypatch.setattr(mr.circuit_breakers, "get", lambda name: registry.setdefault(name, CircuitBreaker(name)))
+    return registry
+
+
+def record(router: ModelRouter, model: str, latency: float, failures: int = 0, samples: int = 20):
+    for i in range(samples):
+        router.record(model, failed=i < failures, latency=latency)
+
+
+def test_keeps_configured_order_without_samples(route, breakers):
+    assert ModelRouter().rank("feature") == route
+
+
+def test_prefers_faster_model(route, breakers):
+    router = ModelRouter()
+    record(router, "primary", latency=8.0)
+    record(router, "secondary", latency=1.0)
+    assert router.rank("feature")[0] == "secondary"
+
+
+def test_unhealthy_model_ranks_after_healthy(route, breakers):
+    router = ModelRouter()
+    record(router, "primary", latency=0.5, failures=10)
+    record(router, "secondary", latency=2.0)
+    # 延迟更低但失败率超过阈值，排在所有健康模型之后
+    assert router.rank("feature")[-1] == "primary"
+
+
+def test_open_circuit_ranks_last_and_is_skipped(route, breakers, system_config):
+    system_config(circuit_breaker_min_requests=1, circuit_breaker_error_rate=0.5)
+    router = ModelRouter()
+    breakers["primary"] = CircuitBreaker("primary")
+    breakers["primary"].record(failed=True, latency=0.1)
+    assert router.rank("feature")[-1] == "primary"
+    assert router.ensure_available("feature") == "secondary"
+
+
+def test_ensure_available_raises_when_all_open(route, breakers, system_config):
+    system_config(circuit_breaker_min_requests=1, circuit_breaker_error_rate=0.5)
+    for name in route:
+        breakers[name] = CircuitBreaker(name)
+        breakers[name].record(failed=True, latency=0.1)
+    with pytest.raises(CircuitOpen):
+        ModelRouter().ensure_available("feature")
+
+
+@pytest.fixture
+def calls(monkeypatch, route):
+    """按模型名返回预设结果的 call_gemini_with_retry 替身，记录调用顺序"""
+    outcomes = {}
+    order = []
+
+    class Model:
+        def __init__(self, name):
+            self.name = name
+
+    async def call(model, contents, generation_config=None, policy=None):
+        order.append(model.name)
+        outcome = outcomes.get(model.name, "ok")
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return f"{model.name}: {outcome}"
+
+    monkeypatch.setattr(gemini_service.model_router, "rank", lambda feature: list(route))
+    monkeypatch.setattr(gemini_service, "get_gemini_model", lambda name, system_instruction=None: Model(name))
+    monkeypatch.setattr(gemini_service, "call_gemini_with_retry", call)
+    return outcomes, order
+
+
+def unavailable(code: int) -> errors.APIError:
+    return errors.APIError(code, {"error": {"code": code, "message": "unavailable"}})
+
+
+def test_fails_over_to_next_candidate(calls):
+    outcomes, order = calls
+    outcomes["primary"] = unavailable(503)
+    outcomes["secondary"] = CircuitOpen("secondary", 30)
+    result = asyncio.run(gemini_service.call_gemini_routed("feature", ["hi"]))
+    assert result == "tertiary: ok"
+    assert order == ["primary", "secondary", "tertiary"]
+
+
+def test_client_error_does_not_fail_over(calls):
+    outcomes, order = calls
+    outcomes["primary"] = unavailable(400)
+    with pytest.raises(errors.APIError):
+        asyncio.run(gemini_service.call_gemini_routed("feature", ["hi"]))
+    assert order == ["primary"]
+
+
+def test_last_candidate_error_is_raised(calls):
+    outcomes, order = calls
+    for name in ("primary", "secondary", "tertiary"):
+        outcomes[name] = unavailable(503)
+    with pytest.raises(errors.APIError):
+        asyncio.run(gemini_service.call_gemini_routed("feature", ["hi"]))
+    assert order == ["primary", "secondary", "tertiary"]
@@ -0,0 +1,98 @@
+"""按 (模型, API Key) 的 RPM/TPM 令牌桶节流"""
+import asyncio
+
+import pytest
+
+from services import rate_limiter as rl
+from services.image_service import PreparedImage
+from services.rate_limiter import RateLimiterRegistry, RateLimitExceeded, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rl.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """记录 asyncio.sleep 的等待时间，不实际等待"""
+    calls = []
+
+    async def sleep(seconds):
+        calls.append(seconds)
+
+    monkeypatch.setattr(rl.asyncio, "sleep", sleep)
+    return calls
+
+
+@pytest.fixture
+def registry(system_config):
+    system_config(gemini_rate_limits='{"m": {"rpm": 60, "tpm": 6000}}')
+    return RateLimiterRegistry()
+
+
+def test_bucket_paces_after_burst(clock):
+    bucket = TokenBucket(60)
+    assert [bucket.reserve(1) for _ in range(60)] == [0.0] * 60
+    # 超出突发额度后按 1 个/秒 排队，后到的请求排在前面的透支之后
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    assert bucket.reserve(1) == pytest.approx(2.0)
+    clock[0] += 2
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+
+def test_bucket_caps_oversized_requests(clock):
+    bucket = TokenBucket(60)
+    assert bucket.reserve(1000) == 0.0
+    assert bucket.level() == 0.0
+
+
+def test_pace_waits_until_quota_allows(registry, clock, sleeps):
+    async def run():
+        for _ in range(61):
+            await registry.pace("m", "key", 10)
+
+    asyncio.run(run())
+    assert sleeps == [pytest.approx(1.0)]
+
+
+def test_pace_rejects_past_deadline_and_refunds(registry, clock, sleeps):
+    async def run():
+        for _ in range(60):
+            await registry.pace("m", "key", 10)
+        with pytest.raises(RateLimitExceeded) as info:
+            await registry.pace("m", "key", 10, deadline=clock[0] + 0.5)
+        return info.value.retry_after
+
+    assert asyncio.run(run()) == 1
+    assert sleeps == []
+    # 被拒绝的请求归还了预留的配额，下一次仍只需等待 1 秒
+    assert registry.get("m", "key").reserve(10) == pytest.approx(1.0)
+
+
+def test_keys_have_separate_buckets(registry, clock, sleeps):
+    async def run():
+        for _ in range(60):
+            await registry.pace("m", "key-a", 10)
+        await registry.pace("m", "key-b", 10)
+
+    asyncio.run(run())
+    assert sleeps == []
+
+
+def test_throttle_shrinks_budget_and_recovers(registry, clock):
+    limiter = registry.get("m", "key")
+    limiter.on_throttled()
+    assert limiter.rpm_bucket.per_minute == pytest.approx(42)
+    assert limiter.headroom() == 0.0
+    for _ in range(20):
+        limiter.on_success()
+    assert limiter.factor == 1.0
+    assert limiter.rpm_bucket.per_minute == 60
+
+
+def test_estimate_image_tokens():
+    assert rl.estimate_image_tokens(PreparedImage(data=b"", width=300, height=300)) == 258
+    assert rl.estimate_image_tokens(PreparedImage(data=b"", width=1536, height=1024)) == 258 * 4
@@ -0,0 +1,63 @@
+"""综合健康报告：失败的分析项退还魔法值"""
+import pytest
+
+from api import ai
+from services.image_service import PreparedImage
+
+
+@pytest.fixture
+def refunds(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ai, "refund_credits", lambda user_id, amount: calls.append((user_id, amount)))
+    return calls
+
+
+@pytest.fixture
+def failing(monkeypatch):
+    """分析类型在 failing 中时分析失败"""
+    failing = set()
+
+    async def prepare_image(image, purpose):
+        return PreparedImage(data=image.encode())
+
+    async def admit_request(current_user, *features):
+        pass
+
+    async def consume_credit(user_id, current_credits, amount=1):
+        return current_credits - amount
+
+    async def analyze_tcm(image, analysis_type):
+        if analysis_type in failing:
+            raise RuntimeError("no text")
+        return f"{analysis_type} ok"
+
+    monkeypatch.setattr(ai, "prepare_image", prepare_image)
+    monkeypatch.setattr(ai, "admit_request", admit_request)
+    monkeypatch.setattr(ai, "consume_credit", consume_credit)
+    monkeypatch.setattr(ai.gemini_service, "analyze_tcm", analyze_tcm)
+    return failing
+
+
+REPORT = {"tongue_image": "tongue", "face_image": "face"}
+
+
+def test_all_sections_succeed(client, failing, refunds):
+    response = client.post("/api/ai/report", json=REPORT)
+    assert response.status_code == 200
+    assert response.json()["failed_types"] == []
+    assert refunds == []
+
+
+def test_failed_sections_are_refunded(client, failing, refunds):
+    failing.update({"face-analysis", "face-reading"})
+    response = client.post("/api/ai/report", json=REPORT)
+    assert response.status_code == 200
+    assert response.json()["failed_types"] == ["face-analysis", "face-reading"]
+    assert refunds == [("user-1", 2)]
+
+
+def test_all_sections_failed_refunds_everything(client, failing, refunds):
+    failing.update({"tongue", "face-analysis", "face-reading"})
+    response = client.post("/api/ai/report", json=REPORT)
+    assert response.status_code == 500
+    assert refunds == [("user-1", 3)]
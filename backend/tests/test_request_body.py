@@ -0,0 +1,84 @@
+"""AI 请求体：JSON 与 multipart/form-data 两种格式及其 OpenAPI 声明"""
+import base64
+
+import pytest
+
+from api import ai
+from tests.conftest import PNG_BYTES
+
+
+@pytest.fixture
+def analyzed(monkeypatch):
+    """记录传给 Gemini 的预处理后图片"""
+    images = []
+
+    async def admit_request(current_user, *features):
+        pass
+
+    async def consume_credit(user_id, current_credits, amount=1):
+        return current_credits - amount
+
+    async def analyze_tcm(image, analysis_type):
+        images.append(image)
+        return f"{analysis_type} ok"
+
+    monkeypatch.setattr(ai, "admit_request", admit_request)
+    monkeypatch.setattr(ai, "consume_credit", consume_credit)
+    monkeypatch.setattr(ai.gemini_service, "analyze_tcm", analyze_tcm)
+    return images
+
+
+def test_multipart_upload(client, analyzed):
+    response = client.post(
+        "/api/ai/analyze",
+        data={"analysis_type": "tongue"},
+        files={"image": ("tongue.png", PNG_BYTES, "image/png")},
+    )
+    assert response.status_code == 200
+    assert response.json()["text"] == "tongue ok"
+    # 文件按原始字节读取，经预处理后转为 JPEG
+    assert analyzed[0].mime_type == "image/jpeg"
+    assert analyzed[0].data.startswith(b"\xff\xd8")
+
+
+def test_multipart_and_json_match(client, analyzed):
+    client.post("/api/ai/analyze", data={"analysis_type": "tongue"}, files={"image": ("t.png", PNG_BYTES)})
+    client.post("/api/ai/analyze", json={"image": base64.b64encode(PNG_BYTES).decode(), "analysis_type": "tongue"})
+    assert analyzed[0].data == analyzed[1].data
+
+
+def test_multipart_validation_error(client, analyzed):
+    response = client.post(
+        "/api/ai/analyze",
+        data={"analysis_type": "unknown"},
+        files={"image": ("t.png", PNG_BYTES, "image/png")},
+    )
+    assert response.status_code == 422
+    assert analyzed == []
+
+
+def test_openapi_declares_both_content_types(client):
+    paths = client.get("/openapi.json").json()["paths"]
+    for path in ("/api/ai/try-on", "/api/ai/try-on/batch", "/api/ai/analyze", "/api/ai/report", "/api/ai/hairstyle"):
+        content = paths[path]["post"]["requestBody"]["content"]
+        assert set(content) == {"application/json", "multipart/form-data"}
+
+    content = paths["/api/ai/analyze"]["post"]["requestBody"]["content"]
+    json_schema = content["application/json"]["schema"]
+    form_schema = content["multipart/form-data"]["schema"]
+    assert json_schema["properties"]["image"]["contentEncoding"] == "base64"
+    assert form_schema["properties"]["image"]["format"] == "binary"
+    assert json_schema["properties"]["analysis_type"]["enum"] == ["tongue", "face-analysis", "face-reading"]
+    assert json_schema["required"] == ["image", "analysis_type"]
+
+
+def test_openapi_batch_form_fields(client):
+    content = client.get("/openapi.json").json()["paths"]["/api/ai/try-on/batch"]["post"]["requestBody"]["content"]
+    json_item = content["application/json"]["schema"]["properties"]["items"]["items"]
+    assert json_item["properties"]["item_image"]["contentEncoding"] == "base64"
+
+    form = content["multipart/form-data"]["schema"]
+    assert "items" not in form["properties"]
+    assert form["properties"]["item_image"]["items"]["format"] == "binary"
+    assert form["properties"]["try_on_type"]["items"]["enum"] == ["clothing", "accessory"]
+    assert set(form["required"]) == {"face_image", "item_image", "try_on_type"}
@@ -0,0 +1,108 @@
+"""按字节数限制的生成图片缓存：内存层溢出到磁盘、磁盘层淘汰与过期"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services import result_cache
+from services.result_cache import ByteBoundedCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ByteBoundedCache("test", memory_bytes=10, disk_bytes=20, ttl_seconds=60, disk_dir=str(tmp_path))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_memory_hit(cache):
+    run(cache.set("a", b"12345"))
+    assert run(cache.get("a")) == b"12345"
+    assert cache.hits == 1
+
+
+def test_spills_to_disk_and_promotes_back(cache, tmp_path):
+    run(cache.set("a", b"12345"))
+    run(cache.set("b", b"67890"))
+    run(cache.set("c", b"abcde"))
+    # a 溢出到磁盘
+    assert cache.spills == 1
+    assert os.path.exists(tmp_path / "a.bin")
+
+    assert run(cache.get("a")) == b"12345"
+    assert cache.disk_hits == 1
+    # 提升回内存后磁盘文件删除，同时 b 溢出
+    assert not os.path.exists(tmp_path / "a.bin")
+    assert os.path.exists(tmp_path / "b.bin")
+
+
+def test_disk_tier_evicts_oldest(cache, tmp_path):
+    for index in range(8):
+        run(cache.set(f"k{index}", b"12345"))
+    stats = cache.stats()
+    assert stats["disk_bytes"] <= 20
+    assert stats["memory_bytes"] <= 10
+    assert not os.path.exists(tmp_path / "k0.bin")
+    assert run(cache.get("k0")) is None
+
+
+def test_expired_entries_miss(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "time", lambda: now[0])
+    run(cache.set("a", b"12345"))
+    now[0] += 61
+    assert run(cache.get("a")) is None
+    assert cache.misses == 1
+
+
+def test_disk_index_survives_restart(cache, tmp_path):
+    run(cache.set("a", b"12345"))
+    run(cache.set("b", b"67890"))
+    run(cache.set("c", b"abcde"))
+    restarted = ByteBoundedCache("test", memory_bytes=10, disk_bytes=20, ttl_seconds=60, disk_dir=str(tmp_path))
+    assert run(restarted.get("a")) == b"12345"
+
+
+def test_invalid_size_config_uses_default(system_config, monkeypatch, tmp_path):
+    monkeypatch.setattr(result_cache, "_image_cache", None)
+    system_config(image_cache_memory_bytes="lots", image_cache_dir=str(tmp_path))
+    assert result_cache.get_image_cache().memory_bytes == 64 * 1024 * 1024
+    monkeypatch.setattr(result_cache, "_image_cache", None)
+
+
+@pytest.fixture
+def text_cache(tmp_path):
+    return result_cache.ResultCache("text", max_entries=2, ttl_seconds=60, disk_dir=str(tmp_path))
+
+
+def test_text_cache_survives_restart(text_cache, tmp_path):
+    run(text_cache.set("k" * 64, "分析结果"))
+    restarted = result_cache.ResultCache("text", max_entries=2, ttl_seconds=60, disk_dir=str(tmp_path))
+    assert run(restarted.get("k" * 64)) == "分析结果"
+    assert restarted.disk_hits == 1
+
+
+def test_text_cache_disk_io_runs_off_loop(text_cache, monkeypatch):
+    threads = []
+    read, write = text_cache._read_disk, text_cache._write_disk
+    monkeypatch.setattr(text_cache, "_read_disk", lambda *a: threads.append(threading.current_thread()) or read(*a))
+    monkeypatch.setattr(text_cache, "_write_disk", lambda *a: threads.append(threading.current_thread()) or write(*a))
+    run(text_cache.set("ab" * 32, "x"))
+    text_cache.clear()
+    assert run(text_cache.get("ab" * 32)) == "x"
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+
+
+def test_concurrent_writers_use_unique_temp_files(text_cache, tmp_path, caplog):
+    key = "cd" * 32
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda i: text_cache._write_disk(key, 2e9, f"value-{i}"), range(32)))
+    files = [name for _, _, names in os.walk(tmp_path) for name in names]
+    assert files == [f"{key}.json"]
+    assert "Failed to write" not in caplog.text
+    assert run(text_cache.get(key)).startswith("value-")
@@ -0,0 +1,72 @@
+"""重试策略：全抖动退避、服务端重试间隔与进程级重试预算"""
+import pytest
+
+from services import retry_policy
+from services.retry_policy import RetryBudget, RetryPolicy
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(retry_policy.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture(autouse=True)
+def budget_config(system_config):
+    system_config(gemini_retry_budget_ratio=0.5, gemini_retry_budget_min_per_second=0.1)
+
+
+def test_backoff_is_full_jitter_within_cap(monkeypatch):
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+    bounds = []
+    monkeypatch.setattr(retry_policy.random, "uniform", lambda low, high: bounds.append((low, high)) or high)
+    assert [policy.backoff(n) for n in range(4)] == [1.0, 2.0, 4.0, 5.0]
+    assert all(low == 0 for low, _ in bounds)
+
+
+def test_backoff_samples_stay_in_range():
+    policy = RetryPolicy(base_delay=0.5, max_delay=2.0)
+    for retry_index in range(6):
+        delays = [policy.backoff(retry_index) for _ in range(200)]
+        assert all(0 <= d <= min(2.0, 0.5 * 2 ** retry_index) for d in delays)
+        # 全抖动：样本分散而不是集中在上限
+        assert len(set(delays)) > 100
+
+
+def test_retry_hint_is_lower_bound(monkeypatch):
+    policy = RetryPolicy()
+    monkeypatch.setattr(policy.__class__, "backoff", lambda self, n: 0.2)
+    monkeypatch.setattr(retry_policy, "retry_hint", lambda exc: 3.0)
+    assert policy.next_delay(0, Exception()) == 3.0
+
+
+def test_budget_starts_full(clock):
+    budget = RetryBudget()
+    # 上限 = 0.1 * 10 + 0.5 * 100 = 51
+    assert budget.try_acquire()
+    assert budget.tokens == pytest.approx(50)
+
+
+def test_budget_limits_retries_to_ratio(clock):
+    budget = RetryBudget()
+    budget.try_acquire()
+    budget.tokens = 0.0
+    for _ in range(4):
+        budget.record_request()
+    assert budget.try_acquire()
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+    assert budget.denied == 1
+
+
+def test_budget_refills_per_second_up_to_cap(clock):
+    budget = RetryBudget()
+    budget.try_acquire()
+    budget.tokens = 0.0
+    clock[0] += 10
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+    clock[0] += 10_000
+    budget.try_acquire()
+    assert budget.tokens == pytest.approx(50)
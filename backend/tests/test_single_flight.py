@@ -0,0 +1,116 @@
+"""单飞请求合并：并发去重、异常共享、等待者取消"""
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+
+def make(value: str):
+    """返回给定结果的无参协程函数"""
+    async def fn():
+        await asyncio.sleep(0)
+        return value
+    return fn
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test")
+    started = []
+
+    async def fn():
+        started.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("k", fn) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["result"] * 5
+    assert started == [1]
+    assert flight.stats() == {"name": "test", "calls": 1, "coalesced": 4, "inflight": 0}
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight("test")
+
+    async def run():
+        return await asyncio.gather(flight.do("a", make("A")), flight.do("b", make("B")))
+
+    assert asyncio.run(run()) == ["A", "B"]
+    assert flight.calls == 2
+
+
+def test_finished_call_is_not_reused():
+    flight = SingleFlight("test")
+
+    async def run():
+        first = await flight.do("k", make("first"))
+        second = await flight.do("k", make("second"))
+        return first, second
+
+    assert asyncio.run(run()) == ("first", "second")
+
+
+def test_exception_is_shared_and_key_released():
+    flight = SingleFlight("test")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream")
+
+    async def run():
+        results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+        # 失败后不保留结果，下一次请求重新执行
+        retried = await flight.do("k", make("ok"))
+        return results, retried
+
+    results, retried = asyncio.run(run())
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+    assert retried == "ok"
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    flight = SingleFlight("test")
+    release = None
+
+    async def fn():
+        await release.wait()
+        return "result"
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        leader = asyncio.create_task(flight.do("k", fn))
+        follower = asyncio.create_task(flight.do("k", fn))
+        await asyncio.sleep(0)
+        # 发起调用的请求断开，其他等待者仍能拿到结果
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == "result"
+    assert flight.calls == 1
+
+
+def test_all_waiters_cancelled_leaves_call_running():
+    flight = SingleFlight("test")
+    finished = []
+
+    async def fn():
+        await asyncio.sleep(0.01)
+        finished.append(1)
+        raise RuntimeError("nobody is listening")
+
+    async def run():
+        waiter = asyncio.create_task(flight.do("k", fn))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0.05)
+        return flight.stats()["inflight"]
+
+    assert asyncio.run(run()) == 0
+    assert finished == [1]
@@ -0,0 +1,165 @@
+"""
+魅丽健康助手 - 异步任务 worker 入口
+
+从任务队列中领取 mode=async 提交的图像生成任务并执行，与 API 服务（main.py）独立部署和扩容：
+
+    python worker.py
+
+并发数由 job_worker_concurrency 配置（或环境变量 JOB_WORKER_CONCURRENCY）决定
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+from services.config_service import get_config, refresh_config
+from services.admission import request_priority
+from services.job_queue import get_job_queue
+from services.ai_jobs import JOB_HANDLERS
+from services.image_output import shutdown_output_executor
+from services.blob_store import get_blob_store
+from services.credit_service import refund_credits
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 队列为空时的轮询间隔（秒）
+POLL_INTERVAL = 1.0
+# 清理过期任务的间隔（秒）
+PURGE_INTERVAL = 3600
+# 重新读取 system_config 的间隔（秒）
+CONFIG_REFRESH_INTERVAL = 60
+
+
+async def refund_job(job: dict):
+    """退还失败任务在提交时扣减的魔法值"""
+    await asyncio.to_thread(refund_credits, job["user_id"], job["payload"].get("credits", 1))
+
+
+async def fail_job(job: dict, error: str):
+    """标记任务失败并退还魔法值（租约已被其他 worker 接手时不重复处理）"""
+    if await asyncio.to_thread(get_job_queue().fail, job["id"], error, job["worker"]):
+        await refund_job(job)
+
+
+async def expire_jobs():
+    """租约过期且不再重试的任务标记为失败并退还魔法值"""
+    for job in await asyncio.to_thread(get_job_queue().expire):
+        logger.warning(f"Job {job['id']} ({job['kind']}) timed out")
+        await refund_job(job)
+
+
+async def keep_lease(job: dict):
+    """执行期间按租约时长的三分之一定期续约，生成耗时超过租约时任务不会被重复领取"""
+    queue = get_job_queue()
+    try:
+        lease = float(get_config("job_lease_seconds", 300))
+    except (TypeError, ValueError):
+        lease = 300.0
+    while True:
+        await asyncio.sleep(max(1.0, lease / 3))
+        if not await asyncio.to_thread(queue.renew, job["id"], job["worker"]):
+            logger.warning(f"Job {job['id']} lease lost")
+            return
+
+
+async def run_job(job: dict):
+    """执行一个任务并写回结果"""
+    queue = get_job_queue()
+    handler = JOB_HANDLERS.get(job["kind"])
+    if handler is None:
+        await fail_job(job, f"未知的任务类型: {job['kind']}")
+        return
+
+    # 沿用入队时的用户优先级参与模型准入排队
+    request_priority.set(job["priority"])
+    heartbeat = asyncio.create_task(keep_lease(job))
+    try:
+        result = await handler(job["payload"])
+    except Exception as e:
+        logger.warning(f"Job {job['id']} ({job['kind']}) failed: {e}")
+        await fail_job(job, f"生成失败: {str(e)}")
+        return
+    finally:
+        heartbeat.cancel()
+    if await asyncio.to_thread(queue.complete, job["id"], result, job["worker"]):
+        logger.info(f"Job {job['id']} ({job['kind']}) succeeded")
+
+
+async def consume(name: str, stopping: asyncio.Event):
+    """单个消费者：循环领取并执行任务，直到收到停止信号"""
+    queue = get_job_queue()
+    while not stopping.is_set():
+        await expire_jobs()
+        job = await asyncio.to_thread(queue.claim, name)
+        if job is None:
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        # 每个任务在独立的上下文中执行，优先级等上下文变量互不影响
+        await asyncio.create_task(run_job(job))
+
+
+async def purge_loop(stopping: asyncio.Event):
+    queue = get_job_queue()
+    while not stopping.is_set():
+        removed = await asyncio.to_thread(queue.purge)
+        if removed:
+            logger.info(f"Purged {removed} finished jobs")
+        try:
+            retention = float(get_config("blob_retention_hours", 72)) * 3600
+        except (TypeError, ValueError):
+            retention = 72 * 3600
+        removed = await asyncio.to_thread(get_blob_store().purge, retention)
+        if removed:
+            logger.info(f"Purged {removed} generated images")
+        try:
+            await asyncio.wait_for(stopping.wait(), timeout=PURGE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def config_refresh_loop(stopping: asyncio.Event):
+    """定期重新读取 system_config，管理后台轮换的 API Key、修改的模型配置无需重启 worker 即可生效"""
+    while not stopping.is_set():
+        try:
+            await asyncio.wait_for(stopping.wait(), timeout=CONFIG_REFRESH_INTERVAL)
+        except asyncio.TimeoutError:
+            await asyncio.to_thread(refresh_config)
+
+
+async def main():
+    try:
+        concurrency = max(1, int(get_config("job_worker_concurrency", 4)))
+    except (TypeError, ValueError):
+        concurrency = 4
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        # 收到信号后不再领取新任务，等待执行中的任务完成后退出
+        loop.add_signal_handler(sig, stopping.set)
+
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    logger.info(f"Worker {prefix} started with concurrency {concurrency}")
+    try:
+        await asyncio.gather(
+            purge_loop(stopping),
+            config_refresh_loop(stopping),
+            *(consume(f"{prefix}-{i}", stopping) for i in range(concurrency))
+        )
+    finally:
+        shutdown_output_executor()
+    logger.info(f"Worker {prefix} stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -8,6 +8,9 @@
 // 在 Vercel 部署时使用相对路径，本地开发时可指定后端地址
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || (import.meta.env.DEV ? 'http://127.0.0.1:8000' : '');
 
+// 生成图片以 WebP、手机屏幕尺寸返回，体积约为原始 PNG 的十分之一
+const IMAGE_OUTPUT_QUERY = 'format=webp&size=standard';
+
 /**
  * 获取本地存储的访问令牌
  */
@@ -52,8 +55,9 @@ async function request<T>(
 ): Promise<T> {
     const token = getStoredToken();
 
+    // FormData 请求由浏览器自动设置 multipart 边界
     const headers: HeadersInit = {
-        'Content-Type': 'application/json',
+        ...(options.body instanceof FormData ? {} : { 'Content-Type': 'application/json' }),
         ...options.headers,
     };
 
@@ -67,30 +71,125 @@ async function request<T>(
     });
 
     if (!response.ok) {
-        let errorData;
-        try {
-            errorData = await response.json();
-        } catch (e) {
-            errorData = { detail: `请求失败 (HTTP ${response.status})`, status: response.status };
-        }
+        await throwResponseError(endpoint, response);
+    }
+
+    return response.json();
+}
+
+/**
+ * 解析错误响应并抛出异常
+ */
+async function throwResponseError(endpoint: string, response: Response): Promise<never> {
+    let errorData;
+    try {
+        errorData = await response.json();
+    } catch (e) {
+        errorData = { detail: `请求失败 (HTTP ${response.status})`, status: response.status };
+    }
+
+    console.error(`API Error [${endpoint}]:`, {
+        status: response.status,
+        statusText: response.statusText,
+        data: errorData
+    });
+
+    let message = '';
+    if (errorData.detail && Array.isArray(errorData.detail)) {
+        message = errorData.detail.map((d: any) => d.msg || JSON.stringify(d)).join('; ');
+    } else {
+        message = errorData.detail || errorData.message || `HTTP ${response.status}`;
+    }
+
+    throw new Error(message);
+}
+
+/**
+ * 将 data URL 转为二进制文件，AI 接口以 multipart 上传图片，省去 base64 额外的三分之一体积
+ */
+function dataUrlToBlob(dataUrl: string): Blob {
+    const comma = dataUrl.indexOf(',');
+    const mime = dataUrl.slice(0, comma).match(/^data:([^;,]+)/)?.[1] || 'application/octet-stream';
+    const binary = atob(comma >= 0 ? dataUrl.slice(comma + 1) : dataUrl);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return new Blob([bytes], { type: mime });
+}
+
+type FormValue = string | number | Blob | undefined | null;
 
-        console.error(`API Error [${endpoint}]:`, {
-            status: response.status,
-            statusText: response.statusText,
-            data: errorData
-        });
-
-        let message = '';
-        if (errorData.detail && Array.isArray(errorData.detail)) {
-            message = errorData.detail.map((d: any) => d.msg || JSON.stringify(d)).join('; ');
-        } else {
-            message = errorData.detail || errorData.message || `HTTP ${response.status}`;
+/**
+ * 构建 multipart 请求体：Blob 作为文件上传，数组字段按顺序重复追加，空值跳过
+ */
+function formBody(fields: Record<string, FormValue | FormValue[]>): FormData {
+    const form = new FormData();
+    for (const [key, value] of Object.entries(fields)) {
+        for (const item of Array.isArray(value) ? value : [value]) {
+            if (item === undefined || item === null) continue;
+            if (item instanceof Blob) form.append(key, item, key);
+            else form.append(key, String(item));
         }
+    }
+    return form;
+}
+
+/**
+ * SSE 流式请求：逐个回调服务端事件，返回时流已结束
+ */
+async function streamRequest(
+    endpoint: string,
+    options: RequestInit,
+    onEvent: (event: string, data: any) => void
+): Promise<void> {
+    const token = getStoredToken();
+
+    const headers: HeadersInit = {
+        ...(options.body instanceof FormData ? {} : { 'Content-Type': 'application/json' }),
+        'Accept': 'text/event-stream',
+        ...options.headers,
+    };
 
-        throw new Error(message);
+    if (token) {
+        (headers as Record<string, string>)['Authorization'] = `Bearer ${token}`;
     }
 
-    return response.json();
+    const response = await fetch(`${API_BASE_URL}${endpoint}`, {
+        ...options,
+        headers,
+    });
+
+    if (!response.ok) {
+        await throwResponseError(endpoint, response);
+    }
+
+    // 服务端不支持流式时退回普通 JSON 响应
+    if (!response.headers.get('Content-Type')?.includes('text/event-stream') || !response.body) {
+        onEvent('result', await response.json());
+        return;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = 'message';
+            let data = '';
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
 }
 
 // ==================== 认证相关 API ====================
@@ -219,6 +318,7 @@ export interface HairstyleResult {
     analysis: string | null;
     recommended_image: string | null;
     catalog_image: string | null;
+    failed_parts?: string[];
 }
 
 /**
@@ -231,11 +331,11 @@ export async function tryOn(
     height?: number,
     bodyType?: string
 ): Promise<TryOnResult> {
-    return request<TryOnResult>('/api/ai/try-on', {
+    return request<TryOnResult>(`/api/ai/try-on?${IMAGE_OUTPUT_QUERY}`, {
         method: 'POST',
-        body: JSON.stringify({
-            face_image: faceImage,
-            item_image: itemImage,
+        body: formBody({
+            face_image: dataUrlToBlob(faceImage),
+            item_image: dataUrlToBlob(itemImage),
             try_on_type: type,
             height,
             body_type: bodyType,
@@ -243,34 +343,169 @@ export async function tryOn(
     });
 }
 
+export interface BatchTryOnResult {
+    success: boolean;
+    message: string;
+    images: Array<string | null>;
+    failed_items: number[];
+}
+
+/**
+ * 批量试穿：同一张人物照片搭配多件服装/配饰，按件数一次性扣减魔法值
+ *
+ * 传入 onItem 时以流式方式请求，每件效果图生成后立即回调其下标和图片
+ */
+export async function tryOnBatch(
+    faceImage: string,
+    items: Array<{ image: string; type: 'clothing' | 'accessory' }>,
+    height?: number,
+    bodyType?: string,
+    onItem?: (index: number, image: string) => void
+): Promise<BatchTryOnResult> {
+    const options: RequestInit = {
+        method: 'POST',
+        body: formBody({
+            face_image: dataUrlToBlob(faceImage),
+            item_image: items.map(item => dataUrlToBlob(item.image)),
+            try_on_type: items.map(item => item.type),
+            height,
+            body_type: bodyType,
+        }),
+    };
+    if (!onItem) {
+        return request<BatchTryOnResult>(`/api/ai/try-on/batch?${IMAGE_OUTPUT_QUERY}`, options);
+    }
+
+    const images: Array<string | null> = items.map(() => null);
+    let result = null as BatchTryOnResult | null;
+    await streamRequest(`/api/ai/try-on/batch?${IMAGE_OUTPUT_QUERY}`, options, (event, data) => {
+        if (event === 'item') {
+            images[data.index] = data.image;
+            onItem(data.index, data.image);
+        } else if (event === 'done') {
+            result = { success: true, message: data.message, images, failed_items: data.failed_items };
+        } else if (event === 'error') {
+            result = { success: false, message: data.message, images, failed_items: [] };
+        } else if (event === 'result') {
+            result = data;
+        }
+    });
+    return result ?? {
+        success: false,
+        message: '生成中断，请稍后重试',
+        images,
+        failed_items: images.flatMap((image, i) => (image ? [] : [i])),
+    };
+}
+
 /**
  * 中医 / 面相分析
+ *
+ * 传入 onText 时以流式方式请求，每收到一段文本即回调当前已生成的完整文本
  */
 export async function analyze(
     image: string,
-    type: 'tongue' | 'face-analysis' | 'face-reading'
+    type: 'tongue' | 'face-analysis' | 'face-reading',
+    onText?: (text: string) => void
 ): Promise<AnalyzeResult> {
-    return request<AnalyzeResult>('/api/ai/analyze', {
+    const options: RequestInit = {
         method: 'POST',
-        body: JSON.stringify({
-            image,
+        body: formBody({
+            image: dataUrlToBlob(image),
             analysis_type: type,
         }),
+    };
+    if (!onText) {
+        return request<AnalyzeResult>('/api/ai/analyze', options);
+    }
+
+    let text = '';
+    let result = null as AnalyzeResult | null;
+    await streamRequest('/api/ai/analyze', options, (event, data) => {
+        if (event === 'chunk') {
+            text += data.text;
+            onText(text);
+        } else if (event === 'done') {
+            result = { success: true, message: data.message, text };
+        } else if (event === 'error') {
+            result = { success: false, message: data.message, text: text || null };
+        } else if (event === 'result') {
+            result = data;
+        }
+    });
+    return result ?? { success: false, message: '分析中断，请稍后重试', text: text || null };
+}
+
+export interface ReportResult {
+    success: boolean;
+    message: string;
+    sections: Partial<Record<'tongue' | 'face-analysis' | 'face-reading', string>>;
+    failed_types: string[];
+}
+
+/**
+ * 综合健康报告：一次上传，多项分析并发执行，按项数一次性扣减魔法值
+ */
+export async function generateReport(
+    images: { tongueImage?: string; faceImage?: string },
+    types: Array<'tongue' | 'face-analysis' | 'face-reading'>
+): Promise<ReportResult> {
+    return request<ReportResult>('/api/ai/report', {
+        method: 'POST',
+        body: formBody({
+            tongue_image: images.tongueImage ? dataUrlToBlob(images.tongueImage) : undefined,
+            face_image: images.faceImage ? dataUrlToBlob(images.faceImage) : undefined,
+            analysis_types: types,
+        }),
     });
 }
 
 /**
  * 发型推荐
+ *
+ * 传入 onPart 时以渐进方式请求，分析文本和每张图片生成后立即回调当前已有的结果
  */
 export async function generateHairstyleRecommendation(
     image: string,
     gender: '男' | '女',
-    age: number
+    age: number,
+    onPart?: (partial: HairstyleResult) => void
 ): Promise<HairstyleResult> {
-    return request<HairstyleResult>('/api/ai/hairstyle', {
+    const options: RequestInit = {
         method: 'POST',
-        body: JSON.stringify({ image, gender, age }),
+        body: formBody({ image: dataUrlToBlob(image), gender, age }),
+    };
+    if (!onPart) {
+        return request<HairstyleResult>(`/api/ai/hairstyle?${IMAGE_OUTPUT_QUERY}`, options);
+    }
+
+    const partial: HairstyleResult = {
+        success: true,
+        message: '',
+        analysis: null,
+        recommended_image: null,
+        catalog_image: null,
+        failed_parts: [],
+    };
+    let result = null as HairstyleResult | null;
+    await streamRequest(`/api/ai/hairstyle?${IMAGE_OUTPUT_QUERY}`, options, (event, data) => {
+        if (event === 'analysis') {
+            partial.analysis = data.text;
+            onPart({ ...partial });
+        } else if (event === 'recommended_image' || event === 'catalog_image') {
+            partial[event] = data.image;
+            onPart({ ...partial });
+        } else if (event === 'part_failed') {
+            partial.failed_parts = [...(partial.failed_parts || []), data.part];
+        } else if (event === 'done') {
+            result = { ...partial, message: data.message, failed_parts: data.failed_parts };
+        } else if (event === 'error') {
+            result = { ...partial, success: false, message: data.message };
+        } else if (event === 'result') {
+            result = data;
+        }
     });
+    return result ?? { ...partial, success: false, message: '推荐中断，请稍后重试' };
 }
 
 /**